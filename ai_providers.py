@@ -2,46 +2,60 @@
 Providers de IA para Leitor Doc PyZerox
 Este módulo gerencia diferentes provedores de IA que podem ser usados para o processamento OCR e conversão de documentos.
 """
+import asyncio
 import os
+import threading
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any, List
-
-# Importações específicas para cada provedor com tratamento de erros
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-
-try:
-    from google.generativeai import configure as gemini_configure
-    from google.generativeai import GenerativeModel
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-
-try:
-    from llama_cpp import Llama
-    LLAMA_AVAILABLE = True
-except ImportError:
-    LLAMA_AVAILABLE = False
-
-try:
-    from anthropic import Anthropic
-    ANTHROPIC_AVAILABLE = True
-except ImportError:
-    ANTHROPIC_AVAILABLE = False
-
-try:
-    # Grok API não está disponível publicamente ainda
-    # Por enquanto, marcamos como indisponível
-    # import grok_ai
-    GROK_AVAILABLE = False
-except ImportError:
-    GROK_AVAILABLE = False
+from typing import Optional, Dict, Any, Callable, Iterable, List
+
+from chunking import estimate_tokens, iter_chunks, process_chunks
+from images import PreparedImage, load_image
+from metrics import stage
+from scheduler import ProviderScheduler
+from startup import lazy_import, module_available
+
+# SDKs de cada provedor: só verifica se estão instalados; a importação acontece quando o provedor
+# é criado pela primeira vez no worker (veja startup.py)
+OPENAI_AVAILABLE = module_available("openai")
+GEMINI_AVAILABLE = module_available("google.generativeai")
+LLAMA_AVAILABLE = module_available("llama_cpp")
+ANTHROPIC_AVAILABLE = module_available("anthropic")
+
+# Grok API não está disponível publicamente ainda
+# Por enquanto, marcamos como indisponível
+GROK_AVAILABLE = False
+
+# Provedores que aceitam imagens (podem receber páginas do OCR em um failover)
+VISION_PROVIDERS = ("openai", "anthropic")
+
+
+def resolve_model(ai_provider: str) -> str:
+    """
+    Retorna o modelo configurado para o provedor de IA
+    """
+    # Configurar os modelos específicos para cada provedor com base em variáveis de ambiente
+    if ai_provider == "openai":
+        return os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    elif ai_provider == "gemini":
+        return os.getenv("GEMINI_MODEL", "gemini-1.0-pro")  # Usando 1.0-pro como padrão mais estável
+    elif ai_provider == "anthropic":
+        return os.getenv("ANTHROPIC_MODEL", "claude-3-sonnet-20240229")
+    elif ai_provider == "grok":
+        return os.getenv("GROK_MODEL", "grok-2")
+    elif ai_provider == "llama_local":
+        return "local_model"  # Modelo é definido pelo caminho do arquivo no LlamaProvider
+    else:
+        return os.getenv("LLM_MODEL", "gpt-4o-mini")
+
 
 class AIProvider(ABC):
     """Classe base abstrata para provedores de IA"""
+
+    # Nome usado nas variáveis de ambiente do provedor (por exemplo CHUNK_TOKENS_GEMINI)
+    name = "default"
+    # Tokens de entrada por chamada em `aprocess_chunks`; a resposta em markdown tem tamanho
+    # parecido com a entrada, então o orçamento também precisa caber no limite de saída do modelo
+    chunk_tokens = 6000
     
     @abstractmethod
     def process_document(self, text: str, images: Optional[List[str]] = None, prompt: str = "") -> str:
@@ -57,6 +71,83 @@ class AIProvider(ABC):
             Texto processado em formato markdown
         """
         pass
+
+    async def aprocess_document(self, text: str, images: Optional[List[str]] = None, prompt: str = "") -> str:
+        """
+        Versão assíncrona de `process_document`
+
+        Por padrão executa `process_document` no pool de threads do event loop; provedores com
+        cliente assíncrono sobrescrevem este método para não ocupar uma thread durante a chamada.
+        """
+        return await asyncio.to_thread(self.process_document, text, images, prompt)
+
+    def prepare_images(self, images: Optional[List[str]]) -> List[PreparedImage]:
+        """
+        Imagens lidas, reduzidas aos limites do provedor e codificadas (operação bloqueante)
+
+        O resultado vem do cache de imagens do worker, então a mesma imagem não é lida nem codificada
+        de novo em novas tentativas ou no failover.
+        """
+        return [load_image(path, self.name) for path in images or []]
+
+    def get_chunk_tokens(self) -> int:
+        """Orçamento de tokens por trecho, ajustável por `CHUNK_TOKENS_<PROVEDOR>`"""
+        return int(os.getenv(f"CHUNK_TOKENS_{self.name.upper()}", str(self.chunk_tokens)))
+
+    async def aprocess_chunks(self, pages: Iterable[str], prompt: str = "", concurrency: Optional[int] = None) -> str:
+        """
+        Processa um documento longo em trechos que cabem no orçamento de tokens do provedor
+
+        O texto (uma string por página, consumidas sob demanda) é dividido por página e seção, os
+        trechos são enviados em paralelo (até `CHUNK_CONCURRENCY` por documento) e o markdown
+        retornado é reunido na ordem original.
+
+        Args:
+            pages: Texto de cada página do documento
+            prompt: Instruções específicas para o processamento
+            concurrency: Trechos enviados ao mesmo tempo (padrão: `CHUNK_CONCURRENCY`)
+
+        Returns:
+            Texto processado em formato markdown
+        """
+        if concurrency is None:
+            concurrency = int(os.getenv("CHUNK_CONCURRENCY", "4"))
+
+        async def process(chunk: str) -> str:
+            async def call(provider_type: str) -> str:
+                # Em um failover o trecho vai para outro provedor da cadeia (instância compartilhada do worker)
+                provider = self if provider_type == self.name else await asyncio.to_thread(provider_registry.get, provider_type)
+                with stage("llm_chunk", provider_type):
+                    return await provider.aprocess_document(chunk, prompt=prompt)
+
+            # A resposta tem tamanho parecido com a entrada, então a estimativa conta as duas
+            return await provider_scheduler.run(self.name, call, tokens=2 * estimate_tokens(prompt + chunk))
+
+        return await process_chunks(iter_chunks(pages, self.get_chunk_tokens()), process, concurrency=concurrency)
+
+    def get_async_client(self) -> Any:
+        """Cliente assíncrono do provedor, registrando o loop em que as conexões dele são abertas"""
+        self.async_loop = asyncio.get_running_loop()
+        return self.async_client
+
+    def close(self) -> None:
+        """Libera clientes e recursos mantidos pelo provedor"""
+        client = getattr(self, "client", None)
+        if client is not None and hasattr(client, "close"):
+            client.close()
+        async_client = getattr(self, "async_client", None)
+        loop = getattr(self, "async_loop", None)
+        if async_client is not None and loop is not None and not loop.is_closed():
+            # O pool de conexões do cliente assíncrono pertence ao loop em que foi usado: fecha nele
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                loop.create_task(async_client.close())
+            elif loop.is_running():
+                asyncio.run_coroutine_threadsafe(async_client.close(), loop).result(timeout=10)
+        self.async_loop = None
     
     @staticmethod
     def get_provider(provider_type: str = None) -> 'AIProvider':
@@ -89,7 +180,8 @@ class AIProvider(ABC):
                 "disponível publicamente. Por favor, use outro provedor como OpenAI, Gemini ou Claude."
             )
         elif provider_type == 'llama_local':
-            if not LLAMA_AVAILABLE:
+            # Com o serviço local compartilhado, o worker não carrega o modelo nem precisa do llama.cpp
+            if not LLAMA_AVAILABLE and not LlamaLocalProvider.use_server():
                 raise ImportError("A biblioteca Llama CPP não está instalada. Instale com 'pip install llama-cpp-python'.")
             return LlamaLocalProvider()
         else:
@@ -98,42 +190,60 @@ class AIProvider(ABC):
 
 class OpenAIProvider(AIProvider):
     """Provedor usando a API da OpenAI"""
+
+    name = "openai"
     
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-        self.client = OpenAI(api_key=self.api_key)
+        openai = lazy_import("openai")
+        # Novas tentativas ficam a cargo do agendador (scheduler.py), e não do SDK
+        self.client = openai.OpenAI(api_key=self.api_key, max_retries=0)
+        # Cliente assíncrono, usado no event loop compartilhado do worker
+        self.async_client = openai.AsyncOpenAI(api_key=self.api_key, max_retries=0)
         
-    def process_document(self, text: str, images: Optional[List[str]] = None, prompt: str = "") -> str:
-        """Processa documento usando a API da OpenAI"""
+    def _build_messages(self, text: str, images: Optional[List[str]] = None, prompt: str = "") -> List[Dict[str, Any]]:
         messages = [{"role": "system", "content": prompt or "Convert this document to markdown format."}]
         
         # Se tiver imagens, adiciona mensagem com as imagens
         if images and len(images) > 0:
-            image_contents = []
-            for img_path in images:
-                with open(img_path, "rb") as img_file:
-                    image_contents.append(
-                        {
-                            "type": "image_url", 
-                            "image_url": {"url": f"data:image/jpeg;base64,{img_file.read().decode('latin1')}"}
-                        }
-                    )
+            image_contents = [
+                {"type": "image_url", "image_url": {"url": image.data_url}}
+                for image in self.prepare_images(images)
+            ]
             messages.append({"role": "user", "content": [{"type": "text", "text": text}, *image_contents]})
         else:
             messages.append({"role": "user", "content": text})
-            
+        return messages
+
+    def process_document(self, text: str, images: Optional[List[str]] = None, prompt: str = "") -> str:
+        """Processa documento usando a API da OpenAI"""
         response = self.client.chat.completions.create(
             model=self.model,
-            messages=messages,
+            messages=self._build_messages(text, images, prompt),
             temperature=0.1
         )
         
         return response.choices[0].message.content
 
+    async def aprocess_document(self, text: str, images: Optional[List[str]] = None, prompt: str = "") -> str:
+        """Processa documento usando a API da OpenAI, sem bloquear o event loop"""
+        # A leitura das imagens (na primeira vez) é feita no pool de threads
+        messages = await asyncio.to_thread(self._build_messages, text, images, prompt)
+        response = await self.get_async_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0.1
+        )
+        return response.choices[0].message.content
+
 
 class GeminiProvider(AIProvider):
     """Provedor usando a API do Google Gemini"""
+
+    name = "gemini"
+    # O gemini-1.0-pro responde com no máximo 2048 tokens; modelos mais novos aceitam CHUNK_TOKENS_GEMINI maior
+    chunk_tokens = 1800
     
     def __init__(self):
         try:
@@ -144,8 +254,13 @@ class GeminiProvider(AIProvider):
             self.model = os.getenv("GEMINI_MODEL", "gemini-1.0-pro")  # Usando 1.0-pro como padrão que é mais estável
             
             # Configuração mais explícita
-            import google.generativeai as genai
-            genai.configure(api_key=self.api_key)
+            genai = lazy_import("google.generativeai")
+            options: Dict[str, Any] = {}
+            api_base = os.getenv("GEMINI_API_BASE")
+            if api_base:
+                # Endpoint alternativo (por exemplo, o servidor simulado dos benchmarks), acessado via REST
+                options = {"transport": "rest", "client_options": {"api_endpoint": api_base}}
+            genai.configure(api_key=self.api_key, **options)
             
             # Verificar modelos disponíveis
             try:
@@ -175,15 +290,8 @@ class GeminiProvider(AIProvider):
             # Se tiver imagens
             if images and len(images) > 0:
                 try:
-                    import PIL.Image
-                    image_parts = []
-                    for img_path in images:
-                        try:
-                            image = PIL.Image.open(img_path)
-                            image_parts.append(image)
-                        except Exception as e:
-                            print(f"Erro ao processar imagem {img_path}: {str(e)}")
-                    
+                    image_parts = self._load_images(images)
+
                     if image_parts:
                         response = self.client.generate_content(
                             [system_prompt, text, *image_parts],
@@ -208,26 +316,69 @@ class GeminiProvider(AIProvider):
             
             return response.text
         except Exception as e:
-            error_msg = f"Erro ao processar documento com Gemini: {str(e)}"
-            print(error_msg)
-            return f"**ERRO DE PROCESSAMENTO**: {error_msg}"
+            # O erro é propagado (e não devolvido como conteúdo) para que o agendador tente de novo ou use outro provedor
+            print(f"Erro ao processar documento com Gemini: {str(e)}")
+            raise
+
+    def _load_images(self, images: Optional[List[str]]) -> List[Dict[str, Any]]:
+        # Bytes já preparados, enviados como blobs (sem decodificar a imagem com o PIL a cada chamada)
+        image_parts = []
+        for img_path in images or []:
+            try:
+                image = load_image(img_path, self.name)
+                image_parts.append({"mime_type": image.mime_type, "data": image.data})
+            except Exception as e:
+                print(f"Erro ao processar imagem {img_path}: {str(e)}")
+        return image_parts
+
+    async def aprocess_document(self, text: str, images: Optional[List[str]] = None, prompt: str = "") -> str:
+        """Processa documento usando a API do Google Gemini, sem bloquear o event loop"""
+        try:
+            system_prompt = prompt or "Convert this document to markdown format."
+            image_parts = await asyncio.to_thread(self._load_images, images) if images else []
+
+            if image_parts:
+                try:
+                    response = await self.client.generate_content_async(
+                        [system_prompt, text, *image_parts],
+                        generation_config={"temperature": 0.1}
+                    )
+                    return response.text
+                except Exception as e:
+                    print(f"Erro ao processar imagens com Gemini: {str(e)}")
+
+            response = await self.client.generate_content_async(
+                [system_prompt, text],
+                generation_config={"temperature": 0.1}
+            )
+            return response.text
+        except Exception as e:
+            # O erro é propagado (e não devolvido como conteúdo) para que o agendador tente de novo ou use outro provedor
+            print(f"Erro ao processar documento com Gemini: {str(e)}")
+            raise
 
 
 class AnthropicProvider(AIProvider):
     """Provedor usando a API da Anthropic (Claude)"""
+
+    name = "anthropic"
+    # A resposta é limitada a max_tokens=4000
+    chunk_tokens = 3500
     
     def __init__(self):
         self.api_key = os.getenv("ANTHROPIC_API_KEY")
         self.model = os.getenv("ANTHROPIC_MODEL", "claude-3-sonnet-20240229")
         # Importação dinâmica para evitar dependência desnecessária
         try:
-            from anthropic import Anthropic
-            self.client = Anthropic(api_key=self.api_key)
+            anthropic = lazy_import("anthropic")
+            # Novas tentativas ficam a cargo do agendador (scheduler.py), e não do SDK
+            self.client = anthropic.Anthropic(api_key=self.api_key, max_retries=0)
+            # Cliente assíncrono, usado no event loop compartilhado do worker
+            self.async_client = anthropic.AsyncAnthropic(api_key=self.api_key, max_retries=0)
         except ImportError:
             raise ImportError("anthropic package não está instalado. Instale com 'pip install anthropic'")
     
-    def process_document(self, text: str, images: Optional[List[str]] = None, prompt: str = "") -> str:
-        """Processa documento usando a API da Anthropic"""
+    def _build_message_params(self, text: str, images: Optional[List[str]] = None, prompt: str = "") -> Dict[str, Any]:
         system_prompt = prompt or "Convert this document to markdown format."
         
         message_params = {
@@ -241,29 +392,38 @@ class AnthropicProvider(AIProvider):
             # Constrói mensagem com imagens
             content = [{"type": "text", "text": text}]
             
-            for img_path in images:
-                with open(img_path, "rb") as img_file:
-                    import base64
-                    img_b64 = base64.b64encode(img_file.read()).decode("utf-8")
-                    content.append({
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "image/jpeg",
-                            "data": img_b64
-                        }
-                    })
+            for image in self.prepare_images(images):
+                content.append({
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": image.mime_type,
+                        "data": image.base64
+                    }
+                })
             
             message_params["messages"] = [{"role": "user", "content": content}]
         else:
             message_params["messages"] = [{"role": "user", "content": text}]
-        
-        response = self.client.messages.create(**message_params)
+        return message_params
+
+    def process_document(self, text: str, images: Optional[List[str]] = None, prompt: str = "") -> str:
+        """Processa documento usando a API da Anthropic"""
+        response = self.client.messages.create(**self._build_message_params(text, images, prompt))
+        return response.content[0].text
+
+    async def aprocess_document(self, text: str, images: Optional[List[str]] = None, prompt: str = "") -> str:
+        """Processa documento usando a API da Anthropic, sem bloquear o event loop"""
+        # A leitura e codificação das imagens são feitas no pool de threads
+        message_params = await asyncio.to_thread(self._build_message_params, text, images, prompt)
+        response = await self.get_async_client().messages.create(**message_params)
         return response.content[0].text
 
 
 class GrokProvider(AIProvider):
     """Provedor usando a API da Grok (xAI)"""
+
+    name = "grok"
     
     def __init__(self):
         self.api_key = os.getenv("GROK_API_KEY")
@@ -299,23 +459,47 @@ class GrokProvider(AIProvider):
 
 
 class LlamaLocalProvider(AIProvider):
-    """Provedor usando o Llama rodando localmente via llama.cpp"""
+    """
+    Provedor usando o Llama rodando localmente via llama.cpp
+
+    Com `LLAMA_SERVER_ENABLED=true` o modelo não é carregado no worker: as chamadas vão para o serviço
+    local compartilhado pelos workers do contêiner (veja llama_server.py).
+    """
+
+    name = "llama_local"
+    max_tokens = 2048
+
+    @staticmethod
+    def use_server() -> bool:
+        return os.getenv("LLAMA_SERVER_ENABLED", "false").lower() == "true"
     
     def __init__(self):
         self.model_path = os.getenv("LLAMA_MODEL_PATH", "/app/models/llama-3-8b.gguf")
         self.n_ctx = int(os.getenv("LLAMA_N_CTX", "4096"))
         self.n_gpu_layers = int(os.getenv("LLAMA_N_GPU_LAYERS", "-1"))
         self.seed = int(os.getenv("LLAMA_SEED", "42"))
+        # Prompt, trecho e resposta precisam caber juntos no contexto (n_ctx)
+        self.chunk_tokens = max(256, min(self.max_tokens, self.n_ctx - self.max_tokens - 256))
+
+        if self.use_server():
+            from llama_server import LlamaClient
+
+            self.server = LlamaClient()
+            self.llm = None
+            return
+        self.server = None
         
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(f"Modelo GGUF não encontrado em: {self.model_path}")
         
-        self.llm = Llama(
+        self.llm = lazy_import("llama_cpp").Llama(
             model_path=self.model_path,
             n_ctx=self.n_ctx,
             n_gpu_layers=self.n_gpu_layers,
             seed=self.seed
         )
+        # O contexto do llama.cpp não é thread-safe; a instância é compartilhada entre as threads do worker
+        self._lock = threading.Lock()
     
     def process_document(self, text: str, images: Optional[List[str]] = None, prompt: str = "") -> str:
         """Processa documento usando o modelo Llama local"""
@@ -326,12 +510,127 @@ class LlamaLocalProvider(AIProvider):
             print("Aviso: Llama local não suporta processamento de imagens. Ignorando imagens fornecidas.")
         
         prompt_template = f"<|im_start|>system\n{system_prompt}<|im_end|>\n<|im_start|>user\n{text}<|im_end|>\n<|im_start|>assistant\n"
+
+        if self.server is not None:
+            # A chamada entra na fila do serviço, junto com as dos outros workers
+            return self.server.complete(prompt_template, self.max_tokens, temperature=0.1, stop=["<|im_end|>"])
         
-        response = self.llm(
-            prompt=prompt_template,
-            max_tokens=2048,
-            temperature=0.1,
-            stop=["<|im_end|>"]
-        )
+        with self._lock:
+            response = self.llm(
+                prompt=prompt_template,
+                max_tokens=self.max_tokens,
+                temperature=0.1,
+                stop=["<|im_end|>"]
+            )
         
-        return response["choices"][0]["text"] 
\ No newline at end of file
+        return response["choices"][0]["text"]
+
+    def close(self) -> None:
+        """Libera o modelo carregado ou as conexões com o serviço local"""
+        server = getattr(self, "server", None)
+        if server is not None:
+            server.close()
+        self.server = None
+        llm = getattr(self, "llm", None)
+        if llm is not None and hasattr(llm, "close"):
+            llm.close()
+        self.llm = None
+
+
+class ProviderRegistry:
+    """
+    Registro por worker de provedores e clientes reutilizáveis
+
+    Cada provedor (e qualquer outro recurso caro, como clientes HTTP) é criado uma única vez,
+    no primeiro uso, e compartilhado pelas requisições seguintes do mesmo processo. Assim o pool
+    de conexões dos clientes é reaproveitado e o modelo do llama_local é carregado só uma vez.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Any, threading.Lock] = {}
+        self._instances: Dict[Any, Any] = {}
+
+    def get(self, provider_type: str = None) -> AIProvider:
+        """
+        Retorna a instância compartilhada do provedor, criando-a no primeiro uso
+
+        Args:
+            provider_type: Tipo de provedor (openai, gemini, anthropic, etc.)
+
+        Returns:
+            Instância do provedor de IA
+        """
+        provider_type = (provider_type or os.environ.get('AI_PROVIDER', 'openai')).lower()
+        return self.get_resource(("provider", provider_type), lambda: AIProvider.get_provider(provider_type))
+
+    def get_resource(self, key: Any, factory: Callable[[], Any]) -> Any:
+        """
+        Retorna o recurso registrado sob `key`, criando-o com `factory` no primeiro uso
+
+        A criação é feita com um lock por chave, para que requisições simultâneas não criem
+        duas cópias do mesmo recurso nem bloqueiem a criação de recursos diferentes.
+        """
+        instance = self._instances.get(key)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            instance = self._instances.get(key)
+            if instance is None:
+                instance = factory()
+                self._instances[key] = instance
+        return instance
+
+    def warmup(self, provider_types: Iterable[str]) -> None:
+        """Cria antecipadamente os provedores informados (erros são apenas registrados)"""
+        for provider_type in provider_types:
+            provider_type = provider_type.strip().lower()
+            if not provider_type:
+                continue
+            try:
+                self.get(provider_type)
+                print(f"Provedor {provider_type} pré-carregado")
+            except Exception as e:
+                print(f"Aviso: não foi possível pré-carregar o provedor {provider_type}: {str(e)}")
+
+    def reload(self, key: Any = None) -> None:
+        """
+        Descarta um recurso (ou todos, se `key` for None) para que seja recriado no próximo uso
+
+        Para provedores, `key` pode ser apenas o nome do provedor (por exemplo "gemini").
+        """
+        if isinstance(key, str):
+            key = ("provider", key.lower())
+
+        with self._lock:
+            if key is None:
+                removed = list(self._instances.values())
+                self._instances.clear()
+            else:
+                removed = [self._instances.pop(key)] if key in self._instances else []
+
+        for instance in removed:
+            self._close(instance)
+
+    def shutdown(self) -> None:
+        """Fecha todos os recursos registrados; usado no encerramento do worker"""
+        self.reload()
+
+    @staticmethod
+    def _close(instance: Any) -> None:
+        if hasattr(instance, "close"):
+            try:
+                instance.close()
+            except Exception as e:
+                print(f"Aviso ao liberar recurso {type(instance).__name__}: {str(e)}")
+
+
+# Registro compartilhado pelas requisições do worker atual
+provider_registry = ProviderRegistry() 
+
+# Limites de taxa, novas tentativas, failover e hedging das chamadas do worker atual
+provider_scheduler = ProviderScheduler.from_env()
@@ -0,0 +1,385 @@
+"""
+Armazém de artefatos das conversões do Leitor Doc PyZerox
+Guarda em um volume local o que cada conversão produziu: arquivo original, imagens das páginas
+renderizadas, markdown de cada página e resultado final. Os conteúdos ficam em blobs endereçados pelo
+SHA-256 (o mesmo conteúdo é gravado uma única vez), comprimidos com zstd (ou gzip, se o `zstandard` não
+estiver instalado), e um índice SQLite em `uploads/artifacts` permite buscá-los por hash do documento,
+data, tipo e provedor. O tamanho total é limitado, com remoção dos blobs menos acessados (LRU).
+Cada conversão tem um único registro por tipo de artefato (chave da conversão + tipo; as páginas têm
+uma chave própria por página), e os resultados guardados valem pelo mesmo `RESULT_CACHE_TTL` do cache de resultados.
+
+O índice e os blobs são compartilhados por todos os workers do gunicorn: escritas e remoções acontecem
+em transações exclusivas do SQLite, e os blobs são gravados de forma atômica.
+"""
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Codecs aceitos em ARTIFACT_STORE_COMPRESSION e a extensão dos blobs de cada um
+CODECS = {"zstd": ".zst", "gzip": ".gz", "none": ""}
+
+# Conteúdos já comprimidos: gravados sem nova compressão
+_COMPRESSED_TYPES = ("image/", "audio/", "video/", "application/zip", "application/vnd.openxmlformats")
+
+
+class ArtifactStore:
+    """Blobs comprimidos endereçados por conteúdo, com índice SQLite e limite de tamanho"""
+
+    def __init__(
+        self,
+        base_dir: str,
+        max_bytes: int = 2048 * 1024 * 1024,
+        compression: str = "zstd",
+        level: int = 3,
+        result_ttl: int = 86400,
+    ):
+        if compression not in CODECS:
+            raise ValueError(f"ARTIFACT_STORE_COMPRESSION inválido: {compression}. Use um de: {', '.join(CODECS)}")
+        if compression == "zstd" and not ZSTD_AVAILABLE:
+            print("Aviso: zstandard não está instalado; artefatos comprimidos com gzip")
+            compression = "gzip"
+        self.base_dir = base_dir
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.level = level
+        self.result_ttl = result_ttl
+        self.db_path = os.path.join(base_dir, "artifacts.db")
+        self.blob_dir = os.path.join(base_dir, "blobs")
+        # Estimativa do tamanho dos blobs; recalculada no índice a cada eviction
+        self._stored_bytes: Optional[int] = None
+
+        os.makedirs(self.blob_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS blobs (
+                    hash TEXT PRIMARY KEY,
+                    codec TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    stored_size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    document TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    page INTEGER,
+                    mime_type TEXT,
+                    provider TEXT,
+                    model TEXT,
+                    cache_key TEXT,
+                    blob TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS blobs_lru ON blobs (accessed_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS artifacts_document ON artifacts (document, kind, page)")
+            # Um registro por conversão (chave do cache de resultados) e tipo de artefato, atualizado a cada repetição
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS artifacts_conversion ON artifacts (cache_key, kind) "
+                "WHERE cache_key IS NOT NULL"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS artifacts_provider ON artifacts (provider, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS artifacts_created ON artifacts (created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS artifacts_blob ON artifacts (blob)")
+
+    @classmethod
+    def from_env(cls) -> "ArtifactStore":
+        """Cria o armazém a partir das variáveis de ambiente `ARTIFACT_STORE_*`"""
+        return cls(
+            base_dir=os.getenv("ARTIFACT_STORE_DIR", os.path.join("uploads", "artifacts")),
+            max_bytes=int(os.getenv("ARTIFACT_STORE_MAX_MB", "2048")) * 1024 * 1024,
+            compression=os.getenv("ARTIFACT_STORE_COMPRESSION", "zstd").lower(),
+            level=int(os.getenv("ARTIFACT_STORE_LEVEL", "3")),
+            result_ttl=int(os.getenv("RESULT_CACHE_TTL", "86400")),
+        )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Conexões curtas em modo autocommit: cada thread/worker abre a sua
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # Escrita
+
+    def put(self, data: bytes, document: str, kind: str, **metadata: Any) -> str:
+        """
+        Guarda um conteúdo em memória e o registra no índice
+
+        Args:
+            data: Conteúdo do artefato
+            document: SHA-256 do documento de origem
+            kind: Tipo do artefato ("original", "page_image", "page_markdown", "output" ou "result")
+            metadata: `page`, `mime_type`, `provider`, `model` e `cache_key` (opcionais); com `cache_key`,
+                o registro anterior da mesma conversão e tipo é substituído
+
+        Returns:
+            Hash do blob (SHA-256 do conteúdo)
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        codec = self._codec(metadata.get("mime_type"))
+        if self._exists(digest):
+            try:
+                return self._commit(digest, codec, len(data), None, document, kind, metadata)
+            except FileNotFoundError:
+                pass
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(self._compress(data, codec))
+        return self._commit(digest, codec, len(data), tmp_path, document, kind, metadata)
+
+    def put_file(self, path: str, document: str, kind: str, digest: Optional[str] = None, **metadata: Any) -> str:
+        """
+        Guarda um arquivo (lido e comprimido em blocos) e o registra no índice; veja `put`
+
+        Args:
+            digest: SHA-256 do arquivo, se já calculado (evita ler o arquivo quando o blob já existe)
+        """
+        codec = self._codec(metadata.get("mime_type"))
+        if digest is not None and self._exists(digest):
+            try:
+                return self._commit(digest, codec, os.path.getsize(path), None, document, kind, metadata)
+            except FileNotFoundError:
+                pass
+
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, suffix=".tmp")
+        try:
+            with open(path, "rb") as source, os.fdopen(fd, "wb") as f, self._writer(f, codec) as target:
+                for chunk in iter(lambda: source.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    target.write(chunk)
+        except BaseException:
+            self._unlink(tmp_path)
+            raise
+        return self._commit(hasher.hexdigest(), codec, size, tmp_path, document, kind, metadata)
+
+    def _exists(self, digest: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone() is not None
+
+    def _commit(
+        self,
+        digest: str,
+        codec: str,
+        size: int,
+        tmp_path: Optional[str],
+        document: str,
+        kind: str,
+        metadata: Dict[str, Any],
+    ) -> str:
+        """Publica o blob (se novo) e registra o artefato em uma única transação exclusiva"""
+        now = time.time()
+        added = 0
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT codec FROM blobs WHERE hash = ?", (digest,)).fetchone()
+                if row is None and tmp_path is not None:
+                    # O blob só fica visível depois de gravado por inteiro; a eviction usa a mesma trava
+                    path = self._blob_path(digest, codec)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(tmp_path, path)
+                    tmp_path = None
+                    added = os.path.getsize(path)
+                    conn.execute(
+                        "INSERT INTO blobs (hash, codec, size, stored_size, created_at, accessed_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (digest, codec, size, added, now, now),
+                    )
+                elif row is not None:
+                    conn.execute("UPDATE blobs SET accessed_at = ? WHERE hash = ?", (now, digest))
+                else:
+                    # O blob foi removido entre a consulta e a transação: o conteúdo precisa ser gravado de novo
+                    raise FileNotFoundError(digest)
+                # Uma conversão repetida atualiza o registro existente em vez de acumular linhas
+                conn.execute(
+                    "INSERT INTO artifacts (document, kind, page, mime_type, provider, model, cache_key, blob, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (cache_key, kind) WHERE cache_key IS NOT NULL DO UPDATE SET "
+                    "document = excluded.document, page = excluded.page, mime_type = excluded.mime_type, "
+                    "provider = excluded.provider, model = excluded.model, blob = excluded.blob, "
+                    "created_at = excluded.created_at",
+                    (
+                        document,
+                        kind,
+                        metadata.get("page"),
+                        metadata.get("mime_type"),
+                        metadata.get("provider"),
+                        metadata.get("model"),
+                        metadata.get("cache_key"),
+                        digest,
+                        now,
+                    ),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                if tmp_path is not None:
+                    # Conteúdo repetido (outro worker gravou o mesmo blob antes)
+                    self._unlink(tmp_path)
+
+        if added:
+            if self._stored_bytes is not None:
+                self._stored_bytes += added
+            if self._stored_bytes is None or self._stored_bytes > self.max_bytes:
+                self.evict()
+        return digest
+
+    # Leitura
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """Conteúdo de um blob, ou None se não existir (ou já tiver sido removido)"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT codec FROM blobs WHERE hash = ?", (digest,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE blobs SET accessed_at = ? WHERE hash = ?", (time.time(), digest))
+        try:
+            with open(self._blob_path(digest, row["codec"]), "rb") as f:
+                return self._decompress(f.read(), row["codec"])
+        except OSError:
+            return None
+
+    def find(
+        self,
+        document: Optional[str] = None,
+        kind: Optional[str] = None,
+        provider: Optional[str] = None,
+        cache_key: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Artefatos que atendem aos filtros, do mais recente para o mais antigo"""
+        filters = []
+        values: List[Any] = []
+        for column, value in (("document", document), ("kind", kind), ("provider", provider), ("cache_key", cache_key)):
+            if value is not None:
+                filters.append(f"a.{column} = ?")
+                values.append(value)
+        if since is not None:
+            filters.append("a.created_at >= ?")
+            values.append(since)
+        if until is not None:
+            filters.append("a.created_at < ?")
+            values.append(until)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT a.id, a.document, a.kind, a.page, a.mime_type, a.provider, a.model, a.cache_key, a.blob, "
+                f"a.created_at, b.size, b.stored_size FROM artifacts a JOIN blobs b ON b.hash = a.blob {where} "
+                "ORDER BY a.created_at DESC, a.id DESC LIMIT ?",
+                (*values, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_result(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Resultado de uma conversão guardado com a chave do cache de resultados, se ainda existir
+
+        Resultados gravados há mais de `result_ttl` segundos estão vencidos, como no cache de resultados.
+        """
+        since = time.time() - self.result_ttl
+        for artifact in self.find(kind="result", cache_key=cache_key, since=since, limit=1):
+            data = self.get(artifact["blob"])
+            if data is not None:
+                return json.loads(data)
+        return None
+
+    # Limite de tamanho
+
+    def evict(self) -> None:
+        """Remove os blobs menos acessados (e os artefatos que apontam para eles) até caber no limite"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                total = conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM blobs").fetchone()[0]
+                if total > self.max_bytes:
+                    # Libera até 90% do limite para não fazer eviction a cada escrita
+                    target = int(self.max_bytes * 0.9)
+                    for row in conn.execute("SELECT hash, codec, stored_size FROM blobs ORDER BY accessed_at").fetchall():
+                        if total <= target:
+                            break
+                        conn.execute("DELETE FROM artifacts WHERE blob = ?", (row["hash"],))
+                        conn.execute("DELETE FROM blobs WHERE hash = ?", (row["hash"],))
+                        # O arquivo sai ainda dentro da transação: nenhum worker publica o mesmo blob no meio
+                        self._unlink(self._blob_path(row["hash"], row["codec"]))
+                        total -= row["stored_size"]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._stored_bytes = total
+
+    # Blobs e compressão
+
+    def _blob_path(self, digest: str, codec: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest + CODECS[codec])
+
+    def _codec(self, mime_type: Optional[str]) -> str:
+        if mime_type and mime_type.startswith(_COMPRESSED_TYPES):
+            return "none"
+        return self.compression
+
+    def _compress(self, data: bytes, codec: str) -> bytes:
+        if codec == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        if codec == "gzip":
+            return gzip.compress(data, compresslevel=min(self.level, 9))
+        return data
+
+    @staticmethod
+    def _decompress(data: bytes, codec: str) -> bytes:
+        if codec == "zstd":
+            # Os blobs gravados em blocos não declaram o tamanho original no cabeçalho
+            return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        if codec == "gzip":
+            return gzip.decompress(data)
+        return data
+
+    @contextmanager
+    def _writer(self, f: BinaryIO, codec: str) -> Iterator[BinaryIO]:
+        """Arquivo de destino que comprime o que é escrito nele"""
+        if codec == "zstd":
+            with zstandard.ZstdCompressor(level=self.level).stream_writer(f, closefd=False) as writer:
+                yield writer
+        elif codec == "gzip":
+            with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=min(self.level, 9)) as writer:
+                yield writer
+        else:
+            yield f
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
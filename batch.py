@@ -0,0 +1,108 @@
+"""
+Lotes de arquivos para o Leitor Doc PyZerox
+Funções usadas por `POST /convert/batch` para receber vários arquivos em uma única requisição, seja
+como partes de um multipart/form-data, seja como membros de um arquivo zip. Cada arquivo é gravado no
+diretório de trabalho do lote em blocos, com o hash calculado durante a cópia, e arquivos idênticos são
+agrupados para serem convertidos uma única vez.
+"""
+import mimetypes
+import os
+import zipfile
+from typing import Any, Dict, List, Optional, Tuple
+
+from workspace import copy_stream
+
+# Tipos aceitos como corpo bruto de um lote (o zip é aberto e cada membro vira um arquivo do lote)
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+
+
+class BatchError(Exception):
+    """Levantada quando o lote enviado não pode ser aceito (vazio, grande demais, zip inválido)"""
+
+
+def item_path(dest_dir: str, index: int, filename: str) -> str:
+    """Caminho do arquivo de índice `index`, em um subdiretório próprio do diretório do lote"""
+    item_dir = os.path.join(dest_dir, str(index))
+    os.makedirs(item_dir, exist_ok=True)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(item_dir, f"input{extension}")
+
+
+def extract_zip(
+    zip_path: str,
+    dest_dir: str,
+    max_files: int,
+    max_bytes: int,
+    chunk_size: int = 1024 * 1024,
+) -> List[Dict[str, Any]]:
+    """
+    Extrai os arquivos de um zip para o diretório do lote
+
+    Diretórios, arquivos ocultos e metadados do macOS são ignorados. O tamanho descompactado é
+    verificado durante a cópia, então um zip que "explode" é interrompido ao passar de `max_bytes`.
+
+    Args:
+        zip_path: Caminho do zip recebido
+        dest_dir: Diretório do lote
+        max_files: Número máximo de arquivos aceitos
+        max_bytes: Soma máxima dos tamanhos descompactados
+        chunk_size: Tamanho de cada bloco copiado
+
+    Returns:
+        Lista de arquivos (`filename`, `path`, `content_type`, `size`, `file_hash`), na ordem do zip
+
+    Raises:
+        BatchError: Se o zip for inválido ou tiver arquivos demais
+        UploadTooLargeError: Se o conteúdo descompactado passar de `max_bytes`
+    """
+    items: List[Dict[str, Any]] = []
+    total = 0
+    try:
+        archive = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile:
+        raise BatchError("Arquivo zip inválido")
+
+    with archive:
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or info.filename.startswith("__MACOSX/") or not name or name.startswith("."):
+                continue
+            if len(items) >= max_files:
+                raise BatchError(f"O lote tem mais de {max_files} arquivos")
+
+            path = item_path(dest_dir, len(items), info.filename)
+            try:
+                with archive.open(info) as member:
+                    size, file_hash = copy_stream(member, path, max_bytes=max_bytes - total, chunk_size=chunk_size)
+            except (RuntimeError, NotImplementedError, zipfile.BadZipFile) as e:
+                # Membros criptografados ou com compressão não suportada
+                raise BatchError(f"Não foi possível extrair {info.filename}: {str(e)}")
+            total += size
+            items.append(
+                {
+                    "filename": info.filename,
+                    "path": path,
+                    "content_type": mimetypes.guess_type(info.filename)[0] or "",
+                    "size": size,
+                    "file_hash": file_hash,
+                }
+            )
+    return items
+
+
+def find_duplicates(items: List[Dict[str, Any]]) -> Dict[int, int]:
+    """
+    Agrupa arquivos idênticos do lote
+
+    Returns:
+        Dicionário {índice do arquivo repetido: índice da primeira ocorrência}
+    """
+    first: Dict[Tuple[str, Optional[str]], int] = {}
+    duplicates: Dict[int, int] = {}
+    for index, item in enumerate(items):
+        key = (item["file_hash"], item.get("format_type"))
+        if key in first:
+            duplicates[index] = first[key]
+        else:
+            first[key] = index
+    return duplicates
@@ -0,0 +1,8 @@
+"""
+Benchmarks offline do Leitor Doc PyZerox
+Um servidor local simula as APIs da OpenAI, Anthropic e Gemini (`mock_llm.py`), um corpus sintético é
+gerado sem dependências externas (`corpus.py`) e o `run.py` dispara requisições contra a aplicação,
+registrando vazão, latências, memória e CPU por formato e provedor. Nada é enviado para a rede.
+
+Uso: `python -m benchmarks.run --help`
+"""
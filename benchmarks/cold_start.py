@@ -0,0 +1,184 @@
+"""
+Inicialização a frio do Leitor Doc PyZerox
+Mede quanto custa subir a aplicação, sem enviar conversões:
+- perfil de importação do `main` (`python -X importtime`), com os pacotes que mais pesam;
+- tempo até o /health responder com o gunicorn, com e sem `GUNICORN_PRELOAD`;
+- relatório de cada worker (GET /startup): tempo até ficar pronto, SDKs já importados e memória
+  residente, proporcional (PSS) e compartilhada com o master.
+
+Exemplo:
+    python -m benchmarks.cold_start --workers 4 --output benchmarks/results/startup.json
+
+Requer Linux (memória lida de /proc) e as dependências da aplicação (requirements.txt).
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+from benchmarks.run import REPO_DIR, _free_port, _git_commit, _process_tree, start_app, stop_app
+
+_IMPORT_TIME = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def import_profile(module: str = "main", top: int = 15) -> Dict[str, Any]:
+    """
+    Tempo de importação de `module` em um interpretador novo, com os pacotes que mais pesam
+
+    O tempo de cada pacote é a soma do tempo próprio dos seus módulos importados por `module`, então
+    um pacote não é contado de novo dentro de outro.
+    """
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {module}: {completed.stderr.strip().splitlines()[-1:]}")
+
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match:
+            entries.append((int(match.group(1)), int(match.group(2)), len(match.group(3)), match.group(4)))
+    # O -X importtime lista cada módulo depois dos que ele importou; a indentação marca a profundidade
+    # (um espaço é o nível de cima), então os módulos importados por `module` vêm logo antes dele
+    end = next(index for index, entry in enumerate(entries) if entry[3] == module and entry[2] <= 1)
+    begin = end
+    while begin > 0 and entries[begin - 1][2] > 1:
+        begin -= 1
+
+    packages: Dict[str, int] = {}
+    for self_us, _, _, name in entries[begin:end + 1]:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    ranking = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "import_ms": round(entries[end][1] / 1000, 1),
+        "interpreter_ms": round(wall * 1000, 1),
+        "top_packages": [{"package": name, "ms": round(us / 1000, 1)} for name, us in ranking],
+    }
+
+
+def _pss_mb(pids: List[int]) -> float:
+    """Soma do PSS (memória proporcional, sem contar duas vezes as páginas compartilhadas) dos processos"""
+    total_kb = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return round(total_kb / 1024, 1)
+
+
+def worker_reports(url: str, workers: int, attempts: int = 50) -> List[Dict[str, Any]]:
+    """Relatórios de GET /startup de cada worker (as requisições caem em workers diferentes)"""
+    reports: Dict[int, Dict[str, Any]] = {}
+    for _ in range(attempts):
+        with urllib.request.urlopen(f"{url}/startup", timeout=10) as response:
+            report = json.load(response)
+        reports[report["pid"]] = report
+        if len(reports) >= workers:
+            break
+    return list(reports.values())
+
+
+def cold_start(env: Dict[str, str], workers: int, threads: int, preload: bool, log_path: str) -> Dict[str, Any]:
+    """Sobe a aplicação, mede o tempo até o /health e coleta os relatórios dos workers"""
+    port = _free_port()
+    started = time.perf_counter()
+    app = start_app(port, {**env, "GUNICORN_PRELOAD": str(preload).lower()}, workers, threads, log_path)
+    ready = time.perf_counter() - started
+    try:
+        # Dá tempo para todos os workers terminarem o post_worker_init
+        time.sleep(1)
+        reports = worker_reports(f"http://127.0.0.1:{port}", workers)
+        pss_total = _pss_mb(_process_tree(app.pid))
+    finally:
+        stop_app(app)
+
+    ready_seconds = [report["phases"].get("worker_ready", {}).get("seconds") for report in reports]
+    ready_seconds = [value for value in ready_seconds if value is not None]
+    return {
+        "preload": preload,
+        "health_seconds": round(ready, 2),
+        "worker_ready_seconds": max(ready_seconds) if ready_seconds else None,
+        "pss_total_mb": pss_total,
+        "workers": reports,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Tempo de inicialização e perfil de importação da aplicação")
+    parser.add_argument("--workers", type=int, default=2, help="Workers do gunicorn")
+    parser.add_argument("--threads", type=int, default=16, help="Threads por worker do gunicorn")
+    parser.add_argument("--top", type=int, default=15, help="Pacotes listados no perfil de importação")
+    parser.add_argument("--warmup", default="", help="PROVIDER_WARMUP dos workers (padrão: nenhum provedor)")
+    parser.add_argument("--preload-modules", default="", help="PRELOAD_MODULES usados na execução com preload")
+    parser.add_argument("--output", default=None, help="Arquivo JSON de resultados (padrão: só imprime o resumo)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    profile = import_profile("main", args.top)
+    print(f"import main: {profile['import_ms']} ms (interpretador: {profile['interpreter_ms']} ms)")
+    for entry in profile["top_packages"]:
+        print(f"  {entry['package']:<24} {entry['ms']:>9.1f} ms")
+
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="leitor-startup-") as work_dir:
+        env = {
+            **os.environ,
+            "RESULT_CACHE_DIR": os.path.join(work_dir, "cache"),
+            "PAGE_CACHE_DIR": os.path.join(work_dir, "cache"),
+            "WORKSPACE_DIR": os.path.join(work_dir, "work"),
+            "JOB_DIR": os.path.join(work_dir, "jobs"),
+            "PROVIDER_WARMUP": args.warmup,
+            "PRELOAD_MODULES": args.preload_modules,
+            "PYTHONUNBUFFERED": "1",
+        }
+        # Fora do diretório temporário, para continuar disponível se a aplicação não subir
+        log_path = os.path.join(tempfile.gettempdir(), "leitor-startup.log")
+        for preload in (False, True):
+            run = cold_start(env, args.workers, args.threads, preload, log_path)
+            runs.append(run)
+            loaded = sorted({name for report in run["workers"] for name, ok in report["loaded_modules"].items() if ok})
+            print(
+                f"preload={str(preload).lower():<5}  /health em {run['health_seconds']}s  "
+                f"workers prontos em {run['worker_ready_seconds']}s  PSS total {run['pss_total_mb']} MB  "
+                f"SDKs carregados: {', '.join(loaded) or 'nenhum'}"
+            )
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        report = {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "config": {key: value for key, value in vars(args).items() if key != "output"},
+            "import_profile": profile,
+            "runs": runs,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""
+Corpus sintético para os benchmarks do Leitor Doc PyZerox
+Gera, somente com a biblioteca padrão, os documentos usados nos benchmarks: PDFs com camada de texto e
+PDFs "escaneados" (uma imagem por página, sem texto) com diferentes números de páginas, DOCX, XLSX,
+PNG e HTML. O conteúdo é determinístico (depende apenas da semente), então execuções diferentes
+enviam exatamente os mesmos arquivos.
+"""
+import io
+import os
+import random
+import struct
+import zipfile
+import zlib
+from typing import Dict, Iterable, List, Optional
+from xml.sax.saxutils import escape
+
+_WORDS = (
+    "o contrato de prestação de serviços estabelece prazos valores e condições de pagamento entre as partes "
+    "sendo que o relatório mensal apresenta receitas despesas e indicadores de desempenho da operação "
+    "conforme a tabela em anexo e as cláusulas descritas nas seções seguintes deste documento"
+).split()
+
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Tipos de documento gerados; `pdf-text` e `pdf-scan` são gerados para cada número de páginas
+KINDS = ("pdf-text", "pdf-scan", "docx", "xlsx", "png", "html")
+
+
+def _sentences(rng: random.Random, count: int, words: int = 14) -> List[str]:
+    sentences = []
+    for _ in range(count):
+        sentence = " ".join(rng.choice(_WORDS) for _ in range(words))
+        sentences.append(sentence[0].upper() + sentence[1:] + ".")
+    return sentences
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _build_pdf(page_streams: List[bytes], image: Optional[bytes] = None, image_size: tuple = (0, 0)) -> bytes:
+    """
+    Monta um PDF com uma página por conteúdo, usando Helvetica e, opcionalmente, uma imagem compartilhada
+
+    Objetos: 1 catálogo, 2 árvore de páginas, 3 fonte, 4 imagem (se houver), depois página e conteúdo
+    de cada página.
+    """
+    objects: List[bytes] = []
+    first_page = 5 if image is not None else 4
+    page_ids = [first_page + 2 * index for index in range(len(page_streams))]
+
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("ascii"))
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    resources = "/Font << /F1 3 0 R >>"
+    if image is not None:
+        width, height = image_size
+        compressed = zlib.compress(image)
+        objects.append(
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray "
+            f"/BitsPerComponent 8 /Filter /FlateDecode /Length {len(compressed)} >>\nstream\n".encode("ascii")
+            + compressed
+            + b"\nendstream"
+        )
+        resources += " /XObject << /Im1 4 0 R >>"
+
+    for page_id, content in zip(page_ids, page_streams):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << {resources} >> "
+            f"/Contents {page_id + 1} 0 R >>".encode("ascii")
+        )
+        objects.append(f"<< /Length {len(content)} >>\nstream\n".encode("ascii") + content + b"\nendstream")
+
+    output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n"
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("ascii")
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode("ascii")
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii")
+    return bytes(output)
+
+
+def text_pdf(pages: int, seed: int = 0) -> bytes:
+    """PDF digital: cada página tem um título, parágrafos e uma tabela simples na camada de texto"""
+    rng = random.Random(seed)
+    streams = []
+    for page in range(1, pages + 1):
+        lines = [f"SECAO {page} - RELATORIO DE TESTE", ""] + _sentences(rng, 30, words=11)
+        lines += ["", "Item        Quantidade        Valor"]
+        lines += [f"Item {row}        {rng.randint(1, 99)}        {rng.randint(100, 9999)},00" for row in range(1, 6)]
+        commands = ["BT", "/F1 10 Tf", "14 TL", "50 800 Td"]
+        commands += [f"({_pdf_escape(line)}) Tj T*" for line in lines]
+        commands.append("ET")
+        streams.append("\n".join(commands).encode("cp1252", errors="replace"))
+    return _build_pdf(streams)
+
+
+def scanned_pdf(pages: int, seed: int = 0) -> bytes:
+    """PDF "escaneado": cada página é uma imagem cobrindo a folha inteira, sem camada de texto"""
+    width, height = 420, 594
+    image = _gray_pattern(width, height, seed)
+    stream = b"q 595 0 0 842 0 0 cm /Im1 Do Q"
+    return _build_pdf([stream] * pages, image=image, image_size=(width, height))
+
+
+def _gray_pattern(width: int, height: int, seed: int) -> bytes:
+    """Pixels em tons de cinza imitando linhas de texto escuras sobre fundo claro"""
+    rng = random.Random(seed)
+    rows = bytearray()
+    for y in range(height):
+        text_line = (y // 12) % 2 == 1 and 40 < y < height - 40
+        if text_line:
+            row = bytearray(
+                rng.choice((20, 40, 60)) if 40 < x < width - 40 and rng.random() < 0.55 else 245 for x in range(width)
+            )
+        else:
+            row = bytearray([245]) * width
+        rows += row
+    return bytes(rows)
+
+
+def png_image(width: int = 800, height: int = 600, seed: int = 0) -> bytes:
+    """PNG em tons de cinza com um padrão que lembra uma página de texto"""
+    pixels = _gray_pattern(width, height, seed)
+    raw = b"".join(b"\x00" + pixels[y * width:(y + 1) * width] for y in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+def docx_document(paragraphs: int = 40, seed: int = 0) -> bytes:
+    """DOCX mínimo (Office Open XML) com parágrafos, texto em negrito e uma tabela"""
+    rng = random.Random(seed)
+    body = ['<w:p><w:r><w:rPr><w:b/></w:rPr><w:t>Relatório de teste</w:t></w:r></w:p>']
+    for sentence in _sentences(rng, paragraphs):
+        body.append(f'<w:p><w:r><w:t xml:space="preserve">{escape(sentence)}</w:t></w:r></w:p>')
+    rows = []
+    for row in range(6):
+        cells = ["Item", "Quantidade", "Valor"] if row == 0 else [f"Item {row}", str(rng.randint(1, 99)), f"{rng.randint(100, 9999)},00"]
+        rows.append("<w:tr>" + "".join(f"<w:tc><w:p><w:r><w:t>{cell}</w:t></w:r></w:p></w:tc>" for cell in cells) + "</w:tr>")
+    body.append("<w:tbl>" + "".join(rows) + "</w:tbl>")
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{"".join(body)}</w:body></w:document>'
+    )
+    return _zip(
+        {
+            "[Content_Types].xml": (
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                '<Default Extension="xml" ContentType="application/xml"/>'
+                '<Override PartName="/word/document.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+                "</Types>"
+            ),
+            "_rels/.rels": _relationships(
+                [("rId1", "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument", "word/document.xml")]
+            ),
+            "word/_rels/document.xml.rels": _relationships([]),
+            "word/document.xml": document,
+        }
+    )
+
+
+def xlsx_workbook(rows: int = 500, seed: int = 0) -> bytes:
+    """XLSX mínimo com uma planilha de `rows` linhas (textos em inlineStr, valores numéricos)"""
+    rng = random.Random(seed)
+    header = ["Data", "Cliente", "Produto", "Quantidade", "Valor"]
+    sheet_rows = [
+        '<row r="1">' + "".join(
+            f'<c r="{chr(65 + col)}1" t="inlineStr"><is><t>{name}</t></is></c>' for col, name in enumerate(header)
+        ) + "</row>"
+    ]
+    for row in range(2, rows + 2):
+        values = [
+            f'<c r="A{row}" t="inlineStr"><is><t>2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}</t></is></c>',
+            f'<c r="B{row}" t="inlineStr"><is><t>Cliente {rng.randint(1, 200)}</t></is></c>',
+            f'<c r="C{row}" t="inlineStr"><is><t>{escape(rng.choice(_WORDS))}</t></is></c>',
+            f'<c r="D{row}"><v>{rng.randint(1, 50)}</v></c>',
+            f'<c r="E{row}"><v>{rng.randint(100, 99999) / 100}</v></c>',
+        ]
+        sheet_rows.append(f'<row r="{row}">' + "".join(values) + "</row>")
+    sheet = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        f'<sheetData>{"".join(sheet_rows)}</sheetData></worksheet>'
+    )
+    return _zip(
+        {
+            "[Content_Types].xml": (
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                '<Default Extension="xml" ContentType="application/xml"/>'
+                '<Override PartName="/xl/workbook.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                '<Override PartName="/xl/worksheets/sheet1.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                "</Types>"
+            ),
+            "_rels/.rels": _relationships(
+                [("rId1", "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument", "xl/workbook.xml")]
+            ),
+            "xl/workbook.xml": (
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                '<sheets><sheet name="Vendas" sheetId="1" r:id="rId1"/></sheets></workbook>'
+            ),
+            "xl/_rels/workbook.xml.rels": _relationships(
+                [("rId1", "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet", "worksheets/sheet1.xml")]
+            ),
+            "xl/worksheets/sheet1.xml": sheet,
+        }
+    )
+
+
+def html_page(sections: int = 10, seed: int = 0) -> bytes:
+    """Página HTML com navegação, títulos, parágrafos e uma tabela"""
+    rng = random.Random(seed)
+    parts = ["<!DOCTYPE html><html><head><meta charset='utf-8'><title>Relatório</title></head><body>"]
+    parts.append("<nav><a href='#'>Início</a> | <a href='#'>Contato</a></nav><main><h1>Relatório de teste</h1>")
+    for section in range(1, sections + 1):
+        parts.append(f"<h2>Seção {section}</h2>")
+        parts.extend(f"<p>{escape(sentence)}</p>" for sentence in _sentences(rng, 4))
+    parts.append("<table><tr><th>Item</th><th>Valor</th></tr>")
+    parts.extend(f"<tr><td>Item {row}</td><td>{rng.randint(100, 9999)},00</td></tr>" for row in range(1, 11))
+    parts.append("</table></main><footer>Rodapé</footer></body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def _relationships(relationships: Iterable[tuple]) -> str:
+    items = "".join(f'<Relationship Id="{rid}" Type="{kind}" Target="{target}"/>' for rid, kind, target in relationships)
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{items}</Relationships>'
+    )
+
+
+def _zip(files: Dict[str, str]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files.items():
+            # Data fixa para que o arquivo gerado seja idêntico em todas as execuções
+            archive.writestr(zipfile.ZipInfo(name, date_time=(2024, 1, 1, 0, 0, 0)), content)
+    return buffer.getvalue()
+
+
+def build_corpus(
+    output_dir: str,
+    kinds: Iterable[str] = KINDS,
+    pdf_pages: Iterable[int] = (1, 5, 20),
+    seed: int = 42,
+) -> List[Dict[str, str]]:
+    """
+    Grava o corpus em `output_dir`
+
+    Args:
+        output_dir: Diretório onde os arquivos são gravados
+        kinds: Tipos de documento a gerar (veja KINDS)
+        pdf_pages: Números de páginas dos PDFs
+        seed: Semente do conteúdo
+
+    Returns:
+        Lista de documentos com `name` (por exemplo "pdf-text-5p"), `kind`, `path` e `content_type`
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    documents = []
+
+    def add(name: str, kind: str, extension: str, content_type: str, data: bytes) -> None:
+        path = os.path.join(output_dir, f"{name}.{extension}")
+        with open(path, "wb") as f:
+            f.write(data)
+        documents.append({"name": name, "kind": kind, "path": path, "content_type": content_type})
+
+    for kind in kinds:
+        if kind == "pdf-text":
+            for pages in pdf_pages:
+                add(f"pdf-text-{pages}p", kind, "pdf", "application/pdf", text_pdf(pages, seed))
+        elif kind == "pdf-scan":
+            for pages in pdf_pages:
+                add(f"pdf-scan-{pages}p", kind, "pdf", "application/pdf", scanned_pdf(pages, seed))
+        elif kind == "docx":
+            add("docx", kind, "docx", DOCX_CONTENT_TYPE, docx_document(seed=seed))
+        elif kind == "xlsx":
+            add("xlsx", kind, "xlsx", XLSX_CONTENT_TYPE, xlsx_workbook(seed=seed))
+        elif kind == "png":
+            add("png", kind, "png", "image/png", png_image(seed=seed))
+        elif kind == "html":
+            add("html", kind, "html", "text/html", html_page(seed=seed))
+        else:
+            raise ValueError(f"Tipo de documento desconhecido: {kind}. Use um de: {', '.join(KINDS)}")
+    return documents
@@ -0,0 +1,309 @@
+"""
+Servidor LLM simulado para os benchmarks do Leitor Doc PyZerox
+Responde às rotas usadas pelos SDKs da OpenAI (`/v1/chat/completions`), da Anthropic (`/v1/messages`) e
+do Gemini via REST (`/v1beta/models/<modelo>:generateContent`), inclusive às chamadas de validação do
+zerox e da listagem de modelos do Gemini. Cada resposta espera uma latência configurável (com variação
+aleatória) e uma fração das chamadas falha com 429 ou 500, no formato de erro de cada provedor.
+
+Uso isolado: `python -m benchmarks.mock_llm --port 8765 --latency-ms 800 --jitter-ms 400 --error-rate 0.02`
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+# Modelos devolvidos na listagem do Gemini (o provedor confere se o modelo configurado existe)
+GEMINI_MODELS = ("gemini-1.0-pro", "gemini-1.5-pro", "gemini-1.5-flash", "gemini-2.0-flash")
+
+_GEMINI_GENERATE = re.compile(r"^/v1beta/models/(?P<model>[^/:]+):generateContent$")
+
+_MARKDOWN_WORDS = (
+    "documento contrato cliente valor prazo entrega tabela resumo pagamento cláusula item total "
+    "relatório período análise resultado receita despesa anexo página seção"
+).split()
+
+
+class MockLLMStats:
+    """Contagem de chamadas e erros injetados, por provedor"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+
+    def record(self, provider: str, error: bool) -> None:
+        with self._lock:
+            self._calls[provider] = self._calls.get(provider, 0) + 1
+            if error:
+                self._errors[provider] = self._errors.get(provider, 0) + 1
+
+    def snapshot(self, reset: bool = False) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            snapshot = {"calls": dict(self._calls), "errors": dict(self._errors)}
+            if reset:
+                self._calls.clear()
+                self._errors.clear()
+        return snapshot
+
+
+class MockLLMServer:
+    """
+    Servidor HTTP local que imita os provedores de IA
+
+    Args:
+        host: Endereço de escuta
+        port: Porta (0 escolhe uma porta livre)
+        latency_ms: Latência base de cada resposta
+        jitter_ms: Variação máxima somada à latência (uniforme entre 0 e `jitter_ms`)
+        error_rate: Fração das chamadas que falha (metade 429, metade 500)
+        response_words: Palavras do markdown devolvido em cada resposta
+        seed: Semente do gerador aleatório, para execuções reproduzíveis
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 800.0,
+        jitter_ms: float = 400.0,
+        error_rate: float = 0.0,
+        response_words: int = 300,
+        seed: Optional[int] = 42,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.response_words = response_words
+        self.stats = MockLLMStats()
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def env(self) -> Dict[str, str]:
+        """Variáveis de ambiente que apontam os SDKs e o litellm para este servidor"""
+        return {
+            "OPENAI_API_KEY": "sk-bench",
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+            "OPENAI_API_BASE": f"{self.url}/v1",
+            "ANTHROPIC_API_KEY": "sk-ant-bench",
+            "ANTHROPIC_BASE_URL": self.url,
+            "ANTHROPIC_API_BASE": self.url,
+            "GEMINI_API_KEY": "bench",
+            "GEMINI_API_BASE": self.url,
+            # O litellm baixa a tabela de modelos da internet se não for instruído a usar a cópia local
+            "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+            "LITELLM_TELEMETRY": "False",
+        }
+
+    def decide(self) -> Tuple[float, Optional[int]]:
+        """Sorteia a latência (em segundos) e o erro (status HTTP ou None) de uma chamada"""
+        with self._random_lock:
+            delay = (self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000
+            status = None
+            if self.error_rate and self._random.random() < self.error_rate:
+                status = 429 if self._random.random() < 0.5 else 500
+        return delay, status
+
+    def markdown(self, input_tokens: int) -> str:
+        """Markdown sintético devolvido pelas respostas"""
+        with self._random_lock:
+            words = [self._random.choice(_MARKDOWN_WORDS) for _ in range(self.response_words)]
+        lines = [f"# Página simulada ({input_tokens} tokens de entrada)", ""]
+        for start in range(0, len(words), 15):
+            lines.append(" ".join(words[start:start + 15]))
+        lines += ["", "| Item | Valor |", "| --- | --- |", "| total | 123,45 |"]
+        return "\n".join(lines)
+
+
+def _estimate_tokens(body: bytes) -> int:
+    return max(1, len(body) // 4)
+
+
+def _openai_response(server: MockLLMServer, payload: Dict[str, Any], body: bytes) -> Dict[str, Any]:
+    input_tokens = _estimate_tokens(body)
+    content = server.markdown(input_tokens)
+    output_tokens = _estimate_tokens(content.encode("utf-8"))
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get("model", "mock"),
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop", "logprobs": None}
+        ],
+        "usage": {"prompt_tokens": input_tokens, "completion_tokens": output_tokens, "total_tokens": input_tokens + output_tokens},
+    }
+
+
+def _anthropic_response(server: MockLLMServer, payload: Dict[str, Any], body: bytes) -> Dict[str, Any]:
+    input_tokens = _estimate_tokens(body)
+    content = server.markdown(input_tokens)
+    return {
+        "id": f"msg_{uuid.uuid4().hex}",
+        "type": "message",
+        "role": "assistant",
+        "model": payload.get("model", "mock"),
+        "content": [{"type": "text", "text": content}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": _estimate_tokens(content.encode("utf-8"))},
+    }
+
+
+def _gemini_response(server: MockLLMServer, model: str, body: bytes) -> Dict[str, Any]:
+    input_tokens = _estimate_tokens(body)
+    content = server.markdown(input_tokens)
+    output_tokens = _estimate_tokens(content.encode("utf-8"))
+    return {
+        "candidates": [{"content": {"parts": [{"text": content}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {
+            "promptTokenCount": input_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": input_tokens + output_tokens,
+        },
+        "modelVersion": model,
+    }
+
+
+def _error_body(provider: str, status: int) -> Dict[str, Any]:
+    message = "Rate limit exceeded (simulated)" if status == 429 else "Internal server error (simulated)"
+    if provider == "anthropic":
+        kind = "rate_limit_error" if status == 429 else "api_error"
+        return {"type": "error", "error": {"type": kind, "message": message}}
+    if provider == "gemini":
+        return {"error": {"code": status, "message": message, "status": "RESOURCE_EXHAUSTED" if status == 429 else "INTERNAL"}}
+    kind = "rate_limit_exceeded" if status == 429 else "server_error"
+    return {"error": {"message": message, "type": kind, "param": None, "code": kind}}
+
+
+def _make_handler(server: MockLLMServer) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            path = self.path.split("?", 1)[0]
+            if path == "/health":
+                self._send_json(200, {"status": "healthy"})
+            elif path == "/_stats":
+                self._send_json(200, server.stats.snapshot(reset="reset=true" in self.path))
+            elif path == "/v1/models":
+                self._send_json(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "mock"}]})
+            elif path == "/v1beta/models":
+                models = [
+                    {
+                        "name": f"models/{name}",
+                        "displayName": name,
+                        "version": "001",
+                        "inputTokenLimit": 1048576,
+                        "outputTokenLimit": 8192,
+                        "supportedGenerationMethods": ["generateContent", "countTokens"],
+                    }
+                    for name in GEMINI_MODELS
+                ]
+                self._send_json(200, {"models": models})
+            else:
+                self._send_json(404, {"error": {"message": f"Not found: {path}"}})
+
+        def do_POST(self) -> None:
+            path = self.path.split("?", 1)[0]
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            gemini = _GEMINI_GENERATE.match(path)
+            if path.endswith("/chat/completions"):
+                provider = "openai"
+            elif path.endswith("/messages"):
+                provider = "anthropic"
+            elif gemini:
+                provider = "gemini"
+            else:
+                self._send_json(404, {"error": {"message": f"Not found: {path}"}})
+                return
+
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                self._send_json(400, _error_body(provider, 400))
+                return
+
+            delay, status = server.decide()
+            server.stats.record(provider, status is not None)
+            time.sleep(delay)
+            if status is not None:
+                self._send_json(status, _error_body(provider, status), {"Retry-After": "1"})
+            elif provider == "openai":
+                self._send_json(200, _openai_response(server, payload, body))
+            elif provider == "anthropic":
+                self._send_json(200, _anthropic_response(server, payload, body))
+            else:
+                self._send_json(200, _gemini_response(server, gemini.group("model"), body))
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Servidor LLM simulado (OpenAI, Anthropic e Gemini)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument("--jitter-ms", type=float, default=400.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--response-words", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        host=args.host,
+        port=args.port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        response_words=args.response_words,
+        seed=args.seed,
+    ).start()
+    print(f"Servidor LLM simulado em {server.url}")
+    for name, value in server.env().items():
+        print(f"{name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+"""
+Execução dos benchmarks do Leitor Doc PyZerox
+Inicia o servidor LLM simulado, gera o corpus sintético e sobe a aplicação com o gunicorn apontando
+todos os provedores para o servidor simulado. Para cada combinação de provedor e documento, envia
+`--requests` conversões ao `/convert` com `--concurrency` requisições simultâneas (caches desativados
+com `cache=false`) e mede vazão, latências p50/p95/p99, pico de memória (RSS somado do master e dos
+workers) e CPU consumida. Os resultados são gravados em JSON; com `--compare`, cada fase é comparada com
+uma execução anterior e o processo termina com código 1 se houver regressão acima de `--threshold`.
+
+Exemplo:
+    python -m benchmarks.run --providers openai,gemini --requests 30 --concurrency 8 \\
+        --latency-ms 500 --jitter-ms 250 --error-rate 0.02 --output benchmarks/results/atual.json
+    python -m benchmarks.run --compare benchmarks/results/base.json --output benchmarks/results/novo.json
+
+Requer Linux (memória e CPU são lidas de /proc) e as dependências da aplicação (requirements.txt).
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.corpus import KINDS, build_corpus
+from benchmarks.mock_llm import MockLLMServer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Versão do formato do JSON de resultados
+RESULTS_VERSION = 1
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Percentil com interpolação linear entre as amostras vizinhas"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _process_tree(root_pid: int) -> List[int]:
+    """PIDs do processo e de todos os seus descendentes, lidos de /proc"""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # O nome do processo fica entre parênteses e pode conter espaços
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+
+    pids, pending = [], [root_pid]
+    while pending:
+        pid = pending.pop()
+        pids.append(pid)
+        pending.extend(children.get(pid, []))
+    return pids
+
+
+def sample_resources(root_pid: int) -> Tuple[float, float]:
+    """
+    Memória residente (bytes) e CPU acumulada (segundos) do processo e de seus descendentes
+
+    A CPU inclui a dos filhos já encerrados (cutime/cstime), para que workers reiniciados não sumam da conta.
+    """
+    rss = 0
+    cpu_ticks = 0
+    for pid in _process_tree(root_pid):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{pid}/statm") as f:
+                rss += int(f.read().split()[1]) * _PAGE_SIZE
+        except OSError:
+            continue
+        # Campos 14-17 de /proc/<pid>/stat (utime, stime, cutime, cstime), contando a partir do estado
+        cpu_ticks += sum(int(value) for value in fields[11:15])
+    return float(rss), cpu_ticks / _CLOCK_TICKS
+
+
+class ResourceSampler:
+    """Amostra memória e CPU do servidor em uma thread durante uma fase do benchmark"""
+
+    def __init__(self, root_pid: int, interval: float = 0.2):
+        self.root_pid = root_pid
+        self.interval = interval
+        self.peak_rss = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._cpu_started = 0.0
+        self.cpu_seconds = 0.0
+
+    def __enter__(self) -> "ResourceSampler":
+        rss, self._cpu_started = sample_resources(self.root_pid)
+        self.peak_rss = rss
+        self._thread = threading.Thread(target=self._run, name="bench-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            rss, _ = sample_resources(self.root_pid)
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+        rss, cpu = sample_resources(self.root_pid)
+        self.peak_rss = max(self.peak_rss, rss)
+        self.cpu_seconds = cpu - self._cpu_started
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(port: int, env: Dict[str, str], workers: int, threads: int, log_path: str) -> subprocess.Popen:
+    """Sobe a aplicação com o gunicorn e espera o /health responder"""
+    log = open(log_path, "ab")
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn",
+            "--bind", f"127.0.0.1:{port}",
+            "--workers", str(workers),
+            "--threads", str(threads),
+            "--timeout", "600",
+            "main:app",
+        ],
+        cwd=REPO_DIR,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    log.close()
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"A aplicação encerrou ao iniciar (código {process.returncode}); veja {log_path}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2):
+                return process
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"A aplicação não respondeu em 60s; veja {log_path}")
+
+
+def stop_app(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def _parse_server_timing(header: str) -> Dict[str, float]:
+    stages = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "dur":
+                try:
+                    stages[name] = float(value)
+                except ValueError:
+                    pass
+    return stages
+
+
+def send_request(url: str, data: bytes, content_type: str, timeout: float) -> Dict[str, Any]:
+    """Envia uma conversão e retorna status, latência e os tempos do cabeçalho Server-Timing"""
+    request = urllib.request.Request(url, data=data, method="POST", headers={"Content-Type": content_type})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+            server_timing = response.headers.get("Server-Timing", "")
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+        server_timing = e.headers.get("Server-Timing", "")
+    except OSError as e:
+        return {"status": 0, "latency": time.perf_counter() - started, "stages": {}, "error": str(e)}
+    return {"status": status, "latency": time.perf_counter() - started, "stages": _parse_server_timing(server_timing)}
+
+
+def run_phase(
+    base_url: str,
+    app_pid: int,
+    mock: MockLLMServer,
+    provider: str,
+    document: Dict[str, str],
+    requests: int,
+    concurrency: int,
+    warmup: int,
+    timeout: float,
+) -> Dict[str, Any]:
+    """Executa as requisições de uma combinação provedor/documento e resume as medições"""
+    with open(document["path"], "rb") as f:
+        data = f.read()
+    url = f"{base_url}/convert?ai_provider={provider}&cache=false"
+
+    for _ in range(warmup):
+        send_request(url, data, document["content_type"], timeout)
+    mock.stats.snapshot(reset=True)
+
+    with ResourceSampler(app_pid) as sampler, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        results = list(executor.map(lambda _: send_request(url, data, document["content_type"], timeout), range(requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies = [result["latency"] * 1000 for result in results if result["status"] == 200]
+    statuses: Dict[str, int] = {}
+    for result in results:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+    stage_totals: Dict[str, List[float]] = {}
+    for result in results:
+        for name, duration in result["stages"].items():
+            stage_totals.setdefault(name, []).append(duration)
+    llm = mock.stats.snapshot(reset=True)
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value, 1) if value is not None else None
+
+    return {
+        "provider": provider,
+        "document": document["name"],
+        "kind": document["kind"],
+        "bytes": len(data),
+        "requests": requests,
+        "concurrency": concurrency,
+        "succeeded": len(latencies),
+        "statuses": statuses,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 0.50)),
+            "p95": ms(percentile(latencies, 0.95)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "mean": ms(sum(latencies) / len(latencies)) if latencies else None,
+            "max": ms(max(latencies)) if latencies else None,
+        },
+        # Média por requisição de cada etapa informada no Server-Timing
+        "stages_ms": {name: round(sum(values) / len(values), 1) for name, values in sorted(stage_totals.items())},
+        "peak_rss_mb": round(sampler.peak_rss / (1024 * 1024), 1),
+        "cpu_s": round(sampler.cpu_seconds, 2),
+        "cpu_percent": round(sampler.cpu_seconds / elapsed * 100, 1) if elapsed else 0.0,
+        "llm_calls": llm["calls"],
+        "llm_injected_errors": llm["errors"],
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Compara as fases em comum com uma execução anterior
+
+    Returns:
+        Descrição das regressões: p95 maior ou vazão menor que a base por mais de `threshold`
+    """
+    base = {(phase["provider"], phase["document"]): phase for phase in baseline.get("results", [])}
+    regressions = []
+    print(f"\n{'fase':<32} {'p95 base':>10} {'p95 atual':>10} {'rps base':>9} {'rps atual':>9}")
+    for phase in current["results"]:
+        key = (phase["provider"], phase["document"])
+        previous = base.get(key)
+        if previous is None:
+            continue
+        name = f"{phase['provider']}/{phase['document']}"
+        p95, base_p95 = phase["latency_ms"]["p95"], previous["latency_ms"]["p95"]
+        rps, base_rps = phase["throughput_rps"], previous["throughput_rps"]
+        print(f"{name:<32} {base_p95 or '-':>10} {p95 or '-':>10} {base_rps:>9} {rps:>9}")
+        if p95 is not None and base_p95 and p95 > base_p95 * (1 + threshold):
+            regressions.append(f"{name}: p95 {base_p95} ms -> {p95} ms")
+        if base_rps and rps < base_rps * (1 - threshold):
+            regressions.append(f"{name}: vazão {base_rps} -> {rps} req/s")
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark offline do /convert com provedores simulados")
+    parser.add_argument("--providers", default="openai,anthropic,gemini", help="Provedores, separados por vírgula")
+    parser.add_argument("--kinds", default=",".join(KINDS), help=f"Tipos de documento ({', '.join(KINDS)})")
+    parser.add_argument("--pdf-pages", default="1,5,20", help="Números de páginas dos PDFs gerados")
+    parser.add_argument("--requests", type=int, default=20, help="Requisições medidas por fase")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requisições simultâneas")
+    parser.add_argument("--warmup", type=int, default=1, help="Requisições não medidas antes de cada fase")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Tempo máximo (s) de cada requisição")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Latência base do LLM simulado")
+    parser.add_argument("--jitter-ms", type=float, default=400.0, help="Variação máxima somada à latência")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração das chamadas ao LLM que falha (429/500)")
+    parser.add_argument("--response-words", type=int, default=300, help="Tamanho das respostas do LLM simulado")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=2, help="Workers do gunicorn")
+    parser.add_argument("--threads", type=int, default=16, help="Threads por worker do gunicorn")
+    parser.add_argument("--output", default=None, help="Arquivo JSON de resultados (padrão: benchmarks/results/<data>.json)")
+    parser.add_argument("--compare", default=None, help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Piora tolerada na comparação (0.10 = 10%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    providers = [provider.strip() for provider in args.providers.split(",") if provider.strip()]
+    kinds = [kind.strip() for kind in args.kinds.split(",") if kind.strip()]
+    pdf_pages = [int(pages) for pages in args.pdf_pages.split(",") if pages.strip()]
+    output = args.output or os.path.join(REPO_DIR, "benchmarks", "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+
+    with tempfile.TemporaryDirectory(prefix="leitor-bench-") as work_dir:
+        documents = build_corpus(os.path.join(work_dir, "corpus"), kinds, pdf_pages, seed=args.seed)
+        mock = MockLLMServer(
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate,
+            response_words=args.response_words,
+            seed=args.seed,
+        ).start()
+
+        # A aplicação grava caches, jobs, diretórios de trabalho e métricas no diretório temporário
+        metrics_dir = os.path.join(work_dir, "prometheus")
+        os.makedirs(metrics_dir)
+        env = {
+            **os.environ,
+            **mock.env(),
+            "RESULT_CACHE_DIR": os.path.join(work_dir, "cache"),
+            "PAGE_CACHE_DIR": os.path.join(work_dir, "cache"),
+            "WORKSPACE_DIR": os.path.join(work_dir, "work"),
+            "JOB_DIR": os.path.join(work_dir, "jobs"),
+            "PROMETHEUS_MULTIPROC_DIR": metrics_dir,
+            "PROVIDER_WARMUP": ",".join(providers),
+            "PYTHONUNBUFFERED": "1",
+        }
+        port = _free_port()
+        log_path = os.path.join(os.path.dirname(output), "server.log")
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        print(f"LLM simulado em {mock.url}; iniciando a aplicação na porta {port} (log em {log_path})")
+
+        app = start_app(port, env, args.workers, args.threads, log_path)
+        results = []
+        try:
+            for provider in providers:
+                for document in documents:
+                    phase = run_phase(
+                        f"http://127.0.0.1:{port}",
+                        app.pid,
+                        mock,
+                        provider,
+                        document,
+                        requests=args.requests,
+                        concurrency=args.concurrency,
+                        warmup=args.warmup,
+                        timeout=args.timeout,
+                    )
+                    results.append(phase)
+                    latency = phase["latency_ms"]
+                    print(
+                        f"{provider:<10} {document['name']:<14} ok {phase['succeeded']}/{phase['requests']}  "
+                        f"{phase['throughput_rps']:.2f} req/s  p50 {latency['p50']} p95 {latency['p95']} "
+                        f"p99 {latency['p99']} ms  rss {phase['peak_rss_mb']} MB  cpu {phase['cpu_percent']}%"
+                    )
+        finally:
+            stop_app(app)
+            mock.stop()
+
+    report = {
+        "version": RESULTS_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print("\nRegressões encontradas:")
+            for regression in regressions:
+                print(f"- {regression}")
+            return 1
+        print("\nNenhuma regressão acima do limite")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+Cache de resultados para o Leitor Doc PyZerox
+Este módulo guarda conversões já realizadas, indexadas pelo hash do arquivo enviado e pelos
+parâmetros que influenciam o resultado (provedor, modelo, OCR e prompt).
+
+São dois níveis:
+- memória: LRU limitado por número de itens e bytes, próprio de cada worker do gunicorn;
+- disco: arquivos JSON em `uploads/cache`, compartilhados por todos os workers do contêiner.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from metrics import CACHE_LOOKUPS
+
+# Versão do formato das entradas; altere para invalidar todo o cache existente
+CACHE_VERSION = 1
+
+
+def hash_bytes(data: bytes) -> str:
+    """Retorna o SHA-256 (hex) de um conteúdo em memória"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_cache_key(file_hash: str, ai_provider: str, model: str, use_ocr: bool, prompt: str, **options: Any) -> str:
+    """
+    Monta a chave de cache de uma conversão
+
+    Args:
+        file_hash: SHA-256 do arquivo enviado
+        ai_provider: Provedor de IA usado
+        model: Modelo resolvido para o provedor
+        use_ocr: Se o OCR foi solicitado
+        prompt: Prompt específico do formato
+        options: Outros parâmetros que alteram o resultado
+
+    Returns:
+        Chave hexadecimal estável para os parâmetros informados
+    """
+    payload = json.dumps(
+        [CACHE_VERSION, file_hash, ai_provider, model, bool(use_ocr), prompt, options],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Cache em dois níveis (memória LRU + disco compartilhado) para resultados em JSON"""
+
+    def __init__(
+        self,
+        max_items: int = 256,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: int = 86400,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 1024 * 1024 * 1024,
+        name: str = "results",
+    ):
+        self.name = name
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._bytes = 0
+        # Estimativa do tamanho em disco; recalculada a cada varredura de eviction
+        self._disk_bytes: Optional[int] = None
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, prefix: str = "RESULT_CACHE", subdir: str = "results") -> "ResultCache":
+        """Cria o cache a partir das variáveis de ambiente `<prefix>_*`"""
+        disk_enabled = os.getenv(f"{prefix}_DISK", "true").lower() == "true"
+        base_dir = os.getenv(f"{prefix}_DIR", os.path.join("uploads", "cache"))
+        return cls(
+            max_items=int(os.getenv(f"{prefix}_MAX_ITEMS", "256")),
+            max_bytes=int(os.getenv(f"{prefix}_MAX_MB", "64")) * 1024 * 1024,
+            ttl=int(os.getenv(f"{prefix}_TTL", "86400")),
+            disk_dir=os.path.join(base_dir, subdir) if disk_enabled else None,
+            disk_max_bytes=int(os.getenv(f"{prefix}_DISK_MAX_MB", "1024")) * 1024 * 1024,
+            name=subdir,
+        )
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        Busca um resultado no cache
+
+        Returns:
+            Tupla (valor, nível) onde nível é "memory", "disk" ou "" quando não encontrado
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, size, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    CACHE_LOOKUPS.labels(cache=self.name, result="hit_memory").inc()
+                    return value, "memory"
+                self._remove(key)
+
+        value = self._disk_get(key, now)
+        if value is not None:
+            self._memory_set(key, value, now)
+            CACHE_LOOKUPS.labels(cache=self.name, result="hit_disk").inc()
+            return value, "disk"
+        CACHE_LOOKUPS.labels(cache=self.name, result="miss").inc()
+        return None, ""
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Guarda um resultado nos dois níveis do cache"""
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        self._memory_set(key, value, now, size=len(data))
+        self._disk_set(key, data)
+
+    def clear(self) -> None:
+        """Remove todas as entradas em memória (o disco expira por TTL/tamanho)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # Nível em memória
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _memory_set(self, key: str, value: Dict[str, Any], now: float, size: Optional[int] = None) -> None:
+        if size is None:
+            size = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        if size > self.max_bytes or self.max_items <= 0:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (now + self.ttl, size, value)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_items or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    # Nível em disco
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_get(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        if not self.disk_dir:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            stat = os.stat(path)
+            if stat.st_mtime + self.ttl <= now:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                value = json.loads(f.read())
+            # Atualiza o atime manualmente para servir de referência à eviction LRU
+            os.utime(path, (now, stat.st_mtime))
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def _disk_set(self, key: str, data: bytes) -> None:
+        if not self.disk_dir or len(data) > self.disk_max_bytes:
+            return
+
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Escrita atômica: outros workers nunca leem um arquivo pela metade
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Aviso: não foi possível gravar o cache em disco: {str(e)}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(data)
+            needs_eviction = self._disk_bytes is None or self._disk_bytes > self.disk_max_bytes
+        if needs_eviction:
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        """Remove entradas expiradas e, se preciso, as menos acessadas até caber no limite"""
+        now = time.time()
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith(".tmp"):
+                    # Restos de escritas interrompidas
+                    if stat.st_mtime + 3600 < now:
+                        self._unlink(path)
+                    continue
+                if stat.st_mtime + self.ttl <= now:
+                    self._unlink(path)
+                    continue
+                files.append((stat.st_atime, stat.st_size, path))
+                total += stat.st_size
+
+        if total > self.disk_max_bytes:
+            # Libera até 90% do limite para não varrer o diretório a cada escrita
+            target = int(self.disk_max_bytes * 0.9)
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                if self._unlink(path):
+                    total -= size
+
+        with self._lock:
+            self._disk_bytes = total
+
+    @staticmethod
+    def _unlink(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
@@ -0,0 +1,178 @@
+"""
+Divisão de documentos longos em trechos para os provedores somente texto do Leitor Doc PyZerox
+Gemini, Anthropic e Llama local recebem o texto extraído do documento. Em vez de enviar o documento
+inteiro em um único prompt (que é truncado ou estoura o contexto do modelo), o texto é dividido por
+página e por seção em trechos que cabem no orçamento de tokens do provedor, os trechos são enviados
+em paralelo e o markdown retornado é reunido na ordem original.
+
+Títulos nunca ficam no fim de um trecho (vão para o trecho seguinte, junto do conteúdo) e tabelas
+grandes são divididas por linhas, repetindo o cabeçalho em cada parte; ao reunir as respostas, o
+cabeçalho repetido é removido para que a tabela continue única.
+"""
+import asyncio
+import re
+from collections import deque
+from typing import Awaitable, Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+
+# Linha de tabela em markdown, ou linha com várias colunas separadas por tabulação/espaços (texto de PDF)
+_TABLE_LINE = re.compile(r"^\s*\|.*\|\s*$|\S(\t| {3,})\S.*(\t| {3,})\S")
+_TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$")
+_HEADING = re.compile(r"^\s*#{1,6}\s+\S|^[A-Z0-9ÀÁÂÃÇÉÊÍÓÔÕÚ][A-Z0-9ÀÁÂÃÇÉÊÍÓÔÕÚ .,:;/()-]{2,79}$")
+
+# Bloco de texto: (tipo, linhas), com tipo "heading", "table" ou "text"
+Block = Tuple[str, List[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa de tokens (cerca de 4 caracteres por token), sem depender do tokenizador do modelo"""
+    return len(text) // 4 + 1
+
+
+def split_blocks(text: str) -> Iterator[Block]:
+    """Divide o texto de uma página em títulos, tabelas e parágrafos"""
+    kind: Optional[str] = None
+    lines: List[str] = []
+    for line in text.splitlines():
+        if not line.strip():
+            if lines:
+                yield kind, lines
+            kind, lines = None, []
+            continue
+
+        if _HEADING.match(line) and not _TABLE_LINE.search(line):
+            line_kind = "heading"
+        elif _TABLE_LINE.search(line) or (kind == "table" and _TABLE_SEPARATOR.match(line)):
+            line_kind = "table"
+        else:
+            line_kind = "text"
+
+        if lines and (line_kind != kind or line_kind == "heading"):
+            yield kind, lines
+            lines = []
+        kind = line_kind
+        lines.append(line)
+    if lines:
+        yield kind, lines
+
+
+def _table_header(lines: List[str]) -> List[str]:
+    """Cabeçalho de uma tabela: a primeira linha e, em markdown, a linha separadora"""
+    if len(lines) > 1 and _TABLE_SEPARATOR.match(lines[1]):
+        return lines[:2]
+    return lines[:1]
+
+
+def split_oversized(block: Block, budget: int) -> Iterator[Block]:
+    """Divide um bloco maior que o orçamento; tabelas são divididas por linhas, repetindo o cabeçalho"""
+    kind, lines = block
+    if estimate_tokens("\n".join(lines)) <= budget:
+        yield block
+        return
+
+    header = _table_header(lines) if kind == "table" else []
+    rows = lines[len(header):]
+    part: List[str] = []
+    size = estimate_tokens("\n".join(header))
+    for row in rows:
+        # Uma única linha maior que o orçamento é cortada em pedaços de tamanho fixo
+        pieces = [row[i:i + budget * 4] for i in range(0, len(row), budget * 4)] or [row]
+        for piece in pieces:
+            tokens = estimate_tokens(piece)
+            if part and size + tokens > budget:
+                yield kind, header + part
+                part, size = [], estimate_tokens("\n".join(header))
+            part.append(piece)
+            size += tokens
+    if part:
+        yield kind, header + part
+
+
+def iter_chunks(pages: Iterable[str], budget: int) -> Iterator[str]:
+    """
+    Agrupa o texto das páginas em trechos de até `budget` tokens (estimados)
+
+    As páginas são consumidas sob demanda, então o documento nunca precisa estar inteiro em memória.
+    """
+    current: List[Block] = []
+    size = 0
+
+    def render(blocks: List[Block]) -> str:
+        return "\n\n".join("\n".join(lines) for _, lines in blocks)
+
+    for page in pages:
+        for block in split_blocks(page):
+            for piece in split_oversized(block, budget):
+                tokens = estimate_tokens("\n".join(piece[1])) + 1
+                if current and size + tokens > budget:
+                    # Títulos no fim do trecho vão para o próximo, junto do conteúdo que introduzem
+                    carry: List[Block] = []
+                    while current and current[-1][0] == "heading":
+                        carry.insert(0, current.pop())
+                    if current:
+                        yield render(current)
+                    current = carry
+                    size = sum(estimate_tokens("\n".join(lines)) + 1 for _, lines in current)
+                current.append(piece)
+                size += tokens
+    if current:
+        yield render(current)
+
+
+def stitch(parts: List[str]) -> str:
+    """
+    Reúne o markdown dos trechos, na ordem
+
+    Quando um trecho termina em uma tabela e o seguinte começa com o mesmo cabeçalho (tabela dividida
+    entre trechos), o cabeçalho repetido é removido e as linhas continuam a mesma tabela.
+    """
+    output: List[str] = []
+    for part in parts:
+        part = part.strip()
+        if not part:
+            continue
+        if output:
+            previous = output[-1].splitlines()
+            current = part.splitlines()
+            # Cabeçalho da tabela no fim do trecho anterior
+            start = len(previous)
+            while start > 0 and previous[start - 1].strip().startswith("|"):
+                start -= 1
+            if start < len(previous) and current and current[0].strip().startswith("|"):
+                header = _table_header(previous[start:])
+                if [line.strip() for line in current[:len(header)]] == [line.strip() for line in header]:
+                    output[-1] = "\n".join(previous + current[len(header):])
+                    continue
+        output.append(part)
+    return "\n\n".join(output)
+
+
+async def process_chunks(
+    chunks: Iterable[str],
+    handler: Callable[[str], Awaitable[str]],
+    concurrency: int = 4,
+) -> str:
+    """
+    Envia os trechos ao modelo em paralelo e reúne as respostas na ordem original
+
+    No máximo `concurrency` trechos ficam em andamento; o próximo trecho só é gerado (e o texto
+    correspondente lido do documento) quando o mais antigo termina, o que mantém a memória limitada.
+    A leitura dos trechos é feita no pool de threads, porque pode envolver a extração do PDF.
+    """
+    iterator = iter(chunks)
+    pending: Deque[asyncio.Future] = deque()
+    outputs: List[str] = []
+    try:
+        while True:
+            chunk = await asyncio.to_thread(next, iterator, None)
+            if chunk is None:
+                break
+            pending.append(asyncio.ensure_future(handler(chunk)))
+            if len(pending) >= max(concurrency, 1):
+                outputs.append(await pending.popleft())
+        while pending:
+            outputs.append(await pending.popleft())
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    return stitch(outputs)
@@ -0,0 +1,275 @@
+"""
+Concorrência de páginas do OCR para o Leitor Doc PyZerox
+Define quantas páginas são enviadas ao modelo de visão ao mesmo tempo. O valor inicial vem da
+configuração (por provedor e por modelo) e pode ser sobrescrito por requisição. No modo adaptativo,
+o limite de cada provedor/modelo cresce enquanto as respostas chegam sem erro e cai pela metade ao
+receber 429 ou 5xx. Um limite global, compartilhado por todas as requisições do worker (inclusive as
+threads da fila de jobs), impede que conversões simultâneas sobrecarreguem o provedor.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+
+def error_status(exc: BaseException) -> Optional[int]:
+    """
+    Retorna o status HTTP associado a um erro do provedor, se houver
+
+    O zerox relança os erros do litellm como `Exception` genérica, então a cadeia de exceções
+    é percorrida até encontrar um `status_code` (ou o `code` HTTP dos erros do SDK do Google).
+    """
+    seen = set()
+    current: Optional[BaseException] = exc
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        status = getattr(current, "status_code", None)
+        if isinstance(status, int):
+            return status
+        code = getattr(current, "code", None)
+        if isinstance(code, int) and 100 <= code < 600:
+            return code
+        current = current.__cause__ or current.__context__
+    message = str(exc).lower()
+    if "ratelimit" in message or "rate limit" in message or "429" in message:
+        return 429
+    return None
+
+
+class AdaptiveLimit:
+    """
+    Limite de chamadas simultâneas compartilhado entre threads e event loops
+
+    Todas as conversões de um worker rodam no event loop compartilhado (`runtime.py`), mas o limite não
+    supõe um único loop nem uma única thread: o estado fica sob um lock e quem espera recebe um future do
+    seu próprio loop, liberado com `call_soon_threadsafe` por quem devolve a vaga.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        max_limit: Optional[int] = None,
+        min_limit: int = 1,
+        adaptive: bool = False,
+        decrease_factor: float = 0.5,
+        cooldown: float = 5.0,
+    ):
+        self.limit = float(max(limit, min_limit))
+        self.max_limit = max(max_limit or limit, min_limit)
+        self.min_limit = min_limit
+        self.adaptive = adaptive
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.throttled = 0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._lock = threading.Lock()
+        self._last_decrease = 0.0
+
+    async def acquire(self) -> None:
+        """Espera até haver uma vaga"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            future = loop.create_future()
+            waiter = (loop, future)
+            self._waiters.append(waiter)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # A vaga já foi concedida; se o future não foi cancelado a tempo, devolve aqui
+            # (caso contrário `_grant` devolve ao ver o future cancelado)
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Devolve uma vaga e acorda o próximo da fila"""
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def record(self, status: Optional[int] = None) -> None:
+        """
+        Ajusta o limite (modo adaptativo) a partir do resultado de uma chamada
+
+        Sucesso aumenta o limite em 1/limite (cerca de +1 a cada `limite` chamadas); 429 ou 5xx
+        multiplicam o limite por `decrease_factor`, no máximo uma vez por `cooldown` segundos.
+        """
+        if not self.adaptive:
+            return
+        with self._lock:
+            if status is not None and (status == 429 or status >= 500):
+                self.throttled += 1
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+                    print(f"Limite de páginas simultâneas reduzido para {int(self.limit)} (status {status})")
+                return
+            if status is None:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+                self._wake()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiters),
+                "throttled": self.throttled,
+            }
+
+    def _wake(self) -> None:
+        # Chamado com o lock adquirido
+        while self._waiters and self.in_flight < int(self.limit):
+            loop, future = self._waiters.popleft()
+            self.in_flight += 1
+            try:
+                loop.call_soon_threadsafe(self._grant, future)
+            except RuntimeError:
+                # Loop já encerrado: ninguém vai usar a vaga
+                self.in_flight -= 1
+
+    def _grant(self, future: asyncio.Future) -> None:
+        if future.done():
+            self.release()
+        else:
+            future.set_result(None)
+
+
+class PageConcurrency:
+    """Limites de páginas simultâneas por provedor/modelo, com um teto global por worker"""
+
+    def __init__(
+        self,
+        default: int = 3,
+        max_limit: int = 16,
+        global_limit: int = 32,
+        adaptive: bool = False,
+        providers: Optional[Dict[str, int]] = None,
+        models: Optional[Dict[str, int]] = None,
+    ):
+        self.default = default
+        self.max_limit = max_limit
+        self.adaptive = adaptive
+        self.providers = providers or {}
+        self.models = models or {}
+        self.global_limit = AdaptiveLimit(global_limit)
+        self._limits: Dict[Tuple[str, str], AdaptiveLimit] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "PageConcurrency":
+        """
+        Cria os limites a partir das variáveis de ambiente `OCR_CONCURRENCY*`
+
+        `OCR_CONCURRENCY_<PROVEDOR>` (por exemplo `OCR_CONCURRENCY_OPENAI=8`) define o valor de um
+        provedor e `OCR_CONCURRENCY_MODELS` (por exemplo `gpt-4o-mini=8,gpt-4o=4`) o de modelos específicos.
+        """
+        providers = {}
+        for provider in ("openai", "gemini", "anthropic", "llama_local"):
+            value = os.getenv(f"OCR_CONCURRENCY_{provider.upper()}")
+            if value:
+                providers[provider] = int(value)
+
+        models = {}
+        for item in os.getenv("OCR_CONCURRENCY_MODELS", "").split(","):
+            if "=" in item:
+                model, value = item.rsplit("=", 1)
+                models[model.strip()] = int(value)
+
+        return cls(
+            default=int(os.getenv("OCR_CONCURRENCY", "3")),
+            max_limit=int(os.getenv("OCR_CONCURRENCY_MAX", "16")),
+            global_limit=int(os.getenv("OCR_CONCURRENCY_GLOBAL", "32")),
+            adaptive=os.getenv("OCR_CONCURRENCY_ADAPTIVE", "false").lower() == "true",
+            providers=providers,
+            models=models,
+        )
+
+    def configured(self, ai_provider: str, model: str) -> int:
+        """Valor configurado para o modelo, o provedor ou o padrão, nessa ordem"""
+        return self.models.get(model) or self.providers.get(ai_provider) or self.default
+
+    def resolve(self, ai_provider: str, model: str, requested: Optional[int] = None) -> int:
+        """
+        Número máximo de páginas simultâneas de uma requisição
+
+        Um valor pedido na requisição é respeitado até `max_limit`. No modo adaptativo, sem valor
+        pedido, a requisição pode usar até `max_limit` e quem decide o ritmo é o limite do provedor.
+        """
+        if requested:
+            return max(1, min(requested, self.max_limit))
+        if self.adaptive:
+            return self.max_limit
+        return min(self.configured(ai_provider, model), self.max_limit)
+
+    def limit(self, ai_provider: str, model: str) -> AdaptiveLimit:
+        """Limite compartilhado do provedor/modelo (criado no primeiro uso)"""
+        key = (ai_provider, model)
+        with self._lock:
+            if key not in self._limits:
+                initial = min(self.configured(ai_provider, model), self.max_limit)
+                # Fora do modo adaptativo o limite do provedor só existe como teto (max_limit)
+                self._limits[key] = AdaptiveLimit(
+                    initial if self.adaptive else self.max_limit,
+                    max_limit=self.max_limit,
+                    adaptive=self.adaptive,
+                )
+            return self._limits[key]
+
+    @asynccontextmanager
+    async def slot(self, ai_provider: str, model: str) -> AsyncIterator["PageSlot"]:
+        """Reserva uma vaga no limite do provedor/modelo e no limite global do worker"""
+        limit = self.limit(ai_provider, model)
+        await limit.acquire()
+        try:
+            await self.global_limit.acquire()
+        except BaseException:
+            limit.release()
+            raise
+
+        slot = PageSlot()
+        try:
+            yield slot
+        finally:
+            self.global_limit.release()
+            limit.release()
+            if not slot.cancelled:
+                limit.record(slot.status)
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado atual dos limites, para diagnóstico"""
+        with self._lock:
+            limits = dict(self._limits)
+        return {
+            "adaptive": self.adaptive,
+            "global": self.global_limit.stats(),
+            "providers": {f"{provider}/{model}": limit.stats() for (provider, model), limit in limits.items()},
+        }
+
+
+class PageSlot:
+    """Vaga reservada para uma chamada; registra o resultado para o ajuste adaptativo"""
+
+    def __init__(self):
+        self.status: Optional[int] = None
+        self.cancelled = False
+
+    def failed(self, exc: BaseException) -> None:
+        """Marca a chamada como falha, guardando o status HTTP do erro (0 se desconhecido)"""
+        if isinstance(exc, asyncio.CancelledError):
+            self.cancelled = True
+            return
+        self.status = error_status(exc) or 0
@@ -0,0 +1,106 @@
+"""
+Configuração do gunicorn para o Leitor Doc PyZerox
+Carregada automaticamente pelo gunicorn a partir do diretório de trabalho; as opções passadas na
+linha de comando (bind, workers, threads, timeout) continuam tendo prioridade.
+Com `--threads` maior que 1 o gunicorn usa workers `gthread`: cada requisição ocupa uma thread
+que só espera a conversão, executada no event loop compartilhado do worker (veja runtime.py).
+Com GUNICORN_PRELOAD=true a aplicação é carregada uma vez no master e os workers a herdam no fork,
+compartilhando as páginas de memória do código importado (copy-on-write).
+"""
+import gc
+import os
+import shutil
+import subprocess
+import sys
+
+# Carrega a aplicação no master antes do fork (o mesmo que --preload na linha de comando)
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() == "true"
+
+# Processo do serviço local do Llama (LLAMA_SERVER_ENABLED=true), iniciado pelo processo mestre
+llama_server_process = None
+
+
+def on_starting(server):
+    """
+    Limpa as métricas de execuções anteriores em PROMETHEUS_MULTIPROC_DIR antes de iniciar os workers
+    e inicia o serviço local do Llama, compartilhado por todos os workers
+    """
+    global llama_server_process
+
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+    if os.getenv("LLAMA_SERVER_ENABLED", "false").lower() == "true" and os.getenv("LLAMA_SERVER_AUTOSTART", "true").lower() == "true":
+        # Os workers esperam o modelo carregar: até lá as chamadas falham com 503 e são tentadas de novo
+        llama_server_process = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "llama_server.py")]
+        )
+
+
+def when_ready(server):
+    """
+    Com a aplicação pré-carregada, importa no master os módulos de PRELOAD_MODULES e congela os objetos
+    já criados, para que o coletor de lixo dos workers não escreva neles e desfaça o compartilhamento
+
+    Só módulos são importados aqui: clientes, conexões, threads e o event loop são criados em cada
+    worker, no primeiro uso.
+    """
+    if not preload_app:
+        return
+    from startup import lazy_import
+
+    for name in os.getenv("PRELOAD_MODULES", "").split(","):
+        name = name.strip()
+        if not name:
+            continue
+        try:
+            lazy_import(name)
+        except Exception as e:
+            print(f"Aviso: não foi possível pré-carregar o módulo {name}: {str(e)}")
+    gc.collect()
+    gc.freeze()
+
+
+def on_exit(server):
+    """Encerra o serviço local do Llama junto com o gunicorn"""
+    if llama_server_process is not None and llama_server_process.poll() is None:
+        llama_server_process.terminate()
+        try:
+            llama_server_process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            llama_server_process.kill()
+
+
+def post_worker_init(worker):
+    """Pré-carrega os provedores listados em PROVIDER_WARMUP e inicia as threads da fila de jobs"""
+    from ai_providers import provider_registry
+    from main import job_queue
+    from startup import mark
+
+    provider_registry.warmup(os.getenv("PROVIDER_WARMUP", "").split(","))
+    job_queue.start()
+    mark("worker_ready")
+
+
+def worker_exit(server, worker):
+    """Fecha clientes, libera modelos locais e encerra o event loop e o pool de renderização quando o worker é encerrado"""
+    from ai_providers import provider_registry
+    from main import async_runtime, job_queue, render_pool
+
+    job_queue.stop()
+    provider_registry.shutdown()
+    async_runtime.shutdown()
+    render_pool.shutdown()
+
+
+def child_exit(server, worker):
+    """Descarta os gauges do worker encerrado, para que não sejam somados em /metrics"""
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,181 @@
+"""
+Preparação das imagens enviadas aos provedores de IA do Leitor Doc PyZerox
+Cada imagem é lida do disco uma única vez, tem o tipo real identificado pelo conteúdo (e não pela
+extensão), é reduzida só quando passa do limite do provedor e tem o base64 calculado uma única vez.
+O resultado fica em um cache LRU do worker, então novas tentativas, hedging e failover de uma mesma
+página reaproveitam os bytes já codificados em vez de ler e codificar o arquivo de novo.
+"""
+import base64
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Limites de cada provedor: (maior lado em pixels, bytes por imagem); None = sem limite
+PROVIDER_IMAGE_LIMITS: Dict[str, Tuple[Optional[int], Optional[int]]] = {
+    "openai": (2048, 20 * 1024 * 1024),
+    "anthropic": (1568, 5 * 1024 * 1024),
+    "gemini": (3072, 20 * 1024 * 1024),
+}
+
+# Formatos que o Pillow grava sem perda de compatibilidade com as APIs; os demais viram PNG
+_SAVE_FORMATS = {"image/png": "PNG", "image/jpeg": "JPEG", "image/webp": "WEBP"}
+
+
+def detect_mime_type(data: bytes) -> Optional[str]:
+    """Tipo da imagem pela assinatura dos primeiros bytes (PNG, JPEG, GIF ou WebP)"""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def image_limits(provider: str) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Limites de imagem de um provedor, ajustáveis por `IMAGE_MAX_DIM_<PROVEDOR>`
+
+    Com `IMAGE_MAX_DIM_<PROVEDOR>=0` as imagens não são reduzidas por dimensão.
+    """
+    max_dim, max_bytes = PROVIDER_IMAGE_LIMITS.get(provider, (None, None))
+    value = os.getenv(f"IMAGE_MAX_DIM_{provider.upper()}")
+    if value:
+        max_dim = int(value) or None
+    return max_dim, max_bytes
+
+
+class PreparedImage:
+    """Imagem pronta para envio: bytes, tipo real e base64 calculado sob demanda (uma única vez)"""
+
+    __slots__ = ("data", "mime_type", "_base64")
+
+    def __init__(self, data: bytes, mime_type: str):
+        self.data = data
+        self.mime_type = mime_type
+        self._base64: Optional[str] = None
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode("ascii")
+        return self._base64
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    @property
+    def size(self) -> int:
+        """Memória aproximada da entrada no cache (bytes e base64)"""
+        return len(self.data) + (len(self._base64) if self._base64 is not None else len(self.data) * 4 // 3)
+
+
+def fit_image(data: bytes, mime_type: str, max_dim: Optional[int], max_bytes: Optional[int]) -> Tuple[bytes, str]:
+    """
+    Reduz a imagem para caber em `max_dim` pixels e `max_bytes`; devolve os mesmos bytes se já couber
+
+    Só decodifica a imagem com o Pillow quando o cabeçalho indica que ela passa do limite.
+    """
+    oversized = max_bytes is not None and len(data) > max_bytes
+    if max_dim is None and not oversized:
+        return data, mime_type
+
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        too_large = max_dim is not None and max(image.size) > max_dim
+        if not too_large and not oversized:
+            return data, mime_type
+        image.load()
+        if too_large:
+            image.thumbnail((max_dim, max_dim), Image.LANCZOS)
+        save_format = _SAVE_FORMATS.get(mime_type, "PNG")
+        if oversized and save_format == "PNG":
+            # Ainda grande demais depois de reduzir: JPEG costuma ser bem menor que PNG em páginas escaneadas
+            save_format = "JPEG"
+        if save_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, save_format, **({"quality": 85} if save_format in ("JPEG", "WEBP") else {}))
+    return buffer.getvalue(), f"image/{save_format.lower()}"
+
+
+class ImageCache:
+    """LRU de imagens preparadas, limitado em bytes e compartilhado pelas threads do worker"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[Tuple, PreparedImage]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ImageCache":
+        """Cria o cache a partir de `IMAGE_CACHE_MB` (padrão 64; 0 desativa)"""
+        return cls(max_bytes=int(os.getenv("IMAGE_CACHE_MB", "64")) * 1024 * 1024)
+
+    def load(self, path: str, provider: str = "") -> PreparedImage:
+        """
+        Imagem de `path` preparada para `provider` (operação bloqueante na primeira vez)
+
+        A chave inclui tamanho e data de modificação do arquivo, então um arquivo regravado no mesmo
+        caminho nunca devolve a versão antiga.
+        """
+        stat = os.stat(path)
+        max_dim, max_bytes = image_limits(provider)
+        key = (path, stat.st_mtime_ns, stat.st_size, max_dim, max_bytes)
+        with self._lock:
+            image = self._items.get(key)
+            if image is not None:
+                self._items.move_to_end(key)
+                return image
+
+        with open(path, "rb") as f:
+            data = f.read()
+        mime_type = detect_mime_type(data)
+        if mime_type is None:
+            raise ValueError(f"Formato de imagem não reconhecido: {path}")
+        image = PreparedImage(*fit_image(data, mime_type, max_dim, max_bytes))
+        # O base64 é calculado fora do lock, antes de a imagem ficar visível para outras threads
+        image.base64
+        self._store(key, image)
+        return image
+
+    def _store(self, key: Tuple, image: PreparedImage) -> None:
+        size = image.size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._items[key] = image
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= evicted.size
+
+    def forget(self, path: str) -> None:
+        """Remove as entradas de um arquivo apagado (por exemplo, a imagem de uma página já convertida)"""
+        with self._lock:
+            for key in [key for key in self._items if key[0] == path]:
+                self._bytes -= self._items.pop(key).size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+
+# Cache compartilhado pelos provedores e pelo OCR do worker
+image_cache = ImageCache.from_env()
+
+
+def load_image(path: str, provider: str = "") -> PreparedImage:
+    """Imagem de `path` preparada para `provider`, lida e codificada uma única vez por worker"""
+    return image_cache.load(path, provider)
@@ -0,0 +1,430 @@
+"""
+Fila de conversões assíncronas para o Leitor Doc PyZerox
+Este módulo mantém os jobs enviados para `POST /jobs` em um banco SQLite em `uploads/jobs`, visível
+para todos os workers do gunicorn. O arquivo de cada job fica em um diretório de trabalho (veja
+`workspace.py`), criado pela rota e removido aqui quando o job termina. Cada worker roda um número limitado de threads que retiram os jobs
+da fila por ordem de prioridade, executam a conversão e, se pedido, avisam uma URL de callback.
+Resultados grandes demais para o banco (o handler devolve `content_file` em vez de `content`) ficam em
+`results/<job_id>` e são servidos em `GET /jobs/<job_id>/content`.
+"""
+import ipaddress
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+# Assinatura do handler: (caminho do arquivo, parâmetros do job, callback de progresso) -> (payload, status HTTP)
+JobHandler = Callable[[str, Dict[str, Any], Callable[[int, int], None]], Any]
+
+
+class CallbackURLError(ValueError):
+    """URL de callback recusada: esquema inválido, host fora da lista permitida ou endereço interno"""
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Um redirecionamento poderia levar o callback para um endereço interno já recusado; a resposta 3xx
+    # chega como HTTPError e o callback é dado como não entregue, sem novas tentativas
+    def redirect_request(self, *args: Any, **kwargs: Any) -> None:
+        return None
+
+
+def check_callback_url(url: str, allowed_hosts: Iterable[str] = ()) -> None:
+    """
+    Valida a URL de callback de um job (faz a resolução DNS do host, operação bloqueante)
+
+    Com `allowed_hosts`, só esses hosts são aceitos. Sem a lista, o host precisa resolver apenas para
+    endereços públicos: loopback, redes privadas, link-local (como o serviço de metadados da nuvem) e
+    endereços reservados são recusados.
+
+    Raises:
+        CallbackURLError: Se a URL não puder ser usada como callback
+    """
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme.lower() not in ("http", "https") or not parsed.hostname:
+        raise CallbackURLError("callback_url must be an http(s) URL")
+    host = parsed.hostname.lower()
+    allowed = {item.strip().lower() for item in allowed_hosts if item.strip()}
+    if allowed:
+        if host not in allowed:
+            raise CallbackURLError(f"callback_url host is not allowed: {host}")
+        return
+
+    try:
+        port = parsed.port or (443 if parsed.scheme.lower() == "https" else 80)
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)}
+    except (OSError, ValueError) as e:
+        raise CallbackURLError(f"callback_url host cannot be resolved: {host}") from e
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+        if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise CallbackURLError(f"callback_url must point to a public address, not {ip}")
+
+
+class JobQueue:
+    """Fila de jobs persistida em SQLite e processada por threads em cada worker"""
+
+    def __init__(
+        self,
+        base_dir: str,
+        handler: JobHandler,
+        workers: int = 1,
+        poll_interval: float = 1.0,
+        stale_after: int = 600,
+        ttl: int = 86400,
+        callback_hosts: Iterable[str] = (),
+        max_attempts: int = 3,
+    ):
+        self.base_dir = base_dir
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.callback_hosts = [host for host in callback_hosts if host.strip()]
+        self.db_path = os.path.join(base_dir, "jobs.db")
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+        os.makedirs(base_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    file_path TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    callback_url TEXT,
+                    pages_done INTEGER NOT NULL DEFAULT 0,
+                    pages_total INTEGER,
+                    result TEXT,
+                    http_status INTEGER,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, created_at)")
+
+    @classmethod
+    def from_env(cls, handler: JobHandler) -> "JobQueue":
+        """Cria a fila a partir das variáveis de ambiente `JOB_*`"""
+        return cls(
+            base_dir=os.getenv("JOB_DIR", os.path.join("uploads", "jobs")),
+            handler=handler,
+            workers=int(os.getenv("JOB_WORKERS", "1")),
+            poll_interval=float(os.getenv("JOB_POLL_INTERVAL", "1.0")),
+            stale_after=int(os.getenv("JOB_STALE_SECONDS", "600")),
+            ttl=int(os.getenv("JOB_TTL", "86400")),
+            callback_hosts=os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(","),
+            max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+        )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Conexões curtas em modo autocommit: cada thread/worker abre a sua
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # API usada pelas rotas
+
+    @staticmethod
+    def job_dir_name(job_id: str) -> str:
+        """Nome do diretório de trabalho onde o arquivo de entrada do job é guardado"""
+        return f"job-{job_id}"
+
+    def result_dir(self, job_id: str) -> str:
+        """Diretório onde fica o conteúdo dos resultados grandes demais para o banco"""
+        return os.path.join(self.base_dir, "results", job_id)
+
+    def content_path(self, job_id: str) -> Optional[str]:
+        """Arquivo com o conteúdo do resultado do job, se ele foi guardado fora do banco"""
+        if not job_id.isalnum():
+            # O identificador vem da URL: nunca aponta para fora do diretório de resultados
+            return None
+        try:
+            names = os.listdir(self.result_dir(job_id))
+        except OSError:
+            return None
+        return os.path.join(self.result_dir(job_id), names[0]) if names else None
+
+    def check_callback_url(self, url: str) -> None:
+        """Valida uma URL de callback com a lista de hosts da fila; veja `check_callback_url`"""
+        check_callback_url(url, self.callback_hosts)
+
+    def new_job_id(self) -> str:
+        """Gera o identificador de um novo job"""
+        return uuid.uuid4().hex
+
+    def submit(
+        self,
+        job_id: str,
+        file_path: str,
+        params: Dict[str, Any],
+        priority: int = 0,
+        callback_url: Optional[str] = None,
+    ) -> None:
+        """
+        Enfileira um job cujo arquivo de entrada já foi gravado em um diretório de trabalho próprio
+        (`job_dir_name(job_id)`), removido junto com o job
+
+        Args:
+            job_id: Identificador gerado por `new_job_id`
+            file_path: Caminho do arquivo a converter
+            params: Parâmetros da conversão (serializáveis em JSON)
+            priority: Jobs com prioridade maior são processados primeiro
+            callback_url: URL que recebe um POST com o resultado ao final do job
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, priority, file_path, params, callback_url, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, priority, file_path, json.dumps(params), callback_url, now, now),
+            )
+        self.start()
+        self._wakeup.set()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna o estado público do job, ou None se não existir"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "priority": row["priority"],
+            "progress": {"pages_done": row["pages_done"], "pages_total": row["pages_total"]},
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+        }
+        if row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+            job["http_status"] = row["http_status"]
+        if row["error"]:
+            job["error"] = row["error"]
+        return job
+
+    # Processamento
+
+    def start(self) -> None:
+        """Inicia as threads de processamento deste worker (chamadas repetidas são ignoradas)"""
+        with self._start_lock:
+            if self._threads or self.workers <= 0:
+                return
+            self._requeue_stale()
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"job-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self) -> None:
+        """Sinaliza às threads que terminem após o job atual"""
+        self._stop.set()
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        last_cleanup = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.time() - last_cleanup > 3600:
+                    self._cleanup()
+                    last_cleanup = time.time()
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"Erro ao acessar a fila de jobs: {str(e)}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._execute(job)
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Reserva atomicamente o próximo job da fila (entre todos os workers)"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    now = time.time()
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', started_at = ?, updated_at = ?, attempts = attempts + 1 "
+                        "WHERE id = ?",
+                        (now, now, row["id"]),
+                    )
+                conn.execute("COMMIT")
+                return row
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _execute(self, job: sqlite3.Row) -> None:
+        job_id = job["id"]
+        print(f"Iniciando job {job_id}")
+
+        def progress(pages_done: int, pages_total: int) -> None:
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE jobs SET pages_done = ?, pages_total = ?, updated_at = ? WHERE id = ?",
+                    (pages_done, pages_total, time.time(), job_id),
+                )
+
+        # Batimento periódico para que o job não seja considerado órfão durante etapas longas
+        finished = threading.Event()
+
+        def heartbeat() -> None:
+            while not finished.wait(max(self.stale_after / 3, 1)):
+                try:
+                    with self._connect() as conn:
+                        conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+                except sqlite3.Error:
+                    pass
+
+        threading.Thread(target=heartbeat, name=f"job-heartbeat-{job_id}", daemon=True).start()
+
+        try:
+            payload, http_status = self.handler(job["file_path"], json.loads(job["params"]), progress)
+            status = "done" if http_status < 400 else "failed"
+            error = payload.get("error") if status == "failed" else None
+        except Exception as e:
+            print(f"Erro ao executar job {job_id}: {str(e)}")
+            payload, http_status, status, error = {"error": str(e)}, 500, "failed", str(e)
+        finally:
+            finished.set()
+
+        if "content_file" in payload:
+            # O diretório do job é removido abaixo: o conteúdo vai para o diretório de resultados
+            content_file = payload.pop("content_file")
+            try:
+                result_dir = self.result_dir(job_id)
+                os.makedirs(result_dir, exist_ok=True)
+                shutil.move(content_file, os.path.join(result_dir, os.path.basename(content_file)))
+                payload["content_url"] = f"/jobs/{job_id}/content"
+            except OSError as e:
+                print(f"Erro ao guardar o conteúdo do job {job_id}: {str(e)}")
+                payload, http_status, status, error = {"error": str(e)}, 500, "failed", str(e)
+
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, result = ?, http_status = ?, error = ?, finished_at = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (status, json.dumps(payload), http_status, error, now, now, job_id),
+                )
+        except sqlite3.Error as e:
+            # A thread continua atendendo a fila; o job volta para ela quando for considerado órfão
+            print(f"Erro ao gravar o resultado do job {job_id}: {str(e)}")
+            return
+        shutil.rmtree(os.path.dirname(job["file_path"]), ignore_errors=True)
+        print(f"Job {job_id} finalizado com status {status}")
+
+        if job["callback_url"]:
+            try:
+                self._notify(job["callback_url"], self.get(job_id))
+            except Exception as e:
+                print(f"Erro ao chamar callback do job {job_id}: {str(e)}")
+
+    def _notify(self, callback_url: str, job: Dict[str, Any], attempts: int = 3) -> None:
+        """Envia o estado final do job para a URL de callback, com novas tentativas em caso de falha"""
+        data = json.dumps(job).encode("utf-8")
+        opener = urllib.request.build_opener(_NoRedirect)
+        for attempt in range(1, attempts + 1):
+            try:
+                # Validada de novo no envio: o DNS do host pode ter mudado desde a criação do job
+                self.check_callback_url(callback_url)
+                req = urllib.request.Request(
+                    callback_url, data=data, headers={"Content-Type": "application/json"}, method="POST"
+                )
+                with opener.open(req, timeout=10):
+                    return
+            except CallbackURLError as e:
+                print(f"Callback do job {job['job_id']} recusado: {str(e)}")
+                return
+            except urllib.error.HTTPError as e:
+                if 300 <= e.code < 400:
+                    # Redirecionamentos não são seguidos: tentar de novo daria a mesma resposta
+                    print(f"Callback do job {job['job_id']} não entregue: redirecionamento {e.code} não seguido")
+                    return
+                print(f"Falha ao chamar callback do job {job['job_id']} (tentativa {attempt}): {str(e)}")
+                time.sleep(2 ** attempt)
+            except Exception as e:
+                print(f"Falha ao chamar callback do job {job['job_id']} (tentativa {attempt}): {str(e)}")
+                time.sleep(2 ** attempt)
+
+    def _requeue_stale(self) -> None:
+        """
+        Devolve à fila jobs presos em 'running' por workers que morreram
+
+        Um job que já foi retirado da fila `max_attempts` vezes provavelmente derruba o worker que o
+        executa: ele é marcado como falho em vez de voltar para a fila.
+        """
+        now = time.time()
+        error = f"Job interrompido {self.max_attempts} vezes (o worker parou durante a conversão)"
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                failed = conn.execute(
+                    "SELECT file_path FROM jobs WHERE status = 'running' AND updated_at < ? AND attempts >= ?",
+                    (now - self.stale_after, self.max_attempts),
+                ).fetchall()
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', result = ?, http_status = 500, error = ?, finished_at = ?, "
+                    "updated_at = ? WHERE status = 'running' AND updated_at < ? AND attempts >= ?",
+                    (json.dumps({"error": error}), error, now, now, now - self.stale_after, self.max_attempts),
+                )
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running' AND updated_at < ?",
+                    (now, now - self.stale_after),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        for row in failed:
+            shutil.rmtree(os.path.dirname(row["file_path"]), ignore_errors=True)
+
+    def _cleanup(self) -> None:
+        """Remove jobs finalizados há mais de `ttl` segundos e reenfileira jobs órfãos"""
+        cutoff = time.time() - self.ttl
+        with self._connect() as conn:
+            expired = conn.execute(
+                "SELECT id, file_path FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,)
+            ).fetchall()
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+        for row in expired:
+            shutil.rmtree(os.path.dirname(row["file_path"]), ignore_errors=True)
+            shutil.rmtree(self.result_dir(row["id"]), ignore_errors=True)
+        self._requeue_stale()
@@ -0,0 +1,352 @@
+"""
+Serviço local de inferência do Llama para o Leitor Doc PyZerox
+Sem ele, cada worker do gunicorn carrega a própria cópia do modelo GGUF e atende uma chamada por vez.
+Com `LLAMA_SERVER_ENABLED=true`, o gunicorn inicia um único processo por contêiner que carrega o modelo
+uma vez (mapeado em memória) e atende todos os workers por um socket Unix:
+
+- as chamadas de todos os workers entram em uma única fila;
+- `LLAMA_SERVER_SLOTS` contextos do llama.cpp compartilham os mesmos pesos mapeados em memória (só o
+  cache KV é próprio de cada um) e geram em paralelo; assim que um contexto termina, pega a próxima
+  chamada da fila, sem esperar as demais terminarem;
+- os tokens são enviados ao worker conforme são gerados (NDJSON);
+- `GET /stats` informa a profundidade da fila, os contextos ocupados e os tokens por segundo; os
+  workers exportam esses valores em `/metrics`.
+
+Também pode ser iniciado manualmente: `python llama_server.py`.
+"""
+import http.client
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+DEFAULT_SOCKET = "/tmp/leitor-doc-llama.sock"
+
+
+class LlamaServerError(RuntimeError):
+    """Erro devolvido pelo serviço local (fila cheia, modelo indisponível ou falha na geração)"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status
+
+
+class _Request:
+    """Chamada na fila: os pedaços gerados são entregues à thread da conexão por `events`"""
+
+    def __init__(self, params: Dict[str, Any]):
+        self.params = params
+        self.events: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self.cancelled = threading.Event()
+        self.queued_at = time.monotonic()
+
+
+class LlamaServer:
+    """Fila compartilhada e contextos do llama.cpp que a consomem"""
+
+    def __init__(
+        self,
+        model_path: str,
+        n_ctx: int = 4096,
+        n_gpu_layers: int = -1,
+        seed: int = 42,
+        slots: int = 1,
+        threads: Optional[int] = None,
+        max_queue: int = 256,
+    ):
+        self.model_path = model_path
+        self.n_ctx = n_ctx
+        self.n_gpu_layers = n_gpu_layers
+        self.seed = seed
+        self.slots = max(1, slots)
+        # Núcleos divididos entre os contextos, para que gerem em paralelo sem disputar CPU
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.slots)
+        self.max_queue = max_queue
+
+        self._queue: "queue.Queue[_Request]" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._tokens = 0
+        # (instante, tokens) dos últimos 60s, para a taxa de tokens por segundo
+        self._recent: Deque[Tuple[float, int]] = deque()
+        self._started = time.monotonic()
+
+    @classmethod
+    def from_env(cls) -> "LlamaServer":
+        """Cria o serviço a partir das variáveis de ambiente `LLAMA_*` e `LLAMA_SERVER_*`"""
+        threads = os.getenv("LLAMA_SERVER_THREADS")
+        return cls(
+            model_path=os.getenv("LLAMA_MODEL_PATH", "/app/models/llama-3-8b.gguf"),
+            n_ctx=int(os.getenv("LLAMA_N_CTX", "4096")),
+            n_gpu_layers=int(os.getenv("LLAMA_N_GPU_LAYERS", "-1")),
+            seed=int(os.getenv("LLAMA_SEED", "42")),
+            slots=int(os.getenv("LLAMA_SERVER_SLOTS", "2")),
+            threads=int(threads) if threads else None,
+            max_queue=int(os.getenv("LLAMA_SERVER_MAX_QUEUE", "256")),
+        )
+
+    def start(self) -> None:
+        """Carrega os contextos (os pesos são mapeados uma única vez pelo sistema) e inicia as threads"""
+        from llama_cpp import Llama
+
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"Modelo GGUF não encontrado em: {self.model_path}")
+        for index in range(self.slots):
+            llm = Llama(
+                model_path=self.model_path,
+                n_ctx=self.n_ctx,
+                n_gpu_layers=self.n_gpu_layers,
+                seed=self.seed,
+                n_threads=self.threads,
+                use_mmap=True,
+                verbose=False,
+            )
+            threading.Thread(target=self._run_slot, args=(llm,), name=f"llama-slot-{index}", daemon=True).start()
+        print(f"Serviço Llama: {self.slots} contexto(s) de {self.model_path} com {self.threads} thread(s) cada")
+
+    def submit(self, params: Dict[str, Any]) -> _Request:
+        """Enfileira uma chamada; levanta LlamaServerError com status 503 se a fila estiver cheia"""
+        request = _Request(params)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            raise LlamaServerError("Llama server queue is full", 503)
+        return request
+
+    def _run_slot(self, llm: Any) -> None:
+        while True:
+            request = self._queue.get()
+            if request.cancelled.is_set():
+                continue
+            with self._lock:
+                self._active += 1
+            tokens = 0
+            try:
+                params = request.params
+                for chunk in llm.create_completion(
+                    prompt=params["prompt"],
+                    max_tokens=int(params.get("max_tokens", 2048)),
+                    temperature=float(params.get("temperature", 0.1)),
+                    stop=params.get("stop") or None,
+                    stream=True,
+                ):
+                    if request.cancelled.is_set():
+                        # O worker desistiu (timeout ou failover): libera o contexto para a próxima chamada
+                        break
+                    tokens += 1
+                    request.events.put({"text": chunk["choices"][0]["text"]})
+                request.events.put({"done": True, "completion_tokens": tokens})
+                self._record(tokens, failed=False)
+            except Exception as e:
+                request.events.put({"error": str(e)})
+                self._record(tokens, failed=True)
+            finally:
+                request.events.put(None)
+                with self._lock:
+                    self._active -= 1
+
+    def _record(self, tokens: int, failed: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._tokens += tokens
+            if failed:
+                self._failed += 1
+            else:
+                self._completed += 1
+            self._recent.append((now, tokens))
+            while self._recent and self._recent[0][0] < now - 60:
+                self._recent.popleft()
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidade da fila, contextos ocupados e taxa de geração"""
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and self._recent[0][0] < now - 60:
+                self._recent.popleft()
+            window = min(60.0, now - self._started) or 1.0
+            return {
+                "model": os.path.basename(self.model_path),
+                "slots": self.slots,
+                "active": self._active,
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "completed": self._completed,
+                "failed": self._failed,
+                "tokens_generated": self._tokens,
+                "tokens_per_second": round(sum(tokens for _, tokens in self._recent) / window, 2),
+                "uptime_s": round(now - self._started, 1),
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "LeitorDocLlama/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/stats":
+            self._send_json(200, self.server.llama.stats())
+        elif self.path == "/health":
+            self._send_json(200, {"status": "healthy"})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self) -> None:
+        if self.path != "/v1/completions":
+            self._send_json(404, {"error": "Not found"})
+            return
+        try:
+            params = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))))
+            request = self.server.llama.submit(params)
+        except LlamaServerError as e:
+            self._send_json(e.status_code or 500, {"error": str(e)})
+            return
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {"error": f"Invalid request: {str(e)}"})
+            return
+
+        # Tokens enviados conforme são gerados, uma linha JSON por pedaço
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            while True:
+                event = request.events.get()
+                if event is None:
+                    break
+                line = json.dumps(event).encode("utf-8") + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            # Conexão fechada pelo worker
+            request.cancelled.set()
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, llama: LlamaServer):
+        self.llama = llama
+        super().__init__(path, _Handler)
+
+    def get_request(self) -> Tuple[socket.socket, Tuple[str, int]]:
+        # O BaseHTTPRequestHandler espera um endereço (host, porta)
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+
+def serve(socket_path: Optional[str] = None) -> None:
+    """Carrega o modelo e atende no socket Unix até o processo ser encerrado"""
+    socket_path = socket_path or os.getenv("LLAMA_SERVER_SOCKET", DEFAULT_SOCKET)
+    llama = LlamaServer.from_env()
+    llama.start()
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    with _UnixHTTPServer(socket_path, llama) as server:
+        print(f"Serviço Llama ouvindo em {socket_path}")
+        server.serve_forever()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class LlamaClient:
+    """Cliente do serviço local, usado pelo LlamaLocalProvider dos workers"""
+
+    def __init__(self, socket_path: Optional[str] = None, timeout: float = 600.0):
+        self.socket_path = socket_path or os.getenv("LLAMA_SERVER_SOCKET", DEFAULT_SOCKET)
+        self.timeout = timeout
+        # Conexões abertas (uma por chamada em andamento), fechadas em `close`
+        self._connections: Set[_UnixHTTPConnection] = set()
+        self._lock = threading.Lock()
+
+    def _request(
+        self, method: str, path: str, body: Optional[bytes] = None, timeout: Optional[float] = None
+    ) -> Tuple[_UnixHTTPConnection, Any]:
+        conn = _UnixHTTPConnection(self.socket_path, timeout=timeout or self.timeout)
+        with self._lock:
+            self._connections.add(conn)
+        try:
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+        except OSError as e:
+            self._release(conn)
+            raise LlamaServerError(f"Serviço Llama indisponível em {self.socket_path}: {str(e)}", 503)
+        if response.status != 200:
+            try:
+                message = json.loads(response.read()).get("error", "")
+            except ValueError:
+                message = ""
+            self._release(conn)
+            raise LlamaServerError(message or f"Serviço Llama respondeu {response.status}", response.status)
+        return conn, response
+
+    def stream(self, prompt: str, max_tokens: int, temperature: float = 0.1, stop: Optional[List[str]] = None) -> Iterator[str]:
+        """Pedaços de texto conforme são gerados; fechar o iterador cancela a geração no serviço"""
+        body = json.dumps({"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature, "stop": stop})
+        conn, response = self._request("POST", "/v1/completions", body.encode("utf-8"))
+        try:
+            for line in response:
+                event = json.loads(line)
+                if "error" in event:
+                    raise LlamaServerError(event["error"], 500)
+                if event.get("done"):
+                    return
+                yield event["text"]
+        finally:
+            self._release(conn)
+
+    def complete(self, prompt: str, max_tokens: int, temperature: float = 0.1, stop: Optional[List[str]] = None) -> str:
+        return "".join(self.stream(prompt, max_tokens, temperature, stop))
+
+    def stats(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        conn, response = self._request("GET", "/stats", timeout=timeout)
+        try:
+            return json.loads(response.read())
+        finally:
+            self._release(conn)
+
+    def _release(self, conn: _UnixHTTPConnection) -> None:
+        with self._lock:
+            self._connections.discard(conn)
+        conn.close()
+
+    def close(self) -> None:
+        """Fecha as conexões ainda abertas; as gerações em andamento são canceladas no serviço"""
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            conn.close()
+
+
+if __name__ == "__main__":
+    serve()
@@ -1,18 +1,50 @@
 # Standard library imports
 import asyncio
+import json
 import mimetypes
 import os
-from typing import Tuple
+import shutil
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, BinaryIO, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
 
 # Third-party imports
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
-from markitdown import MarkItDown
-from openai import OpenAI
-from pyzerox import zerox
+from flask import Flask, Response, g, request, jsonify, send_file
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # Importações locais
-from ai_providers import AIProvider
+from ai_providers import LlamaLocalProvider, provider_registry, resolve_model
+from artifacts import ArtifactStore
+from batch import ZIP_CONTENT_TYPES, BatchError, extract_zip, find_duplicates, item_path
+from cache import ResultCache, make_cache_key
+from concurrency import PageConcurrency
+from jobs import CallbackURLError, JobQueue
+from metrics import (
+    BYTES,
+    CONVERSIONS_IN_PROGRESS,
+    JOBS_IN_PROGRESS,
+    PROMETHEUS_AVAILABLE,
+    REQUEST_LATENCY,
+    REQUESTS,
+    current_timings,
+    render_metrics,
+    stage,
+    start_request_timings,
+    with_timings,
+)
+from ocr import count_pdf_pages, iter_ocr_pdf, ocr_pdf
+from pages import PageSelectionError, count_slides, read_selection, select_pages, trim_pdf, trim_pptx
+from render import RenderPool
+from runtime import AsyncRuntime
+from similarity import SimilarityIndex
+from startup import lazy_import, mark, startup_report
+from tables import TABLE_SUMMARY_PROMPT, TableConverter, TableOptionsError, read_table_options, tabular_kind
+from text_layer import classify_pdf_pages, iter_page_texts
+from workspace import UploadTooLargeError, Workspace, WorkspaceLimitError, WorkspaceManager, copy_stream
+
+if TYPE_CHECKING:
+    from markitdown import MarkItDown
 
 # Define supported file types and their MIME types
 SUPPORTED_FORMATS = {
@@ -55,8 +87,55 @@ SUPPORTED_FORMATS = {
     ],
 }
 
+# Upload limits: the body is streamed to disk in chunks and the size is enforced while reading
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+
+# Lotes (/convert/batch): limites do lote inteiro e arquivos convertidos ao mesmo tempo
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "100"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_MB", "1024")) * 1024 * 1024
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+# Planilhas e CSVs convertidos acima deste tamanho não são lidos para a memória: a resposta é enviada
+# direto do arquivo e o resultado não entra no cache nem no armazém de artefatos
+TABULAR_INLINE_MAX_BYTES = int(float(os.getenv("TABULAR_INLINE_MAX_MB", "16")) * 1024 * 1024)
+CONTENT_CHUNK_CHARS = 64 * 1024
+
+# Provedores que recebem o texto extraído do PDF (em trechos) em vez das páginas renderizadas
+TEXT_ONLY_PROVIDERS = ("gemini", "llama_local")
+
 # Initialize Flask app
 app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+
+# Cache de resultados compartilhado pelas requisições deste worker (desative com RESULT_CACHE_ENABLED=false)
+result_cache = ResultCache.from_env() if os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true" else None
+
+# Armazém de artefatos (original, páginas, markdown e resultado) compartilhado pelos workers
+# (ative com ARTIFACT_STORE_ENABLED=true)
+artifact_store = ArtifactStore.from_env() if os.getenv("ARTIFACT_STORE_ENABLED", "false").lower() == "true" else None
+
+# Índice de documentos e páginas parecidos, compartilhado pelos workers (ative com SIMILARITY_ENABLED=true)
+similarity_index = SimilarityIndex.from_env() if os.getenv("SIMILARITY_ENABLED", "false").lower() == "true" else None
+
+# Diretórios de trabalho por requisição, com limites de quantidade e espaço em disco
+workspaces = WorkspaceManager.from_env()
+
+# Cache de páginas do OCR: só as páginas que mudaram são reenviadas ao modelo (desative com PAGE_CACHE_ENABLED=false)
+page_cache = (
+    ResultCache.from_env(prefix="PAGE_CACHE", subdir="pages")
+    if os.getenv("PAGE_CACHE_ENABLED", "true").lower() == "true"
+    else None
+)
+
+# Event loop de longa duração do worker, onde rodam as conversões de todas as requisições e jobs
+async_runtime = AsyncRuntime.from_env()
+
+# Páginas do OCR enviadas ao mesmo tempo: por provedor/modelo, adaptativo e com teto global por worker
+page_concurrency = PageConcurrency.from_env()
+
+# Renderização das páginas do OCR em um pool de processos do tamanho dos núcleos disponíveis
+render_pool = RenderPool.from_env()
 
 
 def is_supported_format(content_type: str) -> Tuple[bool, str]:
@@ -87,28 +166,1039 @@ def get_format_specific_prompt(format_type: str) -> str:
     )
 
 
+def get_upload_source() -> Tuple[Optional[BinaryIO], str]:
+    """
+    Return the stream and content type of the uploaded file
+
+    Accepts either the raw request body (Content-Type describes the file) or a
+    multipart/form-data request with the file in the "file" field (or the first file field).
+    """
+    if request.mimetype == "multipart/form-data":
+        upload = request.files.get("file") or next(iter(request.files.values()), None)
+        if upload is None:
+            return None, ""
+        return upload.stream, get_part_content_type(upload)
+    return request.stream, request.content_type or ""
+
+
+def get_part_content_type(upload: FileStorage) -> str:
+    """
+    Content type of a multipart file: the part's own type, or a guess from its file name
+    """
+    content_type = upload.mimetype
+    if not content_type or content_type == "application/octet-stream":
+        content_type = mimetypes.guess_type(upload.filename or "")[0] or content_type
+    return content_type or ""
+
+
+def save_upload(stream: BinaryIO, path: str) -> Tuple[int, str]:
+    """
+    Stream an upload to disk in fixed-size chunks, enforcing MAX_UPLOAD_MB
+
+    Returns:
+        Tuple with the size in bytes and the SHA-256 of the file
+    """
+    with stage("upload"):
+        size, file_hash = copy_stream(stream, path, max_bytes=MAX_UPLOAD_BYTES, chunk_size=UPLOAD_CHUNK_BYTES)
+    BYTES.labels(direction="in").inc(size)
+    return size, file_hash
+
+
+def get_markitdown(model: str) -> "MarkItDown":
+    """
+    Return the worker-wide MarkItDown instance for the given model
+
+    The OpenAI client and the MarkItDown converter are created once and reused,
+    so every request shares the same HTTP connection pool. Both libraries are
+    imported on first use, so workers that never convert with MarkItDown don't load them.
+    """
+    client = provider_registry.get_resource(
+        ("client", "openai"), lambda: lazy_import("openai").OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    )
+    return provider_registry.get_resource(
+        ("markitdown", model), lambda: lazy_import("markitdown").MarkItDown(llm_client=client, llm_model=model)
+    )
+
+
+def get_conversion_options(args: Mapping[str, str], format_type: str) -> Dict[str, Any]:
+    """
+    Read the conversion options shared by /convert and /jobs from the query parameters
+    """
+    # Get AI provider from query parameter or environment
+    ai_provider = args.get("ai_provider") or os.getenv("AI_PROVIDER", "openai")
+    # Páginas do OCR processadas ao mesmo tempo; sem o parâmetro vale a configuração do provedor/modelo
+    concurrency = args.get("concurrency", "")
+    # Seleção de páginas/slides (levanta PageSelectionError se inválida)
+    pages, max_pages = read_selection(args.get("pages"), args.get("max_pages"))
+    # Abas, limites e formato das planilhas e CSVs (levanta TableOptionsError se inválidos)
+    table_options = read_table_options(args)
+    return {
+        "ai_provider": ai_provider,
+        "model": resolve_model(ai_provider),
+        "format_prompt": get_format_specific_prompt(format_type),
+        "use_ocr": args.get("ocr", "true").lower() == "true",
+        "use_cache": args.get("cache", "true").lower() == "true",
+        "concurrency": int(concurrency) if concurrency.isdigit() else None,
+        # Páginas de PDF com camada de texto são extraídas localmente, sem OCR (opcionalmente reformatadas pelo modelo)
+        "text_layer": args.get("text_layer", os.getenv("TEXT_LAYER_ENABLED", "true")).lower() == "true",
+        "text_cleanup": args.get("text_cleanup", os.getenv("TEXT_LAYER_CLEANUP", "false")).lower() == "true",
+        "pages": pages,
+        "max_pages": max_pages,
+        # Documentos e páginas parecidos com conversões anteriores reaproveitam o resultado delas
+        # Sempre opcional por requisição: o conteúdo reaproveitado vem de outro documento
+        "reuse_similar": args.get("reuse_similar", "false").lower() == "true",
+        # Planilhas .xlsx e CSVs são convertidos localmente, linha a linha, sem o MarkItDown nem o modelo
+        "tabular": args.get("tabular", os.getenv("TABULAR_ENABLED", "true")).lower() == "true",
+        # O modelo só é chamado para um resumo opcional, a partir de uma amostra das linhas
+        "summarize": args.get("summarize", "false").lower() == "true",
+        **table_options,
+    }
+
+
+def get_cache_key(file_hash: str, format_type: str, options: Dict[str, Any]) -> Optional[str]:
+    """
+    Return the result cache key for a conversion, or None when the cache is not used
+    """
+    if not options["use_cache"] or result_cache is None:
+        return None
+    return get_conversion_key(file_hash, format_type, options)
+
+
+def get_conversion_key(file_hash: str, format_type: str, options: Dict[str, Any]) -> str:
+    """
+    Return the key identifying a conversion (file and every parameter that changes the result)
+
+    It is the result cache key, and also indexes the artifact store when the cache is not used.
+    """
+    return make_cache_key(
+        file_hash,
+        options["ai_provider"],
+        options["model"],
+        options["use_ocr"],
+        options["format_prompt"],
+        format=format_type,
+        text_layer=options.get("text_layer", False),
+        text_cleanup=options.get("text_cleanup", False),
+        pages=options.get("pages"),
+        max_pages=options.get("max_pages"),
+        reuse_similar=options.get("reuse_similar", False),
+        tabular=options.get("tabular", False),
+        summarize=options.get("summarize", False),
+        sheets=options.get("sheets"),
+        max_rows=options.get("max_rows"),
+        max_columns=options.get("max_columns"),
+        table_format=options.get("table_format"),
+    )
+
+
+def get_similarity_scope(format_type: str, options: Dict[str, Any]) -> str:
+    """
+    Key of the conversion parameters (the result cache key without the file hash)
+
+    Only documents converted with the same parameters are compared by the similarity index.
+    """
+    return make_cache_key(
+        "",
+        options["ai_provider"],
+        options["model"],
+        options["use_ocr"],
+        options["format_prompt"],
+        format=format_type,
+        text_layer=options.get("text_layer", False),
+        text_cleanup=options.get("text_cleanup", False),
+        pages=options.get("pages"),
+        max_pages=options.get("max_pages"),
+    )
+
+
+def lookup_result(cache_key: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    Look up a conversion result in the result cache, then in the artifact store
+
+    Returns:
+        Tuple (payload, tier) where tier is "memory", "disk", "artifacts" or "" when not found
+    """
+    cached, tier = result_cache.get(cache_key)
+    if cached is None and artifact_store is not None:
+        cached = artifact_store.get_result(cache_key)
+        if cached is not None:
+            # Resultado que já saiu do cache: volta para ele, e os próximos acessos nem consultam o índice
+            tier = "artifacts"
+            result_cache.set(cache_key, cached)
+    return cached, tier
+
+
+def is_complete(payload: Dict[str, Any], status: int) -> bool:
+    """
+    Whether a conversion result can be cached and stored: successful, with no failed pages and
+    with its content in the payload (large tables keep it in "content_file")
+    """
+    return status == 200 and not payload.get("partial") and "content_file" not in payload
+
+
+def store_artifacts(
+    temp_path: str,
+    file_hash: str,
+    options: Dict[str, Any],
+    payload: Dict[str, Any],
+    cache_key: Optional[str] = None,
+) -> None:
+    """
+    Save the original file, the final markdown and the response payload in the artifact store
+
+    Blocking; failures are logged and never fail the conversion.
+    """
+    metadata = {"provider": options["ai_provider"], "model": options["model"], "cache_key": cache_key}
+    try:
+        artifact_store.put_file(
+            temp_path, file_hash, "original", digest=file_hash, mime_type=mimetypes.guess_type(temp_path)[0], **metadata
+        )
+        artifact_store.put(payload["content"].encode("utf-8"), file_hash, "output", mime_type="text/markdown", **metadata)
+        artifact_store.put(
+            json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            file_hash,
+            "result",
+            mime_type="application/json",
+            **metadata,
+        )
+    except Exception as e:
+        print(f"Aviso: não foi possível gravar os artefatos da conversão: {str(e)}")
+
+
+def resolve_pages(temp_path: str, format_type: str, options: Dict[str, Any]) -> Tuple[Optional[int], Optional[List[int]]]:
+    """
+    Count the pages of a PDF or the slides of a presentation and apply the pages/max_pages options
+
+    Returns:
+        Tuple with the total (None for formats without pages) and the selected pages, numbered
+        from 1 (None when the whole document is converted)
+
+    Raises:
+        PageSelectionError: If the selection is invalid for the document
+    """
+    if format_type not in ("pdf", "powerpoint"):
+        return None, None
+    requested = options.get("pages") is not None or options.get("max_pages") is not None
+    try:
+        total = count_pdf_pages(temp_path) if format_type == "pdf" else count_slides(temp_path)
+    except Exception:
+        if requested:
+            raise PageSelectionError("Could not count the pages of the document")
+        # Sem seleção, o erro (se houver) aparece na própria conversão
+        return None, None
+    if total is None:
+        if requested:
+            raise PageSelectionError("Page selection is only supported for PDF and .pptx files")
+        return None, None
+    return total, select_pages(total, options.get("pages"), options.get("max_pages"))
+
+
+def convert_file(
+    temp_path: str,
+    format_type: str,
+    options: Dict[str, Any],
+    progress: Optional[Callable[[int, int], None]] = None,
+    work_dir: Optional[str] = None,
+    file_hash: Optional[str] = None,
+    cache_key: Optional[str] = None,
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Convert a file already saved on disk to markdown, on the worker's shared event loop
+
+    Blocks the calling thread (a gunicorn request thread or a job thread) until the conversion ends.
+    See aconvert_file for the arguments.
+    """
+    CONVERSIONS_IN_PROGRESS.inc()
+    try:
+        # Os tempos das etapas continuam sendo atribuídos à requisição (cabeçalho Server-Timing)
+        return async_runtime.run(
+            with_timings(
+                current_timings(),
+                aconvert_file(
+                    temp_path,
+                    format_type,
+                    options,
+                    progress=progress,
+                    work_dir=work_dir,
+                    file_hash=file_hash,
+                    cache_key=cache_key,
+                ),
+            )
+        )
+    finally:
+        CONVERSIONS_IN_PROGRESS.dec()
+
+
+async def aconvert_file(
+    temp_path: str,
+    format_type: str,
+    options: Dict[str, Any],
+    progress: Optional[Callable[[int, int], None]] = None,
+    work_dir: Optional[str] = None,
+    file_hash: Optional[str] = None,
+    cache_key: Optional[str] = None,
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Convert a file already saved on disk to markdown
+
+    Provider calls are awaited on the event loop; blocking steps (PDF parsing, MarkItDown)
+    run in the loop's thread pool. PDFs and presentations report their total number of pages,
+    and only the pages chosen by the pages/max_pages options are converted.
+
+    Args:
+        temp_path: Path of the uploaded file
+        format_type: Format returned by is_supported_format
+        options: Options returned by get_conversion_options
+        progress: Optional callback receiving (pages done, total pages)
+        work_dir: Private directory for intermediate files (default: the directory of temp_path)
+        file_hash: SHA-256 of the file; when set, the conversion is saved in the artifact store and
+            compared with earlier conversions in the similarity index
+        cache_key: Result cache key saved with the result in the artifact store and the similarity index
+
+    Returns:
+        Tuple with the response payload and the HTTP status code
+    """
+    try:
+        total_pages, pages = await asyncio.to_thread(resolve_pages, temp_path, format_type, options)
+    except PageSelectionError as e:
+        return {"error": str(e)}, 400
+
+    similar = None
+    signature = None
+    if similarity_index is not None and file_hash:
+        scope = get_similarity_scope(format_type, options)
+        try:
+            signature = await asyncio.to_thread(similarity_index.signature, temp_path, format_type, pages)
+            match = await asyncio.to_thread(similarity_index.find_document, signature, scope, file_hash) if signature else None
+        except Exception as e:
+            print(f"Aviso: falha na busca por documentos parecidos: {str(e)}")
+            signature = match = None
+        if match is not None:
+            similar = {"file_hash": match["file_hash"], "score": match["score"], "reused": False}
+            # Só a assinatura de texto confirma o conteúdo: o dHash das páginas de documentos escaneados e
+            # imagens captura apenas o layout, e dois documentos do mesmo modelo coincidiriam
+            if (
+                options.get("reuse_similar")
+                and match["kind"] == "text"
+                and match["cache_key"]
+                and result_cache is not None
+            ):
+                # Mesmo documento exportado de novo: devolve a conversão anterior
+                cached, _ = await asyncio.to_thread(lookup_result, match["cache_key"])
+                if cached is not None:
+                    return {**cached, "similar": {**similar, "reused": True}}, 200
+
+    payload, status = await aconvert_pages(temp_path, format_type, options, pages, progress, work_dir, file_hash)
+    if status == 200 and total_pages is not None:
+        payload["total_pages"] = total_pages
+        if pages is not None:
+            payload["selected_pages"] = pages
+    if status == 200 and similar is not None:
+        payload["similar"] = similar
+    if is_complete(payload, status) and signature is not None:
+        try:
+            await asyncio.to_thread(similarity_index.add_document, file_hash, scope, signature, cache_key)
+        except Exception as e:
+            print(f"Aviso: não foi possível registrar o documento no índice de similaridade: {str(e)}")
+    if is_complete(payload, status) and file_hash and artifact_store is not None:
+        # Sem o cache, a conversão ainda precisa de uma chave: repeti-la atualiza os mesmos registros
+        artifact_key = cache_key or get_conversion_key(file_hash, format_type, options)
+        await asyncio.to_thread(store_artifacts, temp_path, file_hash, options, payload, artifact_key)
+    return payload, status
+
+
+async def aconvert_pages(
+    temp_path: str,
+    format_type: str,
+    options: Dict[str, Any],
+    pages: Optional[List[int]],
+    progress: Optional[Callable[[int, int], None]] = None,
+    work_dir: Optional[str] = None,
+    file_hash: Optional[str] = None,
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Convert the selected pages of a file (None: all pages); see aconvert_file
+    """
+    ai_provider = options["ai_provider"]
+    model = options["model"]
+    format_prompt = options["format_prompt"]
+    work_dir = work_dir or os.path.dirname(temp_path)
+
+    if format_type == "pdf" and options["use_ocr"]:
+        # Saída do zerox dentro do diretório da requisição, nunca compartilhada entre requisições
+        output_dir = os.path.join(work_dir, "output")
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Provedores somente texto (Gemini, Llama local): use diretamente a classe específica
+        if ai_provider in TEXT_ONLY_PROVIDERS:
+            try:
+                # Extrair texto do PDF
+                if options.get("text_layer"):
+                    # Só usa o texto se todas as páginas tiverem camada de texto; páginas escaneadas
+                    # seguem para o OCR por página abaixo
+                    classification = await asyncio.to_thread(classify_pdf_pages, temp_path, pages)
+                    text_only = all(page["route"] == "text" for page in classification)
+                    texts = [page["text"] for page in classification] if text_only else None
+                else:
+                    # Páginas lidas sob demanda, conforme os trechos são enviados
+                    texts = iter_page_texts(temp_path, pages)
+
+                if texts is None:
+                    print(f"PDF com páginas sem camada de texto: usando OCR por página com {ai_provider}")
+                else:
+                    print(f"Processando PDF com {ai_provider}Provider diretamente")
+                    # Processar com o provedor específico (instância compartilhada do worker)
+                    try:
+                        provider = await asyncio.to_thread(provider_registry.get, ai_provider)
+
+                        # Documento dividido em trechos dentro do orçamento de tokens do provedor
+                        content = await provider.aprocess_chunks(texts, prompt=format_prompt)
+
+                        return {
+                            "content": content,
+                            "format": format_type,
+                            "ocr": True,
+                            "ai_provider": ai_provider
+                        }, 200
+                    except ImportError as e:
+                        return {"error": str(e)}, 400
+            except Exception as e:
+                print(f"Erro ao processar PDF com {ai_provider}Provider: {str(e)}")
+                # Continua para o método padrão se falhar
+
+        # Método padrão usando zerox para outros provedores
+        try:
+            print(f"Processando PDF com zerox usando provedor: {ai_provider}")
+            result = await ocr_pdf(
+                temp_path,
+                model=model,
+                prompt=format_prompt,
+                ai_provider=ai_provider,
+                concurrency=page_concurrency.resolve(ai_provider, model, options.get("concurrency")),
+                page_cache=page_cache if options["use_cache"] else None,
+                output_dir=output_dir,
+                progress=progress,
+                work_dir=work_dir,
+                limits=page_concurrency,
+                text_layer=options.get("text_layer", False),
+                text_cleanup=ai_provider if options.get("text_cleanup") else None,
+                renderer=render_pool,
+                pages=pages,
+                artifacts=artifact_store if file_hash else None,
+                document=file_hash or "",
+                similarity=similarity_index,
+                reuse_similar=options.get("reuse_similar", False),
+            )
+
+            content = "\n\n".join(page["content"] for page in result["pages"])
+            cached_pages = sum(1 for page in result["pages"] if page["cached"])
+            failed_pages = [page["page"] for page in result["pages"] if page["error"] is not None]
+
+            return {
+                "content": content,
+                "format": format_type,
+                "ocr": True,
+                "ai_provider": ai_provider,
+                "cached_pages": cached_pages,
+                # Páginas que falharam ficam vazias no conteúdo: o resultado é parcial e nunca vai para
+                # o cache, o armazenamento de artefatos ou o índice de similaridade
+                "partial": bool(failed_pages),
+                "failed_pages": failed_pages,
+                # Rota de cada página: "text" (camada de texto), "text+llm" (texto reformatado), "ocr"
+                # ou "similar" (página parecida já convertida)
+                "pages": [
+                    {
+                        "page": page["page"],
+                        "route": page["route"],
+                        "cached": page["cached"],
+                        "error": page["error"],
+                        **({"similarity": page["similarity"]} if "similarity" in page else {}),
+                    }
+                    for page in result["pages"]
+                ],
+            }, 200
+        except Exception as e:
+            print(f"Erro ao processar PDF com zerox: {str(e)}")
+            return {"error": f"Erro ao processar PDF: {str(e)}"}, 500
+
+    # Planilhas .xlsx e CSVs: conversão local, sem o MarkItDown
+    kind = tabular_kind(temp_path, format_type) if options.get("tabular") else None
+    if kind is not None:
+        return await aconvert_table(temp_path, kind, format_type, options, work_dir)
+
+    # Process other formats using MarkItDown
+    # Inicializar o provedor de IA correto
+    try:
+        # Valida o provedor (criado uma única vez por worker)
+        await asyncio.to_thread(provider_registry.get, ai_provider)
+
+        if ai_provider != "openai":
+            # Para outros provedores, passe o provedor de IA para o MarkItDown
+            # Nota: Isso exigiria modificar o MarkItDown para aceitar provedores personalizados
+            # Como isso não é possível sem modificar a biblioteca, usamos OpenAI como fallback
+            print(f"Aviso: Usando OpenAI para processamento não-OCR, pois MarkItDown não suporta {ai_provider} diretamente.")
+        md = await asyncio.to_thread(get_markitdown, model)
+
+        if pages is not None:
+            # O MarkItDown converte o arquivo inteiro: converte uma cópia só com as páginas/slides escolhidos
+            if format_type == "pdf":
+                temp_path = await asyncio.to_thread(trim_pdf, temp_path, pages, os.path.join(work_dir, "selected.pdf"))
+            else:
+                temp_path = await asyncio.to_thread(trim_pptx, temp_path, pages, os.path.join(work_dir, "selected.pptx"))
+
+        # O MarkItDown é síncrono: roda no pool de threads para não bloquear o loop
+        with stage("markitdown", ai_provider):
+            result = await asyncio.to_thread(md.convert, temp_path, llm_prompt=format_prompt)
+        return {"content": result.text_content, "format": format_type, "ai_provider": ai_provider}, 200
+
+    except ImportError as e:
+        return {"error": f"Provedor {ai_provider} requer dependências adicionais: {str(e)}"}, 400
+    except Exception as e:
+        return {"error": f"Erro ao inicializar provedor {ai_provider}: {str(e)}"}, 500
+
+
+def get_table_converter(temp_path: str, kind: str, options: Dict[str, Any]) -> TableConverter:
+    """Tabular converter configured with the sheets, limits and output format of the request"""
+    return TableConverter(
+        temp_path,
+        kind,
+        sheets=options.get("sheets"),
+        max_rows=options.get("max_rows"),
+        max_columns=options.get("max_columns"),
+        table_format=options.get("table_format", "markdown"),
+        chunk_rows=int(os.getenv("TABULAR_CHUNK_ROWS", "1000")),
+        sample_rows=int(os.getenv("TABULAR_SUMMARY_ROWS", "20")),
+    )
+
+
+async def summarize_table(converter: TableConverter, ai_provider: str) -> Dict[str, Any]:
+    """
+    Ask the model for a short summary of a converted table, from a sample of its rows
+
+    Returns:
+        Dictionary with "summary" or, if the call failed, "summary_error" (the table is still returned)
+    """
+    try:
+        provider = await asyncio.to_thread(provider_registry.get, ai_provider)
+        return {"summary": await provider.aprocess_chunks([converter.sample_text()], prompt=TABLE_SUMMARY_PROMPT)}
+    except Exception as e:
+        print(f"Erro ao resumir a tabela com {ai_provider}: {str(e)}")
+        return {"summary_error": str(e)}
+
+
+async def aconvert_table(
+    temp_path: str, kind: str, format_type: str, options: Dict[str, Any], work_dir: str
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Convert a spreadsheet or CSV locally, row by row, into markdown tables or JSONL
+
+    The rows are written to a file in the work directory as they are read, so memory does not
+    grow with the number of rows; the model is only called when a summary is requested. Outputs
+    larger than TABULAR_INLINE_MAX_MB are not read back: the payload has "content_file" (the path
+    of the output, to be streamed by the caller) and "content_bytes" instead of "content".
+    """
+    converter = get_table_converter(temp_path, kind, options)
+    output_path = os.path.join(work_dir, "output.md" if converter.table_format == "markdown" else "output.jsonl")
+    try:
+        with stage("tabular"):
+            sheets = await asyncio.to_thread(converter.write, output_path)
+        size = os.path.getsize(output_path)
+        if size <= TABULAR_INLINE_MAX_BYTES:
+            content = {"content": await asyncio.to_thread(read_text, output_path)}
+        else:
+            content = {"content_file": output_path, "content_bytes": size}
+    except TableOptionsError as e:
+        return {"error": str(e)}, 400
+    except Exception as e:
+        print(f"Erro ao converter a planilha localmente: {str(e)}")
+        return {"error": f"Erro ao processar planilha: {str(e)}"}, 500
+
+    payload = {
+        **content,
+        "format": format_type,
+        "tabular": True,
+        "table_format": converter.table_format,
+        "sheets": sheets,
+    }
+    if options.get("summarize"):
+        payload["ai_provider"] = options["ai_provider"]
+        payload.update(await summarize_table(converter, options["ai_provider"]))
+    return payload, 200
+
+
+def read_text(path: str) -> str:
+    """Read a UTF-8 text file written by a local converter (blocking)"""
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def iter_table_events(temp_path: str, kind: str, format_type: str, options: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Stream a spreadsheet or CSV as "rows" events of up to TABULAR_CHUNK_ROWS rows, without
+    keeping the converted table in memory; see iter_conversion_events
+    """
+    started = time.perf_counter()
+    converter = get_table_converter(temp_path, kind, options)
+    try:
+        for sheet, content in converter.iter_chunks():
+            yield {"event": "rows", "sheet": sheet, "content": content}
+    except TableOptionsError as e:
+        yield {"event": "error", "status": 400, "error": str(e)}
+        return
+    except Exception as e:
+        print(f"Erro ao converter a planilha localmente: {str(e)}")
+        yield {"event": "error", "status": 500, "error": f"Erro ao processar planilha: {str(e)}"}
+        return
+
+    summary = {}
+    if options.get("summarize"):
+        summary = async_runtime.run(summarize_table(converter, options["ai_provider"]))
+        yield {"event": "table_summary", **summary}
+    yield {
+        "event": "summary",
+        "status": 200,
+        "format": format_type,
+        "tabular": True,
+        "table_format": converter.table_format,
+        "sheets": converter.sheets,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def iter_conversion_events(temp_path: str, format_type: str, options: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Convert a file yielding streaming events
+
+    PDFs on the OCR path yield one "page" event per page as soon as it is ready (pages may arrive
+    out of order). Spreadsheets and CSVs on the tabular route yield "rows" events as they are read.
+    Other routes yield a single "result" event. A final "summary" event closes the stream.
+    """
+    started = time.perf_counter()
+    ai_provider = options["ai_provider"]
+
+    kind = tabular_kind(temp_path, format_type) if options.get("tabular") else None
+    if kind is not None:
+        CONVERSIONS_IN_PROGRESS.inc()
+        try:
+            yield from iter_table_events(temp_path, kind, format_type, options)
+        finally:
+            CONVERSIONS_IN_PROGRESS.dec()
+        return
+
+    if format_type != "pdf" or not options["use_ocr"] or ai_provider in TEXT_ONLY_PROVIDERS:
+        payload, status = convert_file(temp_path, format_type, options)
+        yield {"event": "result" if status == 200 else "error", "status": status, **payload}
+        yield {"event": "summary", "status": status, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+        return
+
+    try:
+        total_pages, selection = resolve_pages(temp_path, format_type, options)
+    except PageSelectionError as e:
+        yield {"event": "error", "status": 400, "error": str(e)}
+        return
+
+    print(f"Processando PDF com zerox (streaming) usando provedor: {ai_provider}")
+    pages = 0
+    cached_pages = 0
+    failed_pages: List[int] = []
+    input_tokens = 0
+    output_tokens = 0
+    routes: Dict[str, int] = {}
+    pages_iter = iter_ocr_pdf(
+        temp_path,
+        model=options["model"],
+        prompt=options["format_prompt"],
+        ai_provider=ai_provider,
+        concurrency=page_concurrency.resolve(ai_provider, options["model"], options.get("concurrency")),
+        page_cache=page_cache if options["use_cache"] else None,
+        work_dir=os.path.dirname(temp_path),
+        limits=page_concurrency,
+        text_layer=options.get("text_layer", False),
+        text_cleanup=ai_provider if options.get("text_cleanup") else None,
+        renderer=render_pool,
+        pages=selection,
+        similarity=similarity_index,
+        reuse_similar=options.get("reuse_similar", False),
+    )
+    CONVERSIONS_IN_PROGRESS.inc()
+    try:
+        for page in async_runtime.iterate(pages_iter):
+            pages += 1
+            cached_pages += page["cached"]
+            routes[page["route"]] = routes.get(page["route"], 0) + 1
+            if page["error"] is not None:
+                failed_pages.append(page["page"])
+            input_tokens += page["input_tokens"]
+            output_tokens += page["output_tokens"]
+            yield {"event": "page", **page}
+    except Exception as e:
+        print(f"Erro ao processar PDF com zerox: {str(e)}")
+        yield {"event": "error", "status": 500, "error": f"Erro ao processar PDF: {str(e)}"}
+        return
+    finally:
+        CONVERSIONS_IN_PROGRESS.dec()
+
+    yield {
+        "event": "summary",
+        "status": 200,
+        "format": format_type,
+        "ocr": True,
+        "ai_provider": ai_provider,
+        "pages": pages,
+        "total_pages": total_pages,
+        "cached_pages": cached_pages,
+        "partial": bool(failed_pages),
+        "failed_pages": sorted(failed_pages),
+        "routes": routes,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def stream_content(payload: Dict[str, Any], on_close: Optional[Callable[[], None]] = None) -> Response:
+    """
+    Build a JSON response whose "content" is read in chunks from payload["content_file"]
+
+    The body is the same document jsonify would return, but the content never has to fit in memory.
+    """
+    fields = {key: value for key, value in payload.items() if key != "content_file"}
+
+    def generate() -> Iterator[str]:
+        try:
+            head = json.dumps(fields, ensure_ascii=False)
+            yield head[:-1] + (", " if fields else "") + '"content": "'
+            with open(payload["content_file"], encoding="utf-8") as f:
+                while True:
+                    chunk = f.read(CONTENT_CHUNK_CHARS)
+                    if not chunk:
+                        break
+                    # Cada trecho é escapado como string JSON, sem as aspas
+                    yield json.dumps(chunk, ensure_ascii=False)[1:-1]
+            yield '"}'
+        finally:
+            if on_close is not None:
+                on_close()
+
+    return Response(generate(), mimetype="application/json")
+
+
+def stream_events(events: Iterator[Dict[str, Any]], stream_format: str, on_close: Optional[Callable[[], None]] = None) -> Response:
+    """
+    Build a streaming response from conversion events, as NDJSON or Server-Sent Events
+    """
+    def generate() -> Iterator[str]:
+        try:
+            for event in events:
+                data = json.dumps(event, ensure_ascii=False)
+                if stream_format == "sse":
+                    yield f"event: {event['event']}\ndata: {data}\n\n"
+                else:
+                    yield data + "\n"
+        finally:
+            if on_close is not None:
+                on_close()
+
+    mimetype = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    response = Response(generate(), mimetype=mimetype)
+    # Evita que proxies acumulem a resposta antes de repassá-la ao cliente
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def receive_batch(workspace: Workspace) -> List[Dict[str, Any]]:
+    """
+    Save the files of a batch request into the batch workspace
+
+    Accepts multipart/form-data (every file part is a document) or a zip archive as the raw body
+    (every member is a document).
+
+    Raises:
+        BatchError: If the request has no files, too many files or an invalid zip
+        UploadTooLargeError: If the batch is larger than BATCH_MAX_MB
+    """
+    items: List[Dict[str, Any]] = []
+    if request.mimetype == "multipart/form-data":
+        total = 0
+        for field, upload in request.files.items(multi=True):
+            if len(items) >= BATCH_MAX_FILES:
+                raise BatchError(f"Batch has more than {BATCH_MAX_FILES} files")
+            filename = upload.filename or field
+            path = item_path(workspace.path, len(items), filename)
+            size, file_hash = copy_stream(
+                upload.stream, path, max_bytes=BATCH_MAX_BYTES - total, chunk_size=UPLOAD_CHUNK_BYTES
+            )
+            total += size
+            items.append(
+                {
+                    "filename": filename,
+                    "path": path,
+                    "content_type": get_part_content_type(upload),
+                    "size": size,
+                    "file_hash": file_hash,
+                }
+            )
+    elif request.mimetype in ZIP_CONTENT_TYPES:
+        zip_path = workspace.file_path("batch.zip")
+        copy_stream(request.stream, zip_path, max_bytes=BATCH_MAX_BYTES, chunk_size=UPLOAD_CHUNK_BYTES)
+        try:
+            items = extract_zip(zip_path, workspace.path, BATCH_MAX_FILES, BATCH_MAX_BYTES, UPLOAD_CHUNK_BYTES)
+        finally:
+            os.remove(zip_path)
+    else:
+        raise BatchError("Send the files as multipart/form-data or as a zip archive (application/zip)")
+
+    if not items:
+        raise BatchError("No files provided")
+    for item in items:
+        _, item["format_type"] = is_supported_format(item["content_type"])
+    return items
+
+
+async def aconvert_batch(items: List[Dict[str, Any]], args: Mapping[str, str]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Convert the files of a batch concurrently, yielding one result per file as soon as it is ready
+
+    Every file goes through the same routing as /convert and the result cache. At most
+    BATCH_CONCURRENCY files are converted at the same time (OCR pages still share the worker-wide
+    page limits), and identical files are converted only once.
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    duplicates = find_duplicates(items)
+
+    async def convert_item(item: Dict[str, Any]) -> Dict[str, Any]:
+        format_type = item["format_type"]
+        if not format_type:
+            return {
+                "status": 400,
+                "error": f"Unsupported file type: {item['content_type'] or 'unknown'}. Please provide a supported format.",
+            }
+
+        options = get_conversion_options(args, format_type)
+        cache_key = get_cache_key(item["file_hash"], format_type, options)
+        if cache_key is not None:
+            # Cache em disco e índice SQLite do armazém: bloqueantes, fora do loop compartilhado
+            cached, _ = await asyncio.to_thread(lookup_result, cache_key)
+            if cached is not None:
+                return {"status": 200, "cached": True, **cached}
+
+        async with semaphore:
+            CONVERSIONS_IN_PROGRESS.inc()
+            try:
+                payload, status = await aconvert_file(
+                    item["path"],
+                    format_type,
+                    options,
+                    work_dir=os.path.dirname(item["path"]),
+                    file_hash=item["file_hash"],
+                    cache_key=cache_key,
+                )
+            finally:
+                CONVERSIONS_IN_PROGRESS.dec()
+        if "content_file" in payload:
+            # Os resultados do lote vão inteiros na resposta: tabelas grandes ficam para /convert ou /jobs
+            return {
+                "status": 413,
+                "cached": False,
+                "error": (
+                    f"Converted table is larger than {TABULAR_INLINE_MAX_BYTES // (1024 * 1024)} MB; "
+                    "convert this file with /convert or /jobs"
+                ),
+            }
+        if cache_key is not None and is_complete(payload, status):
+            await asyncio.to_thread(result_cache.set, cache_key, payload)
+        return {"status": status, "cached": False, **payload}
+
+    async def run_item(index: int) -> Dict[str, Any]:
+        item = items[index]
+        started = time.perf_counter()
+        if index in duplicates:
+            # Mesmo conteúdo de um arquivo anterior do lote: reaproveita a conversão dele
+            original = duplicates[index]
+            result = {**(await tasks[original]), "duplicate_of": items[original]["filename"]}
+        else:
+            try:
+                result = await convert_item(item)
+            except Exception as e:
+                print(f"Erro ao converter {item['filename']} do lote: {str(e)}")
+                result = {"status": 500, "cached": False, "error": str(e)}
+            result["duplicate_of"] = None
+        result.update(
+            {
+                "index": index,
+                "filename": item["filename"],
+                "size": item["size"],
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+        )
+        return result
+
+    tasks: List[asyncio.Future] = []
+    tasks.extend(asyncio.ensure_future(run_item(index)) for index in range(len(items)))
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        # Se o cliente desconectar no meio do stream, não continua convertendo
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def iter_batch_events(items: List[Dict[str, Any]], args: Mapping[str, str]) -> Iterator[Dict[str, Any]]:
+    """
+    Run a batch on the worker's event loop, yielding a "file" event per file and a final "summary" event
+    """
+    started = time.perf_counter()
+    summary = {"files": len(items), "succeeded": 0, "failed": 0, "cached": 0, "duplicates": 0}
+    for result in async_runtime.iterate(aconvert_batch(items, args)):
+        summary["succeeded" if result["status"] == 200 else "failed"] += 1
+        summary["cached"] += bool(result.get("cached"))
+        summary["duplicates"] += result["duplicate_of"] is not None
+        yield {"event": "file", **result}
+    yield {"event": "summary", "status": 200, **summary, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+def run_job(file_path: str, params: Dict[str, Any], progress: Callable[[int, int], None]) -> Tuple[Dict[str, Any], int]:
+    """
+    Job queue handler: convert a queued file, using and filling the result cache
+    """
+    format_type = params["format_type"]
+    options = params["options"]
+    cache_key = get_cache_key(params["file_hash"], format_type, options)
+    if cache_key is not None:
+        cached, _ = lookup_result(cache_key)
+        if cached is not None:
+            return cached, 200
+
+    JOBS_IN_PROGRESS.inc()
+    try:
+        payload, status = convert_file(
+            file_path, format_type, options, progress=progress, file_hash=params["file_hash"], cache_key=cache_key
+        )
+    finally:
+        JOBS_IN_PROGRESS.dec()
+    if format_type != "pdf" or not options["use_ocr"]:
+        progress(1, 1)
+    if cache_key is not None and is_complete(payload, status):
+        result_cache.set(cache_key, payload)
+    return payload, status
+
+
+# Fila de jobs assíncronos, compartilhada por todos os workers através de SQLite
+job_queue = JobQueue.from_env(handler=run_job)
+
+
+@app.before_request
+def start_request_metrics():
+    """Start the per-stage timings of the request (reported in the Server-Timing header)"""
+    start_request_timings()
+    g.metric_labels = {"format": "", "provider": ""}
+
+
+@app.after_request
+def record_request_metrics(response: Response) -> Response:
+    """
+    Record request count, latency and response size, and add the Server-Timing header
+
+    For streaming responses this runs before the body is sent, so latency is the time to first byte.
+    """
+    timings = current_timings()
+    if timings is None or request.endpoint == "metrics":
+        return response
+
+    labels = getattr(g, "metric_labels", {"format": "", "provider": ""})
+    endpoint = request.endpoint or "unknown"
+    REQUESTS.labels(endpoint=endpoint, status=str(response.status_code), **labels).inc()
+    REQUEST_LATENCY.labels(endpoint=endpoint, **labels).observe(time.perf_counter() - timings.started)
+    if not response.is_streamed and response.content_length:
+        BYTES.labels(direction="out").inc(response.content_length)
+    response.headers["Server-Timing"] = timings.header()
+    return response
+
+
+def set_metric_labels(format_type: str, ai_provider: str) -> None:
+    """Label the current request's metrics with its format and provider"""
+    g.metric_labels = {"format": format_type, "provider": ai_provider}
+
+
+def llama_server_stats() -> Dict[str, Any]:
+    """
+    Queue and generation stats of the shared llama_local inference service
+
+    The client is created once per worker and closed with the other registry resources.
+    """
+    from llama_server import LlamaClient
+
+    client = provider_registry.get_resource(("client", "llama_server"), LlamaClient)
+    return client.stats(timeout=2.0)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus metrics, aggregated across gunicorn workers when PROMETHEUS_MULTIPROC_DIR is set"""
+    if not PROMETHEUS_AVAILABLE:
+        return jsonify({"error": "prometheus_client não está instalado. Instale com 'pip install prometheus-client'."}), 503
+    # Fila e taxa de geração do serviço local do Llama, que não grava no diretório de métricas
+    body, content_type = render_metrics(llama_server_stats if LlamaLocalProvider.use_server() else None)
+    return Response(body, content_type=content_type)
+
+
 @app.route("/health", methods=["GET"])
 def health():
     """Health check endpoint"""
     return jsonify({"status": "healthy"}), 200
 
 
+@app.route("/startup", methods=["GET"])
+def startup():
+    """
+    Startup report of the worker that serves the request: time to load the app and to get ready,
+    SDKs imported on demand (with their import time) and memory shared with the gunicorn master
+    """
+    return jsonify(startup_report()), 200
+
+
 @app.route("/convert", methods=["POST"])
 def convert():
     """
     Convert various file formats to markdown
     Supports: PDF, PowerPoint, Word, Excel, Images, Audio, HTML, and text-based formats
 
+    The file is sent either as the raw request body (with its Content-Type) or as
+    multipart/form-data in the "file" field.
+
     Query Parameters:
         ocr (bool): Whether to use OCR processing for PDFs (default: True)
         ai_provider (str): AI provider to use (openai, gemini, anthropic, grok, llama_local)
+        cache (bool): Whether to use the result and OCR page caches (default: True)
+        stream (bool): Stream the conversion as events, one per PDF page (default: False)
+        stream_format (str): "ndjson" or "sse" (default: "sse" if Accept is text/event-stream, else "ndjson")
+        concurrency (int): OCR pages sent to the model at the same time (default: provider/model config)
+        text_layer (bool): Extract PDF pages that have a text layer locally instead of OCR (default: True)
+        text_cleanup (bool): Reformat locally extracted pages with a text-only model call (default: False)
+        pages (str): PDF pages or PowerPoint slides to convert, e.g. "1-3,10" or "5-" (default: all)
+        max_pages (int): Convert at most this many of the selected pages (default: no limit)
+        reuse_similar (bool): Return the earlier conversion of a near-duplicate text-layer PDF and reuse
+            near-duplicate OCR pages whose content is confirmed (default: false)
+        tabular (bool): Convert .xlsx and CSV files locally, row by row, without the model (default: True)
+        sheets (str): Spreadsheet sheets to convert, by name or position, e.g. "Sales,3" (default: all)
+        max_rows (int): Convert at most this many data rows per sheet (default: no limit)
+        max_columns (int): Convert at most this many columns per sheet (default: no limit)
+        table_format (str): "markdown" tables or "jsonl" records (default: "markdown")
+        summarize (bool): Add a model-written summary of the table, from a sample of rows (default: False)
+
+    Response Headers:
+        X-Cache: HIT, MISS or BYPASS
     """
     try:
-        # Get the binary data and content type
-        file_data = request.get_data()
-        content_type = request.content_type
+        # Get the upload stream (raw body or multipart "file" field) and content type
+        if request.content_length and request.content_length > MAX_UPLOAD_BYTES:
+            return jsonify({"error": f"File too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"}), 413
+        upload, content_type = get_upload_source()
 
-        if not file_data:
+        if upload is None:
             return jsonify({"error": "No file data provided"}), 400
 
         # Check if the file format is supported
@@ -120,132 +1210,281 @@ def convert():
                 }
             ), 400
 
+        try:
+            options = get_conversion_options(request.args, format_type)
+        except (PageSelectionError, TableOptionsError) as e:
+            return jsonify({"error": str(e)}), 400
+        set_metric_labels(format_type, options["ai_provider"])
+
+        stream_format = None
+        if request.args.get("stream", "false").lower() == "true":
+            stream_format = request.args.get("stream_format") or (
+                "sse" if "text/event-stream" in request.headers.get("Accept", "") else "ndjson"
+            )
+
+        # Cada requisição grava em um diretório próprio, para que uploads simultâneos não colidam
+        try:
+            workspace = workspaces.create(expected_bytes=request.content_length or 0)
+        except WorkspaceLimitError as e:
+            response = jsonify({"error": str(e)})
+            response.headers["Retry-After"] = "5"
+            return response, 503
+
         # Determine file extension from content type
         extension = mimetypes.guess_extension(content_type) or ""
-        temp_filename = f"temp_file{extension}"
-        temp_path = os.path.join("uploads", temp_filename)
-
-        # Save the binary data to a temporary file
-        os.makedirs("uploads", exist_ok=True)
-        with open(temp_path, "wb") as f:
-            f.write(file_data)
+        temp_path = workspace.file_path(f"input{extension}")
 
+        # Save the upload to a temporary file in chunks, hashing it along the way
         try:
-            # Get AI provider from query parameter or environment
-            ai_provider = request.args.get("ai_provider") or os.getenv("AI_PROVIDER", "openai")
-            
-            # Configurar os modelos específicos para cada provedor com base em variáveis de ambiente
-            if ai_provider == "openai":
-                model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-            elif ai_provider == "gemini":
-                model = os.getenv("GEMINI_MODEL", "gemini-1.0-pro")  # Usando 1.0-pro como padrão mais estável
-            elif ai_provider == "anthropic":
-                model = os.getenv("ANTHROPIC_MODEL", "claude-3-sonnet-20240229")
-            elif ai_provider == "grok":
-                model = os.getenv("GROK_MODEL", "grok-2")
-            elif ai_provider == "llama_local":
-                model = "local_model"  # Modelo é definido pelo caminho do arquivo no LlamaProvider
-            else:
-                model = os.getenv("LLM_MODEL", "gpt-4o-mini")
-                
-            format_prompt = get_format_specific_prompt(format_type)
-
-            # Process PDF with OCR
-            use_ocr = request.args.get("ocr", "true").lower() == "true"
-
-            if format_type == "pdf" and use_ocr:
-                output_dir = os.path.join("uploads", "output")
-                os.makedirs(output_dir, exist_ok=True)
-                
-                # Se o provedor for Gemini, use diretamente a classe específica
-                if ai_provider == "gemini":
-                    try:
-                        print(f"Processando PDF com {ai_provider}Provider diretamente")
-                        # Extrair texto do PDF
-                        import PyPDF2
-                        text = ""
-                        with open(temp_path, "rb") as pdf_file:
-                            pdf_reader = PyPDF2.PdfReader(pdf_file)
-                            for page_num in range(len(pdf_reader.pages)):
-                                text += pdf_reader.pages[page_num].extract_text() + "\n\n"
-                        
-                        # Processar com o provedor específico
-                        try:
-                            from ai_providers import GeminiProvider
-                            provider = GeminiProvider()
-                                
-                            content = provider.process_document(text, prompt=format_prompt)
-                            
-                            return jsonify({
-                                "content": content, 
-                                "format": format_type, 
-                                "ocr": True, 
-                                "ai_provider": ai_provider
-                            })
-                        except ImportError as e:
-                            return jsonify({"error": str(e)}), 400
-                    except Exception as e:
-                        print(f"Erro ao processar PDF com {ai_provider}Provider: {str(e)}")
-                        # Continua para o método padrão se falhar
-                
-                # Método padrão usando zerox para outros provedores
-                try:
-                    print(f"Processando PDF com zerox usando provedor: {ai_provider}")
-                    result = asyncio.run(
-                        zerox(
-                            file_path=temp_path,
-                            model=model,
-                            output_dir=output_dir,
-                            custom_system_prompt=format_prompt,
-                            cleanup=True,
-                            concurrency=3,
-                            ai_provider=ai_provider,  # Pass the AI provider to zerox
-                        )
+            file_size, file_hash = save_upload(upload, temp_path)
+        except (UploadTooLargeError, RequestEntityTooLarge):
+            workspace.cleanup()
+            return jsonify({"error": f"File too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"}), 413
+        except Exception:
+            workspace.cleanup()
+            raise
+
+        if file_size == 0:
+            workspace.cleanup()
+            return jsonify({"error": "No file data provided"}), 400
+
+        # Consulta o cache de resultados antes de qualquer processamento
+        cache_key = get_cache_key(file_hash, format_type, options)
+        if cache_key is not None:
+            cached, tier = lookup_result(cache_key)
+            if cached is not None:
+                workspace.cleanup()
+                if stream_format:
+                    response = stream_events(
+                        iter([{"event": "result", "status": 200, **cached}, {"event": "summary", "status": 200}]),
+                        stream_format,
                     )
+                else:
+                    response = jsonify(cached)
+                response.headers["X-Cache"] = "HIT"
+                response.headers["X-Cache-Tier"] = tier
+                return response, 200
+
+        if stream_format:
+            # O diretório só é removido quando o stream termina; o cache de resultados não é preenchido
+            # aqui para não acumular o documento inteiro em memória (o cache de páginas continua ativo)
+            response = stream_events(
+                iter_conversion_events(temp_path, format_type, options), stream_format, workspace.cleanup
+            )
+            response.headers["X-Cache"] = "MISS" if cache_key is not None else "BYPASS"
+            return response
+
+        payload = {}
+        try:
+            payload, status = convert_file(temp_path, format_type, options, file_hash=file_hash, cache_key=cache_key)
+            workspace.failed = status >= 400
+        except Exception:
+            workspace.failed = True
+            raise
+        finally:
+            # Cleanup temporary files (tabelas grandes são lidas do diretório até o fim da resposta)
+            if "content_file" not in payload:
+                workspace.cleanup()
+
+        if "content_file" in payload:
+            response = stream_content(payload, workspace.cleanup)
+            response.headers["X-Cache"] = "MISS" if cache_key is not None else "BYPASS"
+            return response, status
+
+        if cache_key is not None and is_complete(payload, status):
+            result_cache.set(cache_key, payload)
 
-                    content = ""
-                    if hasattr(result, "pages") and result.pages:
-                        content = "\n\n".join(page.content for page in result.pages)
+        response = jsonify(payload)
+        response.headers["X-Cache"] = "MISS" if cache_key is not None else "BYPASS"
+        return response, status
 
-                    return jsonify({"content": content, "format": format_type, "ocr": True, "ai_provider": ai_provider})
-                except Exception as e:
-                    print(f"Erro ao processar PDF com zerox: {str(e)}")
-                    return jsonify({"error": f"Erro ao processar PDF: {str(e)}"}), 500
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/convert/batch", methods=["POST"])
+def convert_batch():
+    """
+    Convert many files in one request
+
+    The files are sent as multipart/form-data (any number of file fields) or as a zip archive
+    in the request body (Content-Type: application/zip). Each file is routed like /convert.
+
+    Query Parameters:
+        ocr, ai_provider, cache, concurrency, pages, max_pages: Same as /convert, applied to every file
+        stream (bool): Stream one event per file as soon as it is converted (default: False)
+        stream_format (str): "ndjson" or "sse", as in /convert
+        output (str): "json" (default, one document with all results) or "jsonl" (one line per file)
+    """
+    # O lote inteiro pode ser maior que o limite de um único arquivo
+    request.max_content_length = BATCH_MAX_BYTES
+    try:
+        read_selection(request.args.get("pages"), request.args.get("max_pages"))
+        read_table_options(request.args)
+    except (PageSelectionError, TableOptionsError) as e:
+        return jsonify({"error": str(e)}), 400
+    if request.content_length and request.content_length > BATCH_MAX_BYTES:
+        return jsonify({"error": f"Batch too large. Maximum size is {BATCH_MAX_BYTES // (1024 * 1024)} MB"}), 413
+
+    try:
+        workspace = workspaces.create(expected_bytes=request.content_length or 0)
+    except WorkspaceLimitError as e:
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+
+    try:
+        with stage("upload"):
+            items = receive_batch(workspace)
+        BYTES.labels(direction="in").inc(sum(item["size"] for item in items))
+    except BatchError as e:
+        workspace.cleanup()
+        return jsonify({"error": str(e)}), 400
+    except (UploadTooLargeError, RequestEntityTooLarge):
+        workspace.cleanup()
+        return jsonify({"error": f"Batch too large. Maximum size is {BATCH_MAX_BYTES // (1024 * 1024)} MB"}), 413
+    except Exception as e:
+        workspace.failed = True
+        workspace.cleanup()
+        return jsonify({"error": str(e)}), 500
+
+    # Os eventos são gerados fora do contexto da requisição, então os parâmetros são copiados
+    args = request.args.to_dict()
+    events = iter_batch_events(items, args)
+
+    if args.get("stream", "false").lower() == "true":
+        stream_format = args.get("stream_format") or (
+            "sse" if "text/event-stream" in request.headers.get("Accept", "") else "ndjson"
+        )
+        return stream_events(events, stream_format, on_close=workspace.cleanup)
+
+    try:
+        results = list(events)
+    except Exception as e:
+        workspace.failed = True
+        return jsonify({"error": str(e)}), 500
+    finally:
+        workspace.cleanup()
 
-            # Process other formats using MarkItDown
-            # Inicializar o provedor de IA correto
+    summary = results.pop()
+    files = sorted(results, key=lambda result: result["index"])
+    for result in files:
+        del result["event"]
+    del summary["event"], summary["status"]
+
+    if args.get("output", "json").lower() == "jsonl":
+        body = "".join(json.dumps(result, ensure_ascii=False) + "\n" for result in files)
+        return Response(body, mimetype="application/x-ndjson"), 200
+    return jsonify({"results": files, "summary": summary}), 200
+
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    """
+    Queue a conversion and return immediately with a job id
+    Accepts the same body and query parameters as /convert
+
+    Query Parameters:
+        priority (int): Higher priorities are processed first (default: 0)
+        callback_url (str): URL that receives a POST with the final job status
+    """
+    try:
+        if request.content_length and request.content_length > MAX_UPLOAD_BYTES:
+            return jsonify({"error": f"File too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"}), 413
+        upload, content_type = get_upload_source()
+
+        if upload is None:
+            return jsonify({"error": "No file data provided"}), 400
+
+        is_supported, format_type = is_supported_format(content_type)
+        if not is_supported:
+            return jsonify(
+                {
+                    "error": f"Unsupported file type: {content_type}. Please provide a supported format."
+                }
+            ), 400
+
+        try:
+            priority = int(request.args.get("priority", "0"))
+        except ValueError:
+            return jsonify({"error": "priority must be an integer"}), 400
+
+        callback_url = request.args.get("callback_url")
+        if callback_url:
             try:
-                ai_provider_instance = AIProvider.get_provider(ai_provider)
-                
-                # Para compatibilidade, se estiver usando OpenAI, continue usando o cliente existente
-                if ai_provider == "openai":
-                    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-                    md = MarkItDown(llm_client=client, llm_model=model)
-                else:
-                    # Para outros provedores, passe o provedor de IA para o MarkItDown
-                    # Nota: Isso exigiria modificar o MarkItDown para aceitar provedores personalizados
-                    # Como isso não é possível sem modificar a biblioteca, usamos OpenAI como fallback
-                    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-                    md = MarkItDown(llm_client=client, llm_model=model)
-                    print(f"Aviso: Usando OpenAI para processamento não-OCR, pois MarkItDown não suporta {ai_provider} diretamente.")
-                
-                result = md.convert(temp_path, llm_prompt=format_prompt)
-                return jsonify({"content": result.text_content, "format": format_type, "ai_provider": ai_provider})
-                
-            except ImportError as e:
-                return jsonify({"error": f"Provedor {ai_provider} requer dependências adicionais: {str(e)}"}), 400
-            except Exception as e:
-                return jsonify({"error": f"Erro ao inicializar provedor {ai_provider}: {str(e)}"}), 500
+                job_queue.check_callback_url(callback_url)
+            except CallbackURLError as e:
+                return jsonify({"error": str(e)}), 400
 
-        finally:
-            # Cleanup temporary file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        try:
+            read_selection(request.args.get("pages"), request.args.get("max_pages"))
+            read_table_options(request.args)
+        except (PageSelectionError, TableOptionsError) as e:
+            return jsonify({"error": str(e)}), 400
+
+        # O arquivo fica em um diretório de trabalho até ser processado por qualquer worker; esse
+        # diretório também serve para a conversão e conta nos limites de quantidade e espaço
+        job_id = job_queue.new_job_id()
+        try:
+            job_dir = workspaces.create(
+                expected_bytes=request.content_length or 0, name=job_queue.job_dir_name(job_id)
+            ).path
+        except WorkspaceLimitError as e:
+            response = jsonify({"error": str(e)})
+            response.headers["Retry-After"] = "30"
+            return response, 503
+        extension = mimetypes.guess_extension(content_type) or ""
+        file_path = os.path.join(job_dir, f"input{extension}")
+        try:
+            file_size, file_hash = save_upload(upload, file_path)
+        except (UploadTooLargeError, RequestEntityTooLarge):
+            shutil.rmtree(job_dir, ignore_errors=True)
+            return jsonify({"error": f"File too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"}), 413
+        except Exception:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+        if file_size == 0:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            return jsonify({"error": "No file data provided"}), 400
+
+        params = {
+            "format_type": format_type,
+            "file_hash": file_hash,
+            "options": get_conversion_options(request.args, format_type),
+        }
+        set_metric_labels(format_type, params["options"]["ai_provider"])
+        job_queue.submit(job_id, file_path, params, priority=priority, callback_url=callback_url)
+
+        return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}), 202
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id: str):
+    """Return the status, progress and (when finished) the result of a job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job not found: {job_id}"}), 404
+    return jsonify(job), 200
+
+
+@app.route("/jobs/<job_id>/content", methods=["GET"])
+def get_job_content(job_id: str):
+    """Download the content of a finished job whose result was too large to return inline (see content_url)"""
+    path = job_queue.content_path(job_id)
+    if path is None:
+        return jsonify({"error": f"Job content not found: {job_id}"}), 404
+    mimetype = "application/x-ndjson" if path.endswith(".jsonl") else "text/markdown"
+    return send_file(os.path.abspath(path), mimetype=mimetype, conditional=True)
+
+
+# Fim da carga da aplicação (no master, com GUNICORN_PRELOAD=true); veja GET /startup
+mark("app_loaded")
+
+
 if __name__ == "__main__":
     # Load environment variables
     load_dotenv()
@@ -253,5 +1492,9 @@ if __name__ == "__main__":
     # Create uploads directory if it doesn't exist
     os.makedirs("uploads", exist_ok=True)
 
+    # Pré-carrega os provedores configurados (no gunicorn isso é feito pelo gunicorn.conf.py)
+    provider_registry.warmup(os.getenv("PROVIDER_WARMUP", "").split(","))
+    job_queue.start()
+
     # Run the Flask app
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,221 @@
+"""
+Métricas e tempos por etapa do Leitor Doc PyZerox
+Expõe contadores e histogramas no formato do Prometheus (rota `/metrics`) e monta o cabeçalho
+`Server-Timing` de cada resposta com o tempo gasto em cada etapa (upload, renderização, chamadas ao
+modelo, MarkItDown, pós-processamento).
+
+Com vários workers do gunicorn, defina `PROMETHEUS_MULTIPROC_DIR` (antes de iniciar o servidor): cada
+worker grava suas métricas nesse diretório e `/metrics` soma os valores de todos. Sem a biblioteca
+`prometheus_client` instalada, as métricas viram operações vazias e apenas o `Server-Timing` é enviado.
+O estado do serviço local do Llama (fila e tokens por segundo), que roda fora dos workers, é lido a cada
+consulta a `/metrics`.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+    from prometheus_client import multiprocess
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _NoopMetric:
+    """Substituto das métricas quando o prometheus_client não está instalado"""
+
+    def labels(self, *args: Any, **kwargs: Any) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+REQUEST_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+if PROMETHEUS_AVAILABLE:
+    REQUESTS = Counter(
+        "leitor_requests_total", "Requisições atendidas", ["endpoint", "format", "provider", "status"]
+    )
+    REQUEST_LATENCY = Histogram(
+        "leitor_request_duration_seconds",
+        "Duração das requisições (até o primeiro byte, em respostas em streaming)",
+        ["endpoint", "format", "provider"],
+        buckets=REQUEST_BUCKETS,
+    )
+    STAGE_LATENCY = Histogram(
+        "leitor_stage_duration_seconds", "Duração de cada etapa da conversão", ["stage", "provider"], buckets=STAGE_BUCKETS
+    )
+    TOKENS = Counter("leitor_tokens_total", "Tokens enviados e recebidos dos modelos", ["provider", "direction"])
+    BYTES = Counter("leitor_bytes_total", "Bytes recebidos (uploads) e enviados (respostas)", ["direction"])
+    CACHE_LOOKUPS = Counter("leitor_cache_lookups_total", "Consultas aos caches", ["cache", "result"])
+    CONVERSIONS_IN_PROGRESS = Gauge(
+        "leitor_conversions_in_progress", "Conversões em andamento", multiprocess_mode="livesum"
+    )
+    JOBS_IN_PROGRESS = Gauge("leitor_jobs_in_progress", "Jobs assíncronos em execução", multiprocess_mode="livesum")
+    PROVIDER_ERRORS = Counter("leitor_provider_errors_total", "Erros retornados pelos provedores", ["provider", "status"])
+    PROVIDER_RETRIES = Counter("leitor_provider_retries_total", "Novas tentativas de chamadas aos provedores", ["provider"])
+    PROVIDER_FAILOVERS = Counter(
+        "leitor_provider_failovers_total", "Chamadas desviadas para o próximo provedor da cadeia", ["source", "target"]
+    )
+    PROVIDER_HEDGES = Counter("leitor_provider_hedges_total", "Chamadas lentas duplicadas em outro provedor", ["provider"])
+else:
+    REQUESTS = REQUEST_LATENCY = STAGE_LATENCY = TOKENS = BYTES = CACHE_LOOKUPS = _NoopMetric()
+    CONVERSIONS_IN_PROGRESS = JOBS_IN_PROGRESS = PROVIDER_ERRORS = PROVIDER_RETRIES = _NoopMetric()
+    PROVIDER_FAILOVERS = PROVIDER_HEDGES = _NoopMetric()
+
+
+class RequestTimings:
+    """Tempo acumulado por etapa de uma requisição, para o cabeçalho `Server-Timing`"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            total, count = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (total + seconds, count + 1)
+
+    def header(self) -> str:
+        """
+        Valor do cabeçalho `Server-Timing`
+
+        Etapas que rodam em paralelo (por exemplo, as páginas do OCR) são somadas, então a soma pode
+        passar do tempo total; a descrição informa quantas vezes a etapa rodou.
+        """
+        with self._lock:
+            stages = dict(self.stages)
+        parts = [
+            f'{stage};dur={total * 1000:.1f};desc="{count}x"' for stage, (total, count) in stages.items()
+        ]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+# Tempos da requisição atual; propagado para as tarefas e threads criadas a partir dela
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> RequestTimings:
+    """Inicia a contagem de tempos da requisição atual"""
+    timings = RequestTimings()
+    _current_timings.set(timings)
+    return timings
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current_timings.get()
+
+
+async def with_timings(timings: Optional[RequestTimings], coro: Any) -> Any:
+    """
+    Executa uma corrotina com os tempos da requisição que a agendou
+
+    As corrotinas rodam no event loop compartilhado, fora do contexto da thread da requisição.
+    """
+    token = _current_timings.set(timings)
+    try:
+        return await coro
+    finally:
+        _current_timings.reset(token)
+
+
+def record_stage(stage: str, seconds: float, provider: str = "") -> None:
+    """Registra a duração de uma etapa no histograma e nos tempos da requisição atual"""
+    STAGE_LATENCY.labels(stage=stage, provider=provider).observe(seconds)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def stage(name: str, provider: str = "") -> Iterator[None]:
+    """Mede a duração do bloco como a etapa `name`"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started, provider)
+
+
+def record_tokens(provider: str, input_tokens: int, output_tokens: int) -> None:
+    if input_tokens:
+        TOKENS.labels(provider=provider, direction="input").inc(input_tokens)
+    if output_tokens:
+        TOKENS.labels(provider=provider, direction="output").inc(output_tokens)
+
+
+def record_provider_error(provider: str, status: Optional[int]) -> None:
+    PROVIDER_ERRORS.labels(provider=provider, status=str(status or "unknown")).inc()
+
+
+class LlamaServerCollector:
+    """
+    Métricas do serviço local do Llama, lidas de `stats` (o GET /stats do serviço) a cada coleta
+
+    O serviço é um processo à parte, sem acesso ao diretório de métricas dos workers; se ele não
+    responder, só `leitor_llama_server_up` é exportada, com valor 0.
+    """
+
+    def __init__(self, stats: Callable[[], Dict[str, Any]]):
+        self.stats = stats
+
+    def collect(self) -> Iterator[Any]:
+        try:
+            stats = self.stats()
+        except Exception:
+            stats = None
+        yield GaugeMetricFamily("leitor_llama_server_up", "Serviço local do Llama respondendo", value=int(stats is not None))
+        if stats is None:
+            return
+        yield GaugeMetricFamily("leitor_llama_server_queue_depth", "Chamadas na fila do serviço local do Llama", value=stats["queue_depth"])
+        yield GaugeMetricFamily("leitor_llama_server_max_queue", "Tamanho máximo da fila do serviço local do Llama", value=stats["max_queue"])
+        yield GaugeMetricFamily("leitor_llama_server_active_slots", "Contextos do Llama gerando", value=stats["active"])
+        yield GaugeMetricFamily("leitor_llama_server_slots", "Contextos do Llama disponíveis", value=stats["slots"])
+        yield GaugeMetricFamily(
+            "leitor_llama_server_tokens_per_second", "Tokens gerados por segundo (último minuto)", value=stats["tokens_per_second"]
+        )
+        yield CounterMetricFamily("leitor_llama_server_tokens", "Tokens gerados pelo serviço local do Llama", value=stats["tokens_generated"])
+        requests = CounterMetricFamily("leitor_llama_server_requests", "Chamadas atendidas pelo serviço local do Llama", labels=["result"])
+        requests.add_metric(["completed"], stats["completed"])
+        requests.add_metric(["failed"], stats["failed"])
+        yield requests
+
+
+def render_metrics(llama_stats: Optional[Callable[[], Dict[str, Any]]] = None) -> Tuple[bytes, str]:
+    """
+    Conteúdo da rota `/metrics`
+
+    Com `PROMETHEUS_MULTIPROC_DIR` definido, soma as métricas gravadas por todos os workers. Com
+    `llama_stats`, inclui as métricas do serviço local do Llama.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    body = generate_latest(registry)
+    if llama_stats is not None:
+        # Registro próprio: o serviço é consultado só nas coletas de /metrics
+        llama_registry = CollectorRegistry()
+        llama_registry.register(LlamaServerCollector(llama_stats))
+        body += generate_latest(llama_registry)
+    return body, CONTENT_TYPE_LATEST
@@ -0,0 +1,450 @@
+"""
+OCR de PDFs página a página para o Leitor Doc PyZerox
+Este módulo reproduz o fluxo do zerox (PDF -> imagens -> modelo de visão), mas renderiza as páginas
+antes de chamar o modelo para que cada imagem possa ser identificada pelo seu hash. Páginas já vistas
+são recuperadas do cache e apenas as demais são enviadas ao modelo.
+"""
+import asyncio
+import mimetypes
+import os
+import tempfile
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from pdf2image import pdfinfo_from_path
+
+from ai_providers import VISION_PROVIDERS, provider_registry, provider_scheduler, resolve_model
+from artifacts import ArtifactStore
+from cache import ResultCache, hash_bytes, make_cache_key
+from concurrency import PageConcurrency
+from images import image_cache, load_image
+from metrics import record_tokens, stage
+from render import RenderPool
+from similarity import SimilarityIndex, dhash, page_confirmation
+from startup import lazy_import
+from text_layer import TEXT_CLEANUP_PROMPT, classify_pdf_pages, iter_page_texts, text_to_markdown
+
+if TYPE_CHECKING:
+    from vision import VisionModel
+
+# Tokens estimados de uma página (imagem e resposta) para o limite de tokens por minuto do provedor
+PAGE_TOKENS = int(os.getenv("PAGE_TOKENS_ESTIMATE", "2000"))
+
+
+def get_vision_model(model: str, prompt: str, ai_provider: str, **kwargs: Any) -> "VisionModel":
+    """
+    Retorna o modelo de visão compartilhado pelo worker
+
+    A criação do `litellmmodel` valida credenciais e acesso ao modelo pela rede, então a instância
+    é criada uma vez por combinação de modelo, prompt e parâmetros e reaproveitada pelas requisições.
+    O zerox (e o litellm) só é importado quando a primeira página vai ao modelo.
+    """
+    key = ("vision", model, prompt, ai_provider, tuple(sorted(kwargs.items())))
+
+    def factory() -> "VisionModel":
+        from vision import VisionModel
+
+        vision_model = VisionModel(model=model, ai_provider=ai_provider, **kwargs)
+        if prompt:
+            vision_model.system_prompt = prompt
+        return vision_model
+
+    return provider_registry.get_resource(key, factory)
+
+
+async def _ocr_page(
+    vision_model: "VisionModel",
+    image_path: str,
+    semaphore: asyncio.Semaphore,
+    limits: Optional[PageConcurrency] = None,
+    ai_provider: str = "",
+    prompt: str = "",
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """
+    Envia uma página ao modelo de visão, como o `process_page` do zerox
+
+    A chamada passa pelo agendador de provedores: limites por minuto, novas tentativas, failover para
+    os provedores de visão da cadeia e hedging de páginas lentas.
+    """
+
+    async def complete(provider_type: str) -> Any:
+        if provider_type == ai_provider:
+            model = vision_model
+        else:
+            model = await asyncio.to_thread(get_vision_model, resolve_model(provider_type), prompt, provider_type, **kwargs)
+        if limits is None:
+            # Mede só a chamada ao modelo, sem a espera por uma vaga
+            with stage("llm_page", provider_type):
+                return await model.completion(image_path=image_path, maintain_format=False, prior_page="")
+        # Vaga no limite do provedor e no limite global do worker; o resultado ajusta o limite adaptativo
+        async with limits.slot(provider_type, model.model) as slot:
+            try:
+                with stage("llm_page", provider_type):
+                    return await model.completion(image_path=image_path, maintain_format=False, prior_page="")
+            except BaseException as e:
+                slot.failed(e)
+                raise
+
+    async with semaphore:
+        try:
+            completion = await provider_scheduler.run(
+                ai_provider, complete, tokens=PAGE_TOKENS, hedge=True, allowed=set(VISION_PROVIDERS)
+            )
+            record_tokens(ai_provider, completion.input_tokens, completion.output_tokens)
+            return {
+                "content": lazy_import("pyzerox.processor").format_markdown(completion.content),
+                "input_tokens": completion.input_tokens,
+                "output_tokens": completion.output_tokens,
+                "error": None,
+            }
+        except Exception as e:
+            # Mesmo comportamento do zerox: a página falha, o documento continua
+            print(f"Erro ao processar página {image_path}: {str(e)}")
+            return {"content": "", "input_tokens": 0, "output_tokens": 0, "error": str(e)}
+
+
+def write_text(path: str, content: str) -> None:
+    """Grava um arquivo de texto (bloqueante: chamado fora do event loop)"""
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def count_pdf_pages(pdf_path: str) -> int:
+    """Retorna o número de páginas do PDF (via pdfinfo, sem renderizar)"""
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+
+async def iter_ocr_pdf(
+    pdf_path: str,
+    model: str,
+    prompt: str,
+    ai_provider: str,
+    concurrency: int = 3,
+    page_cache: Optional[ResultCache] = None,
+    work_dir: Optional[str] = None,
+    limits: Optional[PageConcurrency] = None,
+    text_layer: bool = False,
+    text_cleanup: Optional[str] = None,
+    renderer: Optional[RenderPool] = None,
+    pages: Optional[List[int]] = None,
+    artifacts: Optional[ArtifactStore] = None,
+    document: str = "",
+    similarity: Optional[SimilarityIndex] = None,
+    reuse_similar: bool = False,
+    **kwargs: Any,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Converte um PDF página a página, entregando cada página assim que fica pronta
+
+    As páginas são renderizadas uma a uma (na ordem do documento) e enviadas ao modelo assim que
+    renderizadas, então a primeira página fica pronta sem esperar a renderização do PDF inteiro.
+    As páginas podem ser entregues fora de ordem.
+
+    Com `text_layer`, páginas com uma boa camada de texto não são renderizadas: o texto é extraído
+    localmente (rota "text") e, se `text_cleanup` indicar um provedor, reformatado por um modelo
+    somente texto (rota "text+llm"). As demais seguem para o modelo de visão (rota "ocr").
+
+    Args:
+        pdf_path: Caminho do PDF
+        model: Modelo de visão (nome no formato do litellm)
+        prompt: Prompt de sistema enviado para cada página
+        ai_provider: Provedor de IA, repassado ao modelo como no zerox
+        concurrency: Número máximo de páginas desta requisição enviadas ao modelo ao mesmo tempo
+        page_cache: Cache de páginas (opcional)
+        work_dir: Diretório de trabalho da requisição, onde as imagens são renderizadas
+        limits: Limites compartilhados por provedor/modelo e pelo worker (opcional)
+        text_layer: Extrair localmente as páginas que já têm camada de texto
+        text_cleanup: Provedor de IA usado para reformatar o texto extraído localmente (opcional)
+        renderer: Pool de renderização do worker (padrão: renderização no pool de threads, opções padrão)
+        pages: Páginas a converter, numeradas a partir de 1 (padrão: todas)
+        artifacts: Armazém onde guardar a imagem e o markdown de cada página (opcional)
+        document: SHA-256 do PDF, usado para indexar os artefatos das páginas
+        similarity: Índice de páginas parecidas; as páginas enviadas ao modelo são registradas nele (opcional)
+        reuse_similar: Reaproveitar o markdown de páginas parecidas já convertidas, sem chamar o modelo
+        kwargs: Argumentos extras para o litellm
+
+    Yields:
+        Dicionários com `page`, `total_pages`, `selected_pages`, `route`, `content`, `cached`, `elapsed_ms`,
+        `input_tokens`, `output_tokens` e `error` (e `similarity` nas páginas reaproveitadas de páginas parecidas)
+    """
+    total_pages = await asyncio.to_thread(count_pdf_pages, pdf_path)
+    # Páginas fora da seleção não são classificadas, renderizadas nem enviadas ao modelo
+    page_numbers = [page for page in pages if page <= total_pages] if pages is not None else list(range(1, total_pages + 1))
+    if text_layer:
+        with stage("text_layer"):
+            classification = await asyncio.to_thread(classify_pdf_pages, pdf_path, page_numbers)
+        text_pages = {page["page"]: page for page in classification if page["route"] == "text"}
+    else:
+        text_pages = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    # Renderiza poucas páginas por vez, na ordem do documento, e limita quantas páginas renderizadas
+    # podem esperar pelo modelo, para que o disco usado não cresça com o tamanho do PDF
+    renderer = renderer or RenderPool(processes=0)
+    render_semaphore = asyncio.Semaphore(renderer.concurrency)
+    pipeline_semaphore = asyncio.Semaphore(concurrency + renderer.concurrency)
+
+    # Páginas parecidas só são comparadas entre conversões com o mesmo provedor, modelo e prompt
+    similarity_scope = make_cache_key("", ai_provider, model, True, prompt, scope="page")
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+
+        async def page_hash(image_path: str, page_number: int) -> Optional[Tuple[int, str]]:
+            # Hash perceptual (layout) e confirmação do conteúdo da página (texto ou bytes da imagem);
+            # falhas no índice de similaridade não interrompem a conversão
+            try:
+                image = await asyncio.to_thread(load_image, image_path, ai_provider)
+                phash = await asyncio.to_thread(dhash, image.data)
+                text = await asyncio.to_thread(lambda: next(iter_page_texts(pdf_path, [page_number]), ""))
+                return phash, page_confirmation(text, image.data)
+            except Exception as e:
+                print(f"Aviso: não foi possível calcular o hash perceptual de {image_path}: {str(e)}")
+                return None
+
+        async def ocr_image(image_path: str, page_number: int) -> Dict[str, Any]:
+            cache_key = None
+            if page_cache is not None:
+                # A imagem lida aqui fica no cache de imagens e é a mesma enviada ao modelo
+                image = await asyncio.to_thread(load_image, image_path, ai_provider)
+                fingerprint = hash_bytes(image.data)
+                cache_key = make_cache_key(fingerprint, ai_provider, model, True, prompt, scope="page")
+                cached, _ = await asyncio.to_thread(page_cache.get, cache_key)
+                if cached is not None:
+                    return {
+                        "content": cached["content"],
+                        "input_tokens": 0,
+                        "output_tokens": 0,
+                        "error": None,
+                        "cached": True,
+                        "route": "ocr",
+                    }
+
+            signature = await page_hash(image_path, page_number) if similarity is not None else None
+            if signature is not None and reuse_similar:
+                phash, confirmation = signature
+                match = await asyncio.to_thread(similarity.find_page, phash, similarity_scope, confirmation)
+                if match is not None:
+                    content, distance = match
+                    return {
+                        "content": content,
+                        "input_tokens": 0,
+                        "output_tokens": 0,
+                        "error": None,
+                        "cached": True,
+                        "route": "similar",
+                        "similarity": round(1 - distance / 64, 4),
+                    }
+
+            # Só obtém o modelo se houver páginas a enviar; a primeira criação valida credenciais pela rede
+            vision_model = await asyncio.to_thread(get_vision_model, model, prompt, ai_provider, **kwargs)
+            result = await _ocr_page(
+                vision_model, image_path, semaphore, limits=limits, ai_provider=ai_provider, prompt=prompt, **kwargs
+            )
+            result["cached"] = False
+            result["route"] = "ocr"
+            # Páginas com erro não entram no cache para serem tentadas de novo na próxima vez
+            if cache_key is not None and result["error"] is None:
+                await asyncio.to_thread(page_cache.set, cache_key, {"content": result["content"]})
+            if signature is not None and result["error"] is None:
+                phash, confirmation = signature
+                try:
+                    await asyncio.to_thread(similarity.add_page, phash, similarity_scope, result["content"], confirmation)
+                except Exception as e:
+                    print(f"Aviso: não foi possível registrar a página no índice de similaridade: {str(e)}")
+            return result
+
+        async def clean_text(content: str) -> Dict[str, Any]:
+            result = {
+                "content": content,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "error": None,
+                "cached": False,
+                "route": "text",
+            }
+            if not text_cleanup or not content:
+                return result
+
+            cache_key = None
+            if page_cache is not None:
+                cache_key = make_cache_key(
+                    hash_bytes(content.encode("utf-8")), text_cleanup, "", False, TEXT_CLEANUP_PROMPT, scope="text_page"
+                )
+                cached, _ = await asyncio.to_thread(page_cache.get, cache_key)
+                if cached is not None:
+                    return {**result, "content": cached["content"], "cached": True, "route": "text+llm"}
+
+            try:
+                provider = await asyncio.to_thread(provider_registry.get, text_cleanup)
+                async with semaphore:
+                    # Páginas muito longas são divididas no orçamento de tokens do provedor
+                    cleaned = await provider.aprocess_chunks([content], prompt=TEXT_CLEANUP_PROMPT, concurrency=1)
+            except Exception as e:
+                # A limpeza é opcional: em caso de erro, fica o texto extraído localmente
+                print(f"Erro ao reformatar texto extraído com {text_cleanup}: {str(e)}")
+                return result
+            if cache_key is not None:
+                await asyncio.to_thread(page_cache.set, cache_key, {"content": cleaned})
+            return {**result, "content": cleaned, "route": "text+llm"}
+
+        async def save_page(page_number: int, result: Dict[str, Any], image_path: Optional[str] = None) -> None:
+            # Falhas no armazém de artefatos não interrompem a conversão
+            # Chave própria da página: uma nova conversão do mesmo documento substitui os registros anteriores
+            artifact_key = make_cache_key(
+                document, ai_provider, model, True, prompt,
+                scope="page_artifacts", page=page_number, text_cleanup=text_cleanup,
+            )
+            metadata = {"page": page_number, "provider": ai_provider, "model": model, "cache_key": artifact_key}
+            try:
+                if image_path is not None:
+                    mime_type = mimetypes.guess_type(image_path)[0]
+                    await asyncio.to_thread(
+                        artifacts.put_file, image_path, document, "page_image", mime_type=mime_type, **metadata
+                    )
+                if result["error"] is None:
+                    content = result["content"].encode("utf-8")
+                    await asyncio.to_thread(
+                        artifacts.put, content, document, "page_markdown", mime_type="text/markdown", **metadata
+                    )
+            except Exception as e:
+                print(f"Aviso: não foi possível gravar os artefatos da página {page_number}: {str(e)}")
+
+        async def run_page(page_number: int) -> Dict[str, Any]:
+            if page_number in text_pages:
+                started = time.perf_counter()
+                result = await clean_text(text_to_markdown(text_pages[page_number]["text"]))
+                if artifacts is not None:
+                    await save_page(page_number, result)
+                result["page"] = page_number
+                result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                return result
+
+            async with pipeline_semaphore:
+                started = time.perf_counter()
+                async with render_semaphore:
+                    # A mesma imagem serve ao cache, às novas tentativas e ao failover para outro provedor
+                    image_path = await renderer.render(pdf_path, temp_dir, page_number, model)
+                try:
+                    result = await ocr_image(image_path, page_number)
+                    if artifacts is not None:
+                        await save_page(page_number, result, image_path)
+                finally:
+                    # A imagem não é mais necessária; libera o disco enquanto as outras páginas andam
+                    os.remove(image_path)
+                    image_cache.forget(image_path)
+            result["page"] = page_number
+            result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            return result
+
+        tasks = [asyncio.ensure_future(run_page(page_number)) for page_number in page_numbers]
+        try:
+            for next_page in asyncio.as_completed(tasks):
+                page = await next_page
+                page["total_pages"] = total_pages
+                page["selected_pages"] = len(page_numbers)
+                yield page
+        finally:
+            # Se o consumidor desistir (cliente desconectou), não continua gastando tokens
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def ocr_pdf(
+    pdf_path: str,
+    model: str,
+    prompt: str,
+    ai_provider: str,
+    concurrency: int = 3,
+    page_cache: Optional[ResultCache] = None,
+    output_dir: Optional[str] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    work_dir: Optional[str] = None,
+    limits: Optional[PageConcurrency] = None,
+    text_layer: bool = False,
+    text_cleanup: Optional[str] = None,
+    renderer: Optional[RenderPool] = None,
+    pages: Optional[List[int]] = None,
+    artifacts: Optional[ArtifactStore] = None,
+    document: str = "",
+    similarity: Optional[SimilarityIndex] = None,
+    reuse_similar: bool = False,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """
+    Converte um PDF em markdown, reaproveitando páginas já processadas
+
+    Args:
+        pdf_path: Caminho do PDF
+        model: Modelo de visão (nome no formato do litellm)
+        prompt: Prompt de sistema enviado para cada página
+        ai_provider: Provedor de IA, repassado ao modelo como no zerox
+        concurrency: Número máximo de páginas enviadas ao modelo ao mesmo tempo
+        page_cache: Cache de páginas (opcional)
+        output_dir: Diretório onde gravar o markdown agregado (opcional)
+        progress: Função chamada com (páginas concluídas, total de páginas) a cada página pronta
+        work_dir: Diretório de trabalho da requisição, onde as imagens são renderizadas
+        limits: Limites compartilhados por provedor/modelo e pelo worker (opcional)
+        text_layer: Extrair localmente as páginas que já têm camada de texto
+        text_cleanup: Provedor de IA usado para reformatar o texto extraído localmente (opcional)
+        renderer: Pool de renderização do worker (padrão: renderização no pool de threads, opções padrão)
+        pages: Páginas a converter, numeradas a partir de 1 (padrão: todas)
+        artifacts: Armazém onde guardar a imagem e o markdown de cada página (opcional)
+        document: SHA-256 do PDF, usado para indexar os artefatos das páginas
+        similarity: Índice de páginas parecidas; as páginas enviadas ao modelo são registradas nele (opcional)
+        reuse_similar: Reaproveitar o markdown de páginas parecidas já convertidas, sem chamar o modelo
+        kwargs: Argumentos extras para o litellm
+
+    Returns:
+        Dicionário com as páginas convertidas (`page`, `route`, `content`, `cached`, `error`) em ordem, o total de
+        páginas do documento e a contagem de tokens
+    """
+    converted: List[Dict[str, Any]] = []
+    total_pages = 0
+    input_tokens = 0
+    output_tokens = 0
+    pages_iter = iter_ocr_pdf(
+        pdf_path,
+        model,
+        prompt,
+        ai_provider,
+        concurrency=concurrency,
+        page_cache=page_cache,
+        work_dir=work_dir,
+        limits=limits,
+        text_layer=text_layer,
+        text_cleanup=text_cleanup,
+        renderer=renderer,
+        pages=pages,
+        artifacts=artifacts,
+        document=document,
+        similarity=similarity,
+        reuse_similar=reuse_similar,
+        **kwargs,
+    )
+    async for page in pages_iter:
+        converted.append(
+            {
+                "page": page["page"],
+                "route": page["route"],
+                "content": page["content"],
+                "cached": page["cached"],
+                "error": page["error"],
+                **({"similarity": page["similarity"]} if "similarity" in page else {}),
+            }
+        )
+        total_pages = page["total_pages"]
+        input_tokens += page["input_tokens"]
+        output_tokens += page["output_tokens"]
+        if progress is not None:
+            # O callback dos jobs grava no SQLite: fora do loop compartilhado, que atende as outras requisições
+            await asyncio.to_thread(progress, len(converted), page["selected_pages"])
+    converted.sort(key=lambda page: page["page"])
+
+    if output_dir:
+        with stage("postprocess"):
+            file_name = os.path.splitext(os.path.basename(pdf_path))[0]
+            content = "\n\n".join(page["content"] for page in converted)
+            await asyncio.to_thread(write_text, os.path.join(output_dir, f"{file_name}.md"), content)
+
+    return {"pages": converted, "total_pages": total_pages, "input_tokens": input_tokens, "output_tokens": output_tokens}
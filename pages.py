@@ -0,0 +1,135 @@
+"""
+Seleção de páginas para o Leitor Doc PyZerox
+Interpreta os parâmetros `pages` (por exemplo "1-3,10" ou "5-") e `max_pages`, calcula as páginas
+escolhidas a partir do total do documento e gera cópias reduzidas de PDFs e apresentações com apenas
+as páginas/slides escolhidos, para as rotas que convertem o arquivo inteiro (MarkItDown). Páginas fora
+da seleção nunca são renderizadas nem enviadas a um modelo.
+"""
+import re
+import zipfile
+from typing import List, Optional, Tuple
+
+from startup import lazy_import
+
+_RANGE = re.compile(r"^(\d+)(?:-(\d*))?$")
+_SLIDE_ID = re.compile(rb"<p:sldId\b")
+
+
+class PageSelectionError(ValueError):
+    """Levantada quando a seleção de páginas é inválida ou não escolhe nenhuma página"""
+
+
+def parse_pages(spec: str) -> List[Tuple[int, Optional[int]]]:
+    """
+    Interpreta uma seleção como "1-3,10,12-" em intervalos (início, fim), com fim None para "até o final"
+
+    Raises:
+        PageSelectionError: Se a seleção não estiver no formato esperado
+    """
+    ranges = []
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        match = _RANGE.match(part)
+        if not match:
+            raise PageSelectionError(f"Invalid page selection: {part!r}. Use a list like 1-3,10 or 5-")
+        start = int(match.group(1))
+        if match.group(2) is None:
+            end: Optional[int] = start
+        else:
+            end = int(match.group(2)) if match.group(2) else None
+        if start < 1 or (end is not None and end < start):
+            raise PageSelectionError(f"Invalid page range: {part!r}")
+        ranges.append((start, end))
+    if not ranges:
+        raise PageSelectionError("Empty page selection")
+    return ranges
+
+
+def read_selection(pages: Optional[str], max_pages: Optional[str]) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Valida os parâmetros `pages` e `max_pages` da requisição
+
+    Returns:
+        Tupla com a seleção normalizada (ou None) e o número máximo de páginas (ou None)
+
+    Raises:
+        PageSelectionError: Se algum dos parâmetros for inválido
+    """
+    spec = None
+    if pages:
+        ranges = parse_pages(pages)
+        spec = ",".join(f"{start}" if end == start else f"{start}-{end or ''}" for start, end in ranges)
+    limit = None
+    if max_pages:
+        if not max_pages.isdigit() or int(max_pages) < 1:
+            raise PageSelectionError("max_pages must be a positive integer")
+        limit = int(max_pages)
+    return spec, limit
+
+
+def select_pages(total: int, spec: Optional[str] = None, max_pages: Optional[int] = None) -> Optional[List[int]]:
+    """
+    Páginas escolhidas (numeradas a partir de 1, em ordem) de um documento com `total` páginas
+
+    Returns:
+        Lista das páginas, ou None quando a seleção inclui o documento inteiro
+
+    Raises:
+        PageSelectionError: Se nenhuma página do documento for escolhida
+    """
+    if spec is None and (max_pages is None or max_pages >= total):
+        return None
+    if spec is None:
+        selected = list(range(1, total + 1))
+    else:
+        chosen = set()
+        for start, end in parse_pages(spec):
+            chosen.update(range(start, min(end or total, total) + 1))
+        selected = sorted(chosen)
+    if max_pages is not None:
+        selected = selected[:max_pages]
+    if not selected:
+        raise PageSelectionError(f"No pages selected: the document has {total} page(s)")
+    return selected
+
+
+def count_slides(pptx_path: str) -> Optional[int]:
+    """Número de slides de uma apresentação .pptx, lido do índice do arquivo (None se não for .pptx)"""
+    try:
+        with zipfile.ZipFile(pptx_path) as archive:
+            return len(_SLIDE_ID.findall(archive.read("ppt/presentation.xml")))
+    except (zipfile.BadZipFile, KeyError, OSError):
+        return None
+
+
+def trim_pdf(pdf_path: str, pages: List[int], output_path: str) -> str:
+    """Grava em `output_path` um PDF só com as páginas escolhidas (operação bloqueante)"""
+    PyPDF2 = lazy_import("PyPDF2")
+    reader = PyPDF2.PdfReader(pdf_path)
+    writer = PyPDF2.PdfWriter()
+    for page in pages:
+        writer.add_page(reader.pages[page - 1])
+    with open(output_path, "wb") as f:
+        writer.write(f)
+    return output_path
+
+
+def trim_pptx(pptx_path: str, slides: List[int], output_path: str) -> str:
+    """
+    Grava em `output_path` uma apresentação só com os slides escolhidos (operação bloqueante)
+
+    Os slides removidos saem da lista de slides e perdem a relação com a apresentação, então o
+    MarkItDown não os lê; os slides mantidos são renumerados a partir de 1.
+    """
+    from pptx import Presentation
+
+    presentation = Presentation(pptx_path)
+    slide_ids = presentation.slides._sldIdLst
+    keep = set(slides)
+    for index, slide_id in reversed(list(enumerate(slide_ids, start=1))):
+        if index not in keep:
+            presentation.part.drop_rel(slide_id.rId)
+            slide_ids.remove(slide_id)
+    presentation.save(output_path)
+    return output_path
@@ -0,0 +1,220 @@
+"""
+Renderização das páginas de PDF para o OCR do Leitor Doc PyZerox
+A renderização (poppler) é a etapa que mais consome CPU no OCR. Este módulo a executa em um pool de
+processos dimensionado pelos núcleos realmente disponíveis para o contêiner (cota do cgroup). Por
+padrão as páginas saem como no zerox (coloridas, com 1056 pixels de altura); tons de cinza, dimensão
+máxima (por modelo) e formato da imagem são opcionais e reduzem o tempo de renderização e os bytes
+enviados em cada chamada ao modelo, ao custo de uma possível perda de precisão do OCR. A imagem de cada
+página é renderizada uma única vez e reaproveitada nas novas tentativas, no failover para outro
+provedor e na identificação da página no cache.
+"""
+import asyncio
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+
+from pdf2image import convert_from_path
+
+from metrics import stage
+
+# Formatos aceitos em RENDER_FORMAT
+RENDER_FORMATS = ("png", "jpeg", "webp")
+
+# Renderização do zerox (pyzerox.constants.PDFConversionDefaultOptions), usada por padrão: 300 DPI e
+# altura de 1056 pixels, com a largura proporcional
+ZEROX_DPI = 300
+ZEROX_SIZE = (None, 1056)
+
+
+def available_cpus() -> int:
+    """
+    Núcleos disponíveis para o processo: afinidade de CPU limitada pela cota do cgroup (v1 ou v2)
+
+    Em um pod limitado a 0.5 CPU retorna 1, mesmo que a máquina tenha dezenas de núcleos.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            limit, period = f.read().split()[:2]
+        if limit != "max":
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                limit = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if limit > 0 and period > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+class RenderSettings:
+    """Opções de renderização, com dimensão máxima ajustável por modelo"""
+
+    def __init__(
+        self,
+        dpi: int = ZEROX_DPI,
+        max_dim: Optional[int] = None,
+        grayscale: bool = False,
+        image_format: str = "png",
+        quality: int = 80,
+        models: Optional[Dict[str, int]] = None,
+    ):
+        if image_format not in RENDER_FORMATS:
+            raise ValueError(f"RENDER_FORMAT inválido: {image_format}. Use um de: {', '.join(RENDER_FORMATS)}")
+        self.dpi = dpi
+        self.max_dim = max_dim
+        self.grayscale = grayscale
+        self.image_format = image_format
+        self.quality = quality
+        self.models = models or {}
+
+    @classmethod
+    def from_env(cls) -> "RenderSettings":
+        """
+        Cria as opções a partir das variáveis de ambiente `RENDER_*`
+
+        `RENDER_MAX_DIM_MODELS` (por exemplo `gpt-4o=2048,claude-3-sonnet-20240229=1568`) define a
+        dimensão máxima de modelos específicos. Sem `RENDER_MAX_DIM` e `RENDER_GRAYSCALE`, as páginas
+        são renderizadas como no zerox.
+        """
+        models = {}
+        for item in os.getenv("RENDER_MAX_DIM_MODELS", "").split(","):
+            if "=" in item:
+                model, value = item.rsplit("=", 1)
+                models[model.strip()] = int(value)
+
+        max_dim = os.getenv("RENDER_MAX_DIM")
+        return cls(
+            dpi=int(os.getenv("RENDER_DPI", str(ZEROX_DPI))),
+            max_dim=int(max_dim) if max_dim else None,
+            grayscale=os.getenv("RENDER_GRAYSCALE", "false").lower() == "true",
+            image_format=os.getenv("RENDER_FORMAT", "png").lower(),
+            quality=int(os.getenv("RENDER_QUALITY", "80")),
+            models=models,
+        )
+
+    def for_model(self, model: str) -> Dict[str, Any]:
+        """Opções usadas para renderizar as páginas enviadas a `model` (enviadas ao processo do pool)"""
+        max_dim = self.models.get(model, self.max_dim)
+        return {
+            "dpi": self.dpi,
+            # None: tamanho do zerox; 0: sem redimensionar, na resolução `dpi`; N: cabe em um quadrado de N pixels
+            "size": ZEROX_SIZE if max_dim is None else max_dim or None,
+            "grayscale": self.grayscale,
+            "format": self.image_format,
+            "quality": self.quality,
+        }
+
+
+def render_page(pdf_path: str, output_dir: str, page: int, options: Dict[str, Any]) -> str:
+    """
+    Renderiza uma página do PDF e retorna o caminho da imagem
+
+    Executada nos processos do pool. `size` é o tamanho pedido ao poppler: o do zerox (altura de 1056
+    pixels), um lado máximo em pixels ou None para usar só a resolução `dpi`. O poppler gera PNG e
+    JPEG diretamente; WebP é convertido a partir do PNG com o Pillow.
+    """
+    image_format = options["format"]
+    paths = convert_from_path(
+        pdf_path,
+        output_folder=output_dir,
+        first_page=page,
+        last_page=page,
+        dpi=options["dpi"],
+        fmt="png" if image_format == "webp" else image_format,
+        jpegopt={"quality": options["quality"], "optimize": True, "progressive": False},
+        size=options["size"],
+        grayscale=options["grayscale"],
+        thread_count=1,
+        use_pdftocairo=True,
+        paths_only=True,
+    )
+    path = paths[0]
+    if image_format == "webp":
+        from PIL import Image
+
+        webp_path = os.path.splitext(path)[0] + ".webp"
+        with Image.open(path) as image:
+            image.save(webp_path, "WEBP", quality=options["quality"], method=4)
+        os.remove(path)
+        path = webp_path
+    return path
+
+
+class RenderPool:
+    """
+    Pool de processos de renderização do worker, criado no primeiro uso
+
+    Com `processes=0` a renderização roda no pool de threads do event loop (os processos do poppler
+    continuam sendo criados a cada página, mas sem limite próprio).
+    """
+
+    def __init__(self, settings: Optional[RenderSettings] = None, processes: Optional[int] = None):
+        self.settings = settings or RenderSettings()
+        self.processes = available_cpus() if processes is None else processes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RenderPool":
+        """Cria o pool a partir de `RENDER_PROCESSES` (padrão: núcleos disponíveis) e das opções `RENDER_*`"""
+        processes = os.getenv("RENDER_PROCESSES")
+        return cls(RenderSettings.from_env(), int(processes) if processes else None)
+
+    @property
+    def concurrency(self) -> int:
+        """Páginas renderizadas ao mesmo tempo"""
+        return max(1, self.processes)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # "spawn": o worker do gunicorn tem várias threads, e um fork poderia herdar locks presos
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    async def render(self, pdf_path: str, output_dir: str, page: int, model: str = "") -> str:
+        """Renderiza uma página com as opções de `model`, sem bloquear o event loop"""
+        options = self.settings.for_model(model)
+        with stage("render"):
+            if self.processes <= 0:
+                return await asyncio.to_thread(render_page, pdf_path, output_dir, page, options)
+            executor = self._get_executor()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    executor, render_page, pdf_path, output_dir, page, options
+                )
+            except BrokenProcessPool:
+                # Um processo morreu (por exemplo, falta de memória): o próximo uso cria um pool novo
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                raise
+
+    def shutdown(self) -> None:
+        """Encerra os processos do pool; usado no encerramento do worker"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            if executor is None or self._pid != os.getpid():
+                return
+        executor.shutdown(wait=False, cancel_futures=True)
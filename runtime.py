@@ -0,0 +1,100 @@
+"""
+Event loop compartilhado por worker para o Leitor Doc PyZerox
+Em vez de criar e destruir um event loop a cada requisição (`asyncio.run`), cada processo mantém um
+único loop rodando em uma thread própria. As threads de requisição do gunicorn (workers `gthread`) e
+as threads da fila de jobs apenas agendam suas corrotinas nesse loop e esperam o resultado, então um
+mesmo worker acompanha dezenas de documentos enquanto aguarda as respostas dos modelos, e os clientes
+HTTP assíncronos (litellm, OpenAI, Anthropic) reaproveitam suas conexões entre requisições.
+Etapas bloqueantes (leitura de PDF, arquivos, MarkItDown) vão para o pool de threads do loop.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class AsyncRuntime:
+    """Event loop de longa duração, iniciado no primeiro uso em cada processo"""
+
+    def __init__(self, threads: int = 32):
+        self.threads = threads
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "AsyncRuntime":
+        """Cria o runtime a partir de `ASYNC_THREADS` (tamanho do pool para etapas bloqueantes)"""
+        return cls(threads=int(os.getenv("ASYNC_THREADS", "32")))
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Loop do processo atual (um processo filho criado por fork inicia o seu próprio)"""
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    self._start()
+        return self._loop
+
+    def _start(self) -> None:
+        loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="async-io")
+        loop.set_default_executor(self._executor)
+        ready = threading.Event()
+
+        def run() -> None:
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="async-runtime", daemon=True)
+        self._thread.start()
+        ready.wait()
+        self._loop = loop
+        self._pid = os.getpid()
+
+    def run(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """
+        Executa uma corrotina no loop compartilhado e espera o resultado na thread atual
+
+        Se a espera for interrompida, a corrotina é cancelada.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iterate(self, async_iterator: AsyncIterator[T]) -> Iterator[T]:
+        """
+        Consome um iterador assíncrono a partir de código síncrono (por exemplo, uma resposta em streaming do Flask)
+
+        Se o consumidor parar antes do fim (cliente desconectou), o iterador é fechado no loop.
+        """
+        try:
+            while True:
+                try:
+                    yield self.run(async_iterator.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            self.run(async_iterator.aclose())
+
+    def shutdown(self) -> None:
+        """Encerra o loop e o pool de threads; usado no encerramento do worker"""
+        with self._lock:
+            loop, thread, executor = self._loop, self._thread, self._executor
+            if loop is None or self._pid != os.getpid():
+                return
+            self._loop = None
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        executor.shutdown(wait=False, cancel_futures=True)
+        if not loop.is_running():
+            loop.close()
@@ -0,0 +1,299 @@
+"""
+Agendamento das chamadas aos provedores de IA do Leitor Doc PyZerox
+Toda chamada a um modelo (trechos de texto, páginas do OCR, reformatação da camada de texto) passa por
+aqui antes de chegar ao provedor:
+
+- limites por provedor em requisições por minuto e tokens por minuto (token buckets compartilhados pelo
+  worker), para que rajadas de páginas não estourem a cota da conta;
+- novas tentativas com backoff exponencial e jitter em erros temporários (429, 5xx, timeouts),
+  respeitando o `Retry-After` enviado pelo provedor;
+- failover ao longo de uma cadeia configurada (por exemplo openai -> anthropic -> llama_local) quando
+  um provedor esgota as tentativas ou recusa a chamada;
+- hedging opcional: se a chamada não terminar em `PROVIDER_HEDGE_AFTER` segundos, uma cópia é enviada ao
+  próximo provedor da cadeia e vale a primeira resposta.
+"""
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple, TypeVar
+
+from concurrency import error_status
+from metrics import PROVIDER_FAILOVERS, PROVIDER_HEDGES, PROVIDER_RETRIES, record_provider_error
+
+T = TypeVar("T")
+
+# Erros de configuração: não adianta tentar de novo no mesmo provedor
+_CONFIG_ERRORS = (ImportError, NotImplementedError, FileNotFoundError, ValueError)
+
+# Timeouts e falhas de conexão dos clientes HTTP e dos SDKs, que não trazem status HTTP (o
+# APITimeoutError da OpenAI e da Anthropic é uma subclasse do APIConnectionError)
+_TRANSPORT_ERRORS = (("httpx", "TransportError"), ("openai", "APIConnectionError"), ("anthropic", "APIConnectionError"))
+
+
+class TokenBucket:
+    """
+    Limite de taxa por minuto, compartilhado entre threads e event loops
+
+    Quem pede mais do que há disponível reserva assim mesmo (o saldo fica negativo) e espera o tempo
+    necessário para a reposição, então os pedidos são atendidos na ordem em que chegam.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60
+        self.capacity = float(capacity or per_minute)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        """Reserva `amount` e retorna quantos segundos esperar antes de usar"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Pedidos maiores que a capacidade passariam a esperar para sempre
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount: float) -> None:
+        """Devolve uma reserva que não foi usada"""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+    async def acquire(self, amount: float = 1) -> None:
+        wait = self.reserve(amount)
+        if wait <= 0:
+            return
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            self.refund(amount)
+            raise
+
+
+def _transport_errors() -> Tuple[type, ...]:
+    # Só os SDKs já importados: uma exceção de um módulo que não foi carregado não pode ter ocorrido
+    types: List[type] = [asyncio.TimeoutError, TimeoutError, ConnectionError]
+    for module_name, name in _TRANSPORT_ERRORS:
+        error_type = getattr(sys.modules.get(module_name), name, None)
+        if isinstance(error_type, type):
+            types.append(error_type)
+    return tuple(types)
+
+
+def is_transport_error(exc: BaseException) -> bool:
+    """Timeout ou falha de conexão, procurados também nas exceções encadeadas (o zerox relança os erros)"""
+    types = _transport_errors()
+    seen = set()
+    current: Optional[BaseException] = exc
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if isinstance(current, types):
+            return True
+        current = current.__cause__ or current.__context__
+    return False
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Erros temporários: timeout (408), limite de taxa (429), erro do servidor (5xx) ou falha de conexão
+
+    Outros erros sem status HTTP (por exemplo `TypeError` ou `KeyError`) vêm do nosso código e são
+    relançados na hora, sem novas tentativas nem failover.
+    """
+    if isinstance(exc, _CONFIG_ERRORS):
+        return False
+    status = error_status(exc)
+    if status is None:
+        return is_transport_error(exc)
+    return status in (408, 429) or status >= 500
+
+
+def can_fail_over(exc: BaseException) -> bool:
+    """Erros em que vale tentar o próximo provedor: recusa do provedor (qualquer status), configuração ou conexão"""
+    return isinstance(exc, _CONFIG_ERRORS) or error_status(exc) is not None or is_transport_error(exc)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Segundos pedidos pelo provedor no cabeçalho `Retry-After`, se houver"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderScheduler:
+    """Limites de taxa, novas tentativas, failover e hedging das chamadas aos provedores"""
+
+    def __init__(
+        self,
+        rpm: Optional[Dict[str, int]] = None,
+        tpm: Optional[Dict[str, int]] = None,
+        max_retries: int = 3,
+        retry_base: float = 0.5,
+        retry_max: float = 20.0,
+        failover: Sequence[str] = (),
+        hedge_after: float = 0.0,
+    ):
+        self.rpm = rpm or {}
+        self.tpm = tpm or {}
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.failover = list(failover)
+        self.hedge_after = hedge_after
+        self._buckets: Dict[str, List[Optional[TokenBucket]]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ProviderScheduler":
+        """
+        Cria o agendador a partir das variáveis de ambiente `PROVIDER_*`
+
+        `PROVIDER_RPM_<PROVEDOR>` e `PROVIDER_TPM_<PROVEDOR>` (por exemplo `PROVIDER_RPM_OPENAI=500`)
+        limitam requisições e tokens por minuto; sem valor, o provedor não é limitado.
+        """
+        rpm, tpm = {}, {}
+        for provider in ("openai", "gemini", "anthropic", "llama_local"):
+            value = os.getenv(f"PROVIDER_RPM_{provider.upper()}")
+            if value:
+                rpm[provider] = int(value)
+            value = os.getenv(f"PROVIDER_TPM_{provider.upper()}")
+            if value:
+                tpm[provider] = int(value)
+
+        return cls(
+            rpm=rpm,
+            tpm=tpm,
+            max_retries=int(os.getenv("PROVIDER_MAX_RETRIES", "3")),
+            retry_base=float(os.getenv("PROVIDER_RETRY_BASE", "0.5")),
+            retry_max=float(os.getenv("PROVIDER_RETRY_MAX", "20")),
+            failover=[p.strip().lower() for p in os.getenv("PROVIDER_FAILOVER", "").split(",") if p.strip()],
+            hedge_after=float(os.getenv("PROVIDER_HEDGE_AFTER", "0")),
+        )
+
+    def chain(self, provider: str, allowed: Optional[Set[str]] = None) -> List[str]:
+        """Provedor pedido seguido dos demais provedores da cadeia de failover (filtrados por `allowed`)"""
+        chain = [provider] + [p for p in self.failover if p != provider]
+        if allowed is not None:
+            chain = [provider] + [p for p in chain[1:] if p in allowed]
+        return chain
+
+    def _limits(self, provider: str) -> List[Optional[TokenBucket]]:
+        with self._lock:
+            if provider not in self._buckets:
+                rpm, tpm = self.rpm.get(provider), self.tpm.get(provider)
+                self._buckets[provider] = [TokenBucket(rpm) if rpm else None, TokenBucket(tpm) if tpm else None]
+            return self._buckets[provider]
+
+    async def _acquire(self, provider: str, tokens: int) -> None:
+        requests_bucket, tokens_bucket = self._limits(provider)
+        if requests_bucket is not None:
+            await requests_bucket.acquire(1)
+        if tokens_bucket is not None and tokens:
+            await tokens_bucket.acquire(tokens)
+
+    def backoff(self, attempt: int, exc: BaseException) -> float:
+        """Espera antes da tentativa `attempt` (1, 2, ...): jitter total sobre o backoff exponencial"""
+        delay = random.uniform(0, min(self.retry_max, self.retry_base * 2 ** (attempt - 1)))
+        requested = retry_after(exc)
+        if requested is not None:
+            delay = max(delay, min(requested, self.retry_max))
+        return delay
+
+    async def _attempts(self, provider: str, call: Callable[[str], Awaitable[T]], tokens: int) -> T:
+        """Chama um provedor, tentando de novo em erros temporários"""
+        attempt = 0
+        while True:
+            await self._acquire(provider, tokens)
+            try:
+                return await call(provider)
+            except Exception as e:
+                record_provider_error(provider, error_status(e))
+                attempt += 1
+                if attempt > self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff(attempt, e)
+                print(f"Erro temporário em {provider} ({str(e)[:200]}); nova tentativa {attempt} em {delay:.1f}s")
+                PROVIDER_RETRIES.labels(provider=provider).inc()
+                await asyncio.sleep(delay)
+
+    async def _failover(self, chain: Sequence[str], call: Callable[[str], Awaitable[T]], tokens: int) -> T:
+        """Percorre a cadeia até um provedor responder; relança o último erro se todos falharem"""
+        error: Optional[BaseException] = None
+        for index, provider in enumerate(chain):
+            if index:
+                print(f"Failover de {chain[index - 1]} para {provider}: {str(error)[:200]}")
+                PROVIDER_FAILOVERS.labels(source=chain[index - 1], target=provider).inc()
+            try:
+                return await self._attempts(provider, call, tokens)
+            except Exception as e:
+                if not can_fail_over(e):
+                    raise
+                error = e
+        raise error
+
+    async def run(
+        self,
+        provider: str,
+        call: Callable[[str], Awaitable[T]],
+        tokens: int = 0,
+        hedge: bool = False,
+        allowed: Optional[Set[str]] = None,
+    ) -> T:
+        """
+        Executa `call(provedor)` com limites de taxa, novas tentativas e failover
+
+        Args:
+            provider: Provedor pedido
+            call: Corrotina que faz a chamada a um provedor, recebendo o nome dele
+            tokens: Tokens estimados da chamada (para o limite por minuto)
+            hedge: Enviar uma cópia ao próximo provedor se a chamada passar de `hedge_after`
+            allowed: Provedores aceitos no failover (por exemplo, só os que processam imagens)
+
+        Returns:
+            Resultado da primeira chamada bem-sucedida
+        """
+        chain = self.chain(provider, allowed)
+        if not hedge or self.hedge_after <= 0 or len(chain) < 2:
+            return await self._failover(chain, call, tokens)
+
+        primary = asyncio.ensure_future(self._attempts(chain[0], call, tokens))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+            if done:
+                if primary.exception() is None or not can_fail_over(primary.exception()):
+                    return primary.result()
+                # A chamada principal já esgotou as tentativas: segue a cadeia a partir do próximo provedor
+                print(f"Failover de {chain[0]} para {chain[1]}: {str(primary.exception())[:200]}")
+                PROVIDER_FAILOVERS.labels(source=chain[0], target=chain[1]).inc()
+                return await self._failover(chain[1:], call, tokens)
+
+            PROVIDER_HEDGES.labels(provider=chain[0]).inc()
+            backup = asyncio.ensure_future(self._failover(chain[1:], call, tokens))
+            tasks.append(backup)
+            pending = {primary, backup}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            # Também quando `run` é cancelado (cliente desconectado, páginas vizinhas canceladas): nenhuma
+            # chamada fica gastando tentativas e cota do provedor sem ninguém esperando
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
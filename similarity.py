@@ -0,0 +1,375 @@
+"""
+Detecção de documentos quase duplicados para o Leitor Doc PyZerox
+Boa parte dos envios é o mesmo documento escaneado ou exportado de novo (outro gerador de PDF, outra
+data, outra compressão), e o hash exato dos bytes nunca coincide. Este módulo mantém em `uploads/similarity`
+um índice SQLite, compartilhado pelos workers, com:
+
+- assinaturas MinHash dos shingles (sequências de 5 palavras) da camada de texto dos PDFs;
+- hashes perceptuais (dHash de 64 bits) das páginas, para PDFs escaneados e imagens.
+
+As buscas usam LSH: a assinatura é dividida em faixas e só os documentos (ou páginas) que coincidem em
+alguma faixa são comparados. Um PDF com camada de texto parecido acima de `SIMILARITY_THRESHOLD` pode
+devolver a conversão anterior (documentos escaneados e imagens só são reportados como parecidos), e páginas do OCR a até `SIMILARITY_PAGE_DISTANCE` bits de uma página já convertida
+reaproveitam o markdown dela. O dHash só captura o layout (dois formulários do mesmo modelo coincidem), então
+uma página só é reaproveitada se o conteúdo também confirmar: o mesmo texto na camada de texto ou, em
+páginas sem texto, a mesma imagem.
+"""
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# MinHash: 64 permutações divididas em 16 faixas de 4 valores
+PERMUTATIONS = 64
+BANDS = 16
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1729)
+# Coeficientes fixos: as assinaturas precisam ser iguais em todos os workers e execuções
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(PERMUTATIONS)]
+
+# dHash: 8 faixas de 8 bits; duas páginas a até 7 bits de distância coincidem em pelo menos uma faixa
+HASH_BANDS = 8
+
+# Texto mínimo para usar a assinatura de texto; abaixo disso o PDF é tratado como escaneado
+MIN_TEXT_CHARS = 200
+
+# Texto mínimo da página para confirmar o conteúdo pelo texto; abaixo disso, só a mesma imagem confirma
+MIN_PAGE_TEXT_CHARS = 20
+
+# Páginas candidatas comparadas por busca (páginas em branco caem todas na mesma faixa)
+PAGE_CANDIDATES = 200
+
+
+def dhash_image(image: Any) -> int:
+    """dHash de 64 bits de uma imagem do Pillow: gradientes horizontais de uma miniatura 9x8 em cinza"""
+    from PIL import Image
+
+    small = image.convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def dhash(data: bytes) -> int:
+    """dHash de 64 bits de uma imagem em memória"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        return dhash_image(image)
+
+
+def page_confirmation(text: str, image_data: bytes) -> str:
+    """
+    Chave que confirma o conteúdo de uma página: o texto da camada de texto, com os espaços normalizados,
+    ou os bytes da imagem renderizada quando a página não tem texto suficiente
+    """
+    words = text.split()
+    if sum(len(word) for word in words) >= MIN_PAGE_TEXT_CHARS:
+        return "text:" + hashlib.blake2b(" ".join(words).encode("utf-8"), digest_size=16).hexdigest()
+    return "image:" + hashlib.blake2b(image_data, digest_size=16).hexdigest()
+
+
+def hamming(a: int, b: int) -> int:
+    """Bits diferentes entre dois hashes"""
+    return bin(a ^ b).count("1")
+
+
+def shingles(text: str, size: int = 5) -> Set[int]:
+    """Sequências de `size` palavras do texto normalizado, como inteiros de 64 bits"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        words = words + [""] * (size - len(words))
+    return {
+        int.from_bytes(hashlib.blake2b(" ".join(words[i:i + size]).encode("utf-8"), digest_size=8).digest(), "big")
+        for i in range(len(words) - size + 1)
+    }
+
+
+def minhash(features: Iterable[int]) -> List[int]:
+    """Assinatura MinHash de um conjunto de inteiros"""
+    features = list(features)
+    return [min((a * x + b) % _PRIME for x in features) for a, b in _PERMS]
+
+
+def jaccard(a: List[int], b: List[int]) -> float:
+    """Similaridade de Jaccard estimada por duas assinaturas MinHash"""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def page_similarity(a: List[int], b: List[int], max_distance: int) -> float:
+    """Fração das páginas, na mesma ordem, com hashes perceptuais a até `max_distance` bits"""
+    if not a or not b:
+        return 0.0
+    matched = sum(hamming(x, y) <= max_distance for x, y in zip(a, b))
+    return matched / max(len(a), len(b))
+
+
+def _signed(value: int) -> int:
+    # O SQLite guarda inteiros de 64 bits com sinal
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def _hash_bands(value: int) -> List[str]:
+    return [f"{band}:{(value >> (8 * band)) & 0xFF}" for band in range(HASH_BANDS)]
+
+
+def _signature_bands(signature: Dict[str, Any]) -> List[str]:
+    values = signature["values"]
+    if signature["kind"] == "pages":
+        # Documentos escaneados: candidatos são os que têm a primeira página parecida
+        return [f"p{band}" for band in _hash_bands(values[0])]
+    rows = len(values) // BANDS
+    return [
+        f"t{band}:" + hashlib.blake2b(json.dumps(values[band * rows:(band + 1) * rows]).encode(), digest_size=8).hexdigest()
+        for band in range(BANDS)
+    ]
+
+
+class SimilarityIndex:
+    """Índice SQLite de assinaturas de documentos e hashes de páginas, compartilhado pelos workers"""
+
+    def __init__(
+        self,
+        base_dir: str,
+        threshold: float = 0.9,
+        page_distance: int = 6,
+        max_pages: int = 50,
+        ttl: int = 30 * 86400,
+    ):
+        self.base_dir = base_dir
+        self.threshold = threshold
+        self.page_distance = page_distance
+        self.max_pages = max_pages
+        self.ttl = ttl
+        self.db_path = os.path.join(base_dir, "similarity.db")
+
+        os.makedirs(base_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_hash TEXT NOT NULL,
+                    scope TEXT NOT NULL,
+                    cache_key TEXT,
+                    kind TEXT NOT NULL,
+                    signature TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS document_bands (scope TEXT NOT NULL, bucket TEXT NOT NULL, document_id INTEGER NOT NULL)"
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    scope TEXT NOT NULL,
+                    phash INTEGER NOT NULL,
+                    confirmation TEXT,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS page_bands (scope TEXT NOT NULL, bucket TEXT NOT NULL, page_id INTEGER NOT NULL)"
+            )
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(pages)")}
+            if "confirmation" not in columns:
+                # Índices criados antes da confirmação: as páginas antigas nunca são reaproveitadas
+                conn.execute("ALTER TABLE pages ADD COLUMN confirmation TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS document_bands_lookup ON document_bands (scope, bucket)")
+            conn.execute("CREATE INDEX IF NOT EXISTS documents_created ON documents (created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS page_bands_lookup ON page_bands (scope, bucket)")
+            conn.execute("CREATE INDEX IF NOT EXISTS pages_created ON pages (created_at)")
+
+    @classmethod
+    def from_env(cls) -> "SimilarityIndex":
+        """Cria o índice a partir das variáveis de ambiente `SIMILARITY_*`"""
+        return cls(
+            base_dir=os.getenv("SIMILARITY_DIR", os.path.join("uploads", "similarity")),
+            threshold=float(os.getenv("SIMILARITY_THRESHOLD", "0.9")),
+            page_distance=int(os.getenv("SIMILARITY_PAGE_DISTANCE", "6")),
+            max_pages=int(os.getenv("SIMILARITY_MAX_PAGES", "50")),
+            ttl=int(os.getenv("SIMILARITY_TTL", str(30 * 86400))),
+        )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Conexões curtas em modo autocommit: cada thread/worker abre a sua
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # Assinaturas
+
+    def signature(self, path: str, format_type: str, pages: Optional[List[int]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Assinatura de um PDF ou imagem, calculada sem chamar nenhum modelo (operação bloqueante)
+
+        PDFs com camada de texto usam MinHash do texto; PDFs escaneados usam os hashes perceptuais de
+        miniaturas das primeiras `max_pages` páginas; imagens usam o hash perceptual da própria imagem.
+
+        Returns:
+            Dicionário com `kind` ("text" ou "pages") e `values`, ou None para outros formatos
+        """
+        if format_type == "image":
+            with open(path, "rb") as f:
+                return {"kind": "pages", "values": [dhash(f.read())]}
+        if format_type != "pdf":
+            return None
+
+        from pdf2image import convert_from_path, pdfinfo_from_path
+
+        from text_layer import iter_page_texts
+
+        if pages is None:
+            pages = list(range(1, int(pdfinfo_from_path(path)["Pages"]) + 1))
+        pages = pages[:self.max_pages]
+        text = "\n".join(iter_page_texts(path, pages))
+        if len(text.strip()) >= MIN_TEXT_CHARS:
+            return {"kind": "text", "values": minhash(shingles(text))}
+
+        hashes = []
+        for page in pages:
+            # Miniatura de 64 pixels: suficiente para o hash e muito mais barata que a renderização do OCR
+            for image in convert_from_path(path, first_page=page, last_page=page, size=64, grayscale=True):
+                hashes.append(dhash_image(image))
+        return {"kind": "pages", "values": hashes} if hashes else None
+
+    def _score(self, a: Dict[str, Any], b: Dict[str, Any]) -> float:
+        if a["kind"] != b["kind"]:
+            return 0.0
+        if a["kind"] == "text":
+            return jaccard(a["values"], b["values"])
+        return page_similarity(a["values"], b["values"], self.page_distance)
+
+    # Documentos
+
+    def find_document(self, signature: Dict[str, Any], scope: str, exclude: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Documento anterior mais parecido com a assinatura, com os mesmos parâmetros de conversão
+
+        Returns:
+            Dicionário com `file_hash`, `cache_key`, `kind` e `score`, ou None se nenhum passar do limite
+        """
+        buckets = _signature_bands(signature)
+        placeholders = ",".join("?" * len(buckets))
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT d.file_hash, d.cache_key, d.signature FROM documents d WHERE d.id IN ("
+                f"SELECT document_id FROM document_bands WHERE scope = ? AND bucket IN ({placeholders})"
+                ") AND d.created_at >= ? ORDER BY d.created_at DESC LIMIT 200",
+                (scope, *buckets, time.time() - self.ttl),
+            ).fetchall()
+
+        best = None
+        for row in rows:
+            if row["file_hash"] == exclude:
+                continue
+            score = self._score(signature, json.loads(row["signature"]))
+            if score >= self.threshold and (best is None or score > best["score"]):
+                best = {
+                    "file_hash": row["file_hash"],
+                    "cache_key": row["cache_key"],
+                    "kind": signature["kind"],
+                    "score": round(score, 4),
+                }
+        return best
+
+    def add_document(self, file_hash: str, scope: str, signature: Dict[str, Any], cache_key: Optional[str] = None) -> None:
+        """Registra a assinatura de um documento convertido"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                document_id = conn.execute(
+                    "INSERT INTO documents (file_hash, scope, cache_key, kind, signature, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (file_hash, scope, cache_key, signature["kind"], json.dumps(signature), now),
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO document_bands (scope, bucket, document_id) VALUES (?, ?, ?)",
+                    [(scope, bucket, document_id) for bucket in _signature_bands(signature)],
+                )
+                self._expire(conn, now)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    # Páginas
+
+    def find_page(self, phash: int, scope: str, confirmation: str) -> Optional[Tuple[str, int]]:
+        """
+        Markdown da página já convertida mais parecida, e a distância em bits, se houver
+
+        Só são aceitas páginas com a mesma `confirmation` (veja `page_confirmation`): hashes perceptuais
+        próximos sozinhos indicam apenas o mesmo layout.
+        """
+        buckets = _hash_bands(phash)
+        placeholders = ",".join("?" * len(buckets))
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, phash FROM pages WHERE id IN ("
+                f"SELECT page_id FROM page_bands WHERE scope = ? AND bucket IN ({placeholders})"
+                ") AND confirmation = ? AND created_at >= ? ORDER BY created_at DESC LIMIT ?",
+                (scope, *buckets, confirmation, time.time() - self.ttl, PAGE_CANDIDATES),
+            ).fetchall()
+
+            best = None
+            for row in rows:
+                distance = hamming(phash, _unsigned(row["phash"]))
+                if distance <= self.page_distance and (best is None or distance < best[1]):
+                    best = (row["id"], distance)
+            if best is None:
+                return None
+            # Só o markdown da página escolhida é lido
+            row = conn.execute("SELECT content FROM pages WHERE id = ?", (best[0],)).fetchone()
+        return (row["content"], best[1]) if row is not None else None
+
+    def add_page(self, phash: int, scope: str, content: str, confirmation: str) -> None:
+        """Registra o markdown de uma página convertida pelo modelo, com a confirmação do seu conteúdo"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                page_id = conn.execute(
+                    "INSERT INTO pages (scope, phash, confirmation, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (scope, _signed(phash), confirmation, content, time.time()),
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO page_bands (scope, bucket, page_id) VALUES (?, ?, ?)",
+                    [(scope, bucket, page_id) for bucket in _hash_bands(phash)],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _expire(self, conn: sqlite3.Connection, now: float) -> None:
+        """Remove entradas mais antigas que o TTL (executado junto com o registro de documentos)"""
+        cutoff = now - self.ttl
+        conn.execute(
+            "DELETE FROM document_bands WHERE document_id IN (SELECT id FROM documents WHERE created_at < ?)", (cutoff,)
+        )
+        conn.execute("DELETE FROM documents WHERE created_at < ?", (cutoff,))
+        conn.execute("DELETE FROM page_bands WHERE page_id IN (SELECT id FROM pages WHERE created_at < ?)", (cutoff,))
+        conn.execute("DELETE FROM pages WHERE created_at < ?", (cutoff,))
@@ -0,0 +1,129 @@
+"""
+Inicialização rápida do Leitor Doc PyZerox
+Os SDKs dos provedores, o MarkItDown e o zerox (com o litellm) levam segundos e dezenas de MB para
+importar, e cada worker do gunicorn pagaria esse custo mesmo sem usar o provedor. Aqui ficam:
+- `module_available`: verifica se um pacote está instalado sem importá-lo;
+- `lazy_import`: importa um módulo no primeiro uso e registra quanto tempo a importação levou;
+- `mark` e `startup_report`: tempos de inicialização do processo, importações feitas sob demanda e
+  memória do processo, expostos em GET /startup.
+"""
+import importlib
+import importlib.util
+import os
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Any, Dict, List, Optional
+
+# Módulos pesados carregados sob demanda; o relatório mostra quais já estão em memória no processo
+HEAVY_MODULES = (
+    "openai", "anthropic", "google.generativeai", "llama_cpp", "markitdown", "pyzerox", "litellm", "PyPDF2"
+)
+
+# Processo que importou este módulo: com `--preload`, é o master do gunicorn, e não o worker
+_IMPORT_PID = os.getpid()
+_IMPORTED_AT = time.monotonic()
+
+_lock = threading.Lock()
+_available: Dict[str, bool] = {}
+_imports: List[Dict[str, Any]] = []
+_phases: Dict[str, Dict[str, Any]] = {}
+
+
+def module_available(name: str) -> bool:
+    """Indica se `name` pode ser importado, sem executar o módulo (só procura o pacote no sys.path)"""
+    available = _available.get(name)
+    if available is None:
+        try:
+            available = importlib.util.find_spec(name) is not None
+        except (ImportError, ValueError):
+            # O pacote pai não existe (por exemplo "google" sem o google-generativeai)
+            available = False
+        _available[name] = available
+    return available
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Importa `name` no primeiro uso, registrando o tempo da importação no relatório de inicialização
+
+    Raises:
+        ImportError: Se o módulo não estiver instalado
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    elapsed = time.perf_counter() - started
+    with _lock:
+        # Outra thread pode ter importado o mesmo módulo ao mesmo tempo; só a primeira entrada conta
+        if not any(entry["module"] == name for entry in _imports):
+            _imports.append({"module": name, "ms": round(elapsed * 1000, 1), "pid": os.getpid()})
+    return module
+
+
+def process_uptime() -> float:
+    """
+    Segundos desde o início do processo atual (no Linux, lido de /proc)
+
+    Para um worker do gunicorn, o início é o fork a partir do master. Fora do Linux, conta a partir
+    da importação deste módulo.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # O nome do processo fica entre parênteses e pode conter espaços
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - started_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.monotonic() - _IMPORTED_AT
+
+
+def mark(phase: str) -> None:
+    """Registra que o processo atual chegou a `phase` (por exemplo "app_loaded" ou "worker_ready")"""
+    with _lock:
+        _phases[phase] = {"seconds": round(process_uptime(), 3), "pid": os.getpid()}
+
+
+def memory_usage() -> Dict[str, Optional[float]]:
+    """
+    Memória do processo atual em MB: residente (rss), proporcional (pss) e compartilhada com outros
+    processos, como os workers criados a partir de um master com `--preload`
+    """
+    values: Dict[str, Optional[float]] = {"rss_mb": None, "pss_mb": None, "shared_mb": None}
+    fields = {"Rss:": "rss_mb", "Pss:": "pss_mb", "Shared_Clean:": "shared_mb", "Shared_Dirty:": "shared_mb"}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                key = fields.get(parts[0]) if parts else None
+                if key is not None:
+                    values[key] = round((values[key] or 0.0) + int(parts[1]) / 1024, 1)
+    except OSError:
+        try:
+            import resource
+
+            # ru_maxrss é o pico, em KB no Linux
+            values["rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        except ImportError:
+            pass
+    return values
+
+
+def startup_report() -> Dict[str, Any]:
+    """Relatório de inicialização do processo atual, servido em GET /startup"""
+    with _lock:
+        imports = list(_imports)
+        phases = dict(_phases)
+    return {
+        "pid": os.getpid(),
+        "preloaded": os.getpid() != _IMPORT_PID,
+        "uptime_seconds": round(process_uptime(), 3),
+        "phases": phases,
+        "lazy_imports": imports,
+        "loaded_modules": {name: name in sys.modules for name in HEAVY_MODULES},
+        "memory": memory_usage(),
+    }
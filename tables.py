@@ -0,0 +1,325 @@
+"""
+Conversão local de planilhas e arquivos CSV para o Leitor Doc PyZerox
+Planilhas .xlsx (openpyxl em modo somente leitura) e arquivos CSV/TSV são lidos linha a linha e
+gravados de forma incremental como tabelas markdown ou JSONL, sem passar pelo MarkItDown nem pelo
+modelo: a memória usada não cresce com o número de linhas. O modelo só é chamado para um resumo
+opcional, feito a partir de uma amostra das primeiras linhas de cada aba.
+"""
+import csv
+import datetime
+import decimal
+import io
+import json
+import os
+import zipfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Formatos de saída das tabelas
+TABLE_FORMATS = ("markdown", "jsonl")
+
+# Linhas lidas antes de escrever o cabeçalho, para descobrir a largura real da tabela
+WIDTH_LOOKAHEAD = 100
+
+# Separadores aceitos na detecção automática dos arquivos CSV
+CSV_DELIMITERS = ",;\t|"
+
+TABLE_SUMMARY_PROMPT = (
+    "The following is a sample of a spreadsheet: the header and the first rows of each sheet, with the "
+    "total number of rows. Write a short markdown summary of what the data contains: the purpose of each "
+    "sheet, the meaning of the main columns and anything notable in the sample. Do not repeat the rows."
+)
+
+
+class TableOptionsError(ValueError):
+    """Levantada quando as opções de conversão de tabelas são inválidas ou escolhem uma aba inexistente"""
+
+
+def tabular_kind(path: str, format_type: str) -> Optional[str]:
+    """
+    Tipo de tabela que o conversor local lê: "xlsx", "csv" ou None (os demais seguem pelo MarkItDown)
+
+    Planilhas .xls (formato binário antigo) não são lidas aqui.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if format_type == "excel":
+        try:
+            with zipfile.ZipFile(path) as archive:
+                return "xlsx" if "xl/workbook.xml" in archive.namelist() else None
+        except (zipfile.BadZipFile, OSError):
+            return None
+    if format_type == "text" and extension in (".csv", ".tsv"):
+        return "csv"
+    return None
+
+
+def read_table_options(args: Any) -> Dict[str, Any]:
+    """
+    Valida os parâmetros `sheets`, `max_rows`, `max_columns` e `table_format` da requisição
+
+    Raises:
+        TableOptionsError: Se algum dos parâmetros for inválido
+    """
+    limits: Dict[str, Optional[int]] = {}
+    for name in ("max_rows", "max_columns"):
+        value = args.get(name) or os.getenv(f"TABULAR_{name.upper()}", "")
+        if value and (not value.isdigit() or int(value) < 1):
+            raise TableOptionsError(f"{name} must be a positive integer")
+        limits[name] = int(value) if value else None
+    table_format = (args.get("table_format") or os.getenv("TABULAR_FORMAT", "markdown")).lower()
+    if table_format not in TABLE_FORMATS:
+        raise TableOptionsError(f"table_format must be one of: {', '.join(TABLE_FORMATS)}")
+    sheets = [sheet.strip() for sheet in (args.get("sheets") or "").split(",") if sheet.strip()]
+    return {"sheets": sheets or None, "table_format": table_format, **limits}
+
+
+def select_sheets(names: Sequence[str], selection: Optional[Sequence[str]]) -> List[str]:
+    """
+    Abas escolhidas, na ordem da planilha; `selection` aceita nomes ou posições (a partir de 1)
+
+    Raises:
+        TableOptionsError: Se alguma aba escolhida não existir
+    """
+    if not selection:
+        return list(names)
+    chosen = set()
+    for item in selection:
+        if item in names:
+            chosen.add(item)
+        elif item.isdigit() and 1 <= int(item) <= len(names):
+            chosen.add(names[int(item) - 1])
+        else:
+            raise TableOptionsError(f"Sheet not found: {item!r}. The workbook has: {', '.join(names)}")
+    return [name for name in names if name in chosen]
+
+
+def cell_value(value: Any) -> Any:
+    """Valor da célula como tipo JSON: datas em ISO 8601 e números inteiros sem casas decimais"""
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat() if value.time() == datetime.time(0) else value.isoformat()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (bool, int, float)):
+        return value
+    return str(value)
+
+
+def markdown_cell(value: Any) -> str:
+    """Texto da célula dentro de uma tabela markdown (barras escapadas e quebras de linha como <br>)"""
+    value = cell_value(value)
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    text = str(value).replace("|", "\\|")
+    return text.replace("\r\n", "<br>").replace("\n", "<br>").replace("\r", "<br>")
+
+
+def column_names(header: Sequence[Any], width: int) -> List[str]:
+    """Nomes das colunas a partir do cabeçalho: vazios viram column_N e repetidos ganham sufixo"""
+    names: List[str] = []
+    seen: Dict[str, int] = {}
+    for index in range(width):
+        value = cell_value(header[index]) if index < len(header) else None
+        name = str(value) if value not in (None, "") else f"column_{index + 1}"
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        names.append(name if count == 0 else f"{name}_{count + 1}")
+    return names
+
+
+def _trim(row: Sequence[Any]) -> Tuple[Any, ...]:
+    """Linha sem as células vazias do final (planilhas costumam declarar colunas só formatadas)"""
+    end = len(row)
+    while end and (row[end - 1] is None or row[end - 1] == ""):
+        end -= 1
+    return tuple(row[:end])
+
+
+def _open_csv(path: str) -> Tuple[io.TextIOBase, str]:
+    """Abre um CSV detectando a codificação (UTF-8 ou Latin-1) e o separador pelos primeiros 64 KB"""
+    with open(path, "rb") as f:
+        sample = f.read(64 * 1024)
+    encoding = "utf-8-sig"
+    try:
+        sample.decode(encoding)
+    except UnicodeDecodeError as e:
+        # O bloco pode terminar no meio de um caractere UTF-8; só troca de codificação se o erro vier antes
+        if e.start < len(sample) - 3:
+            encoding = "latin-1"
+    text = sample.decode(encoding, errors="ignore")
+    try:
+        delimiter = csv.Sniffer().sniff(text, delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        # O Sniffer exige o mesmo número de colunas em todas as linhas; em arquivos irregulares, vale o
+        # separador mais frequente na primeira linha
+        first_line = next((line for line in text.splitlines() if line.strip()), "")
+        counts = {candidate: first_line.count(candidate) for candidate in CSV_DELIMITERS}
+        delimiter = max(counts, key=counts.get)
+        if not counts[delimiter]:
+            delimiter = "\t" if path.lower().endswith(".tsv") else ","
+    return open(path, encoding=encoding, errors="replace", newline=""), delimiter
+
+
+class TableConverter:
+    """
+    Converte uma planilha ou um CSV em tabelas markdown ou JSONL, uma linha por vez
+
+    `iter_chunks` produz o resultado em blocos de `chunk_rows` linhas; ao final, `sheets` traz as
+    estatísticas de cada aba e `samples` as primeiras linhas de cada uma, usadas no resumo opcional.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        kind: str,
+        sheets: Optional[Sequence[str]] = None,
+        max_rows: Optional[int] = None,
+        max_columns: Optional[int] = None,
+        table_format: str = "markdown",
+        chunk_rows: int = 1000,
+        sample_rows: int = 20,
+    ):
+        self.path = path
+        self.kind = kind
+        self.selection = sheets
+        self.max_rows = max_rows
+        self.max_columns = max_columns
+        self.table_format = table_format
+        self.chunk_rows = chunk_rows
+        self.sample_rows = sample_rows
+        self.sheets: List[Dict[str, Any]] = []
+        self.samples: Dict[str, List[List[str]]] = {}
+        # Abas escolhidas; com mais de uma, cada tabela markdown ganha o nome da aba como título
+        self.sheet_count = 0
+
+    def _iter_rows(self) -> Iterator[Tuple[str, Iterator[Tuple[int, Sequence[Any]]]]]:
+        """Abas escolhidas e, para cada uma, as linhas numeradas a partir de 1 (lidas sob demanda)"""
+        if self.kind == "csv":
+            if self.selection:
+                raise TableOptionsError("Sheet selection is only supported for spreadsheets")
+            self.sheet_count = 1
+            f, delimiter = _open_csv(self.path)
+            with f:
+                yield "", enumerate(csv.reader(f, delimiter=delimiter), start=1)
+            return
+
+        from openpyxl import load_workbook
+
+        # Somente leitura: as linhas são lidas do XML conforme avançam, sem carregar a planilha inteira
+        workbook = load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            names = select_sheets(workbook.sheetnames, self.selection)
+            self.sheet_count = len(names)
+            for name in names:
+                worksheet = workbook[name]
+                if not hasattr(worksheet, "iter_rows"):
+                    # Abas de gráfico não têm células
+                    continue
+                yield name, enumerate(worksheet.iter_rows(values_only=True), start=1)
+        finally:
+            workbook.close()
+
+    def iter_chunks(self) -> Iterator[Tuple[str, str]]:
+        """
+        Blocos do resultado, como tuplas (aba, texto), na ordem da planilha
+
+        Raises:
+            TableOptionsError: Se a seleção de abas for inválida
+        """
+        first = True
+        for name, rows in self._iter_rows():
+            stats = {"sheet": name, "rows": 0, "columns": 0, "truncated_rows": False, "truncated_columns": False}
+            self.sheets.append(stats)
+
+            # Cabeçalho: a primeira linha não vazia; a largura considera também as linhas seguintes
+            header: Optional[Tuple[int, Tuple[Any, ...]]] = None
+            lookahead: List[Tuple[int, Tuple[Any, ...]]] = []
+            for number, row in rows:
+                row = _trim(row)
+                if not row:
+                    continue
+                if header is None:
+                    header = (number, row)
+                    continue
+                lookahead.append((number, row))
+                if len(lookahead) >= WIDTH_LOOKAHEAD:
+                    break
+            if header is None:
+                continue
+
+            width = max([len(header[1])] + [len(row) for _, row in lookahead])
+            if self.max_columns is not None and width > self.max_columns:
+                width = self.max_columns
+                stats["truncated_columns"] = True
+            names = column_names(header[1], width)
+            stats["columns"] = width
+            sample = self.samples.setdefault(name, [[markdown_cell(value) for value in names]])
+
+            lines: List[str] = []
+            if self.table_format == "markdown":
+                if self.sheet_count > 1:
+                    lines.append(("" if first else "\n") + f"## {name}\n")
+                lines.append("| " + " | ".join(markdown_cell(value) for value in names) + " |")
+                lines.append("|" + " --- |" * width)
+            first = False
+
+            for number, row in _chain(lookahead, rows):
+                row = _trim(row)
+                if not row:
+                    continue
+                if self.max_rows is not None and stats["rows"] >= self.max_rows:
+                    stats["truncated_rows"] = True
+                    break
+                if len(row) > width:
+                    stats["truncated_columns"] = True
+                cells = list(row[:width]) + [None] * (width - len(row))
+                stats["rows"] += 1
+                if len(sample) <= self.sample_rows:
+                    sample.append([markdown_cell(value) for value in cells])
+                if self.table_format == "markdown":
+                    lines.append("| " + " | ".join(markdown_cell(value) for value in cells) + " |")
+                else:
+                    record = {"sheet": name, "row": number, "values": dict(zip(names, map(cell_value, cells)))}
+                    if self.kind == "csv":
+                        del record["sheet"]
+                    lines.append(json.dumps(record, ensure_ascii=False))
+                if len(lines) >= self.chunk_rows:
+                    yield name, "\n".join(lines) + "\n"
+                    lines = []
+            if lines:
+                yield name, "\n".join(lines) + "\n"
+
+    def write(self, output_path: str) -> List[Dict[str, Any]]:
+        """Grava o resultado em `output_path` (operação bloqueante) e devolve as estatísticas das abas"""
+        with open(output_path, "w", encoding="utf-8") as f:
+            for _, chunk in self.iter_chunks():
+                f.write(chunk)
+        return self.sheets
+
+    def sample_text(self) -> str:
+        """Amostra enviada ao modelo no resumo: cabeçalho, primeiras linhas e total de linhas de cada aba"""
+        parts = []
+        for stats in self.sheets:
+            sample = self.samples.get(stats["sheet"])
+            if not sample:
+                continue
+            title = f"Sheet {stats['sheet']}" if stats["sheet"] else "Table"
+            lines = [f"{title}: {stats['rows']} rows, {stats['columns']} columns"]
+            lines.append("| " + " | ".join(sample[0]) + " |")
+            lines.append("|" + " --- |" * len(sample[0]))
+            lines.extend("| " + " | ".join(row) + " |" for row in sample[1:])
+            parts.append("\n".join(lines))
+        return "\n\n".join(parts)
+
+
+def _chain(first: Iterable[Tuple[int, Any]], rest: Iterator[Tuple[int, Any]]) -> Iterator[Tuple[int, Any]]:
+    yield from first
+    yield from rest
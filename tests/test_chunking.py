@@ -0,0 +1,84 @@
+"""
+Testes da divisão de documentos longos em trechos e da reunião das respostas (chunking.py)
+"""
+import asyncio
+
+from chunking import estimate_tokens, iter_chunks, process_chunks, split_blocks, split_oversized, stitch
+
+
+def markdown_table(rows, start=0):
+    return "| a | b |\n| --- | --- |\n" + "\n".join(f"| {i} | value {i} |" for i in range(start, start + rows))
+
+
+def test_split_blocks_classifies_headings_text_and_tables():
+    text = "# Title\nfirst line\nsecond line\n\n| a | b |\n| --- | --- |\n| 1 | 2 |"
+    assert [kind for kind, _ in split_blocks(text)] == ["heading", "text", "table"]
+
+
+def test_chunks_fit_the_budget():
+    pages = [("word " * 50 + "\n\n") * 4 for _ in range(5)]
+    chunks = list(iter_chunks(pages, 100))
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+
+
+def test_short_document_is_a_single_chunk():
+    assert list(iter_chunks(["page one", "page two"], 1000)) == ["page one\n\npage two"]
+
+
+def test_heading_is_never_left_at_the_end_of_a_chunk():
+    text = "intro " * 30 + "\n\n# Title\n\n" + "body " * 30
+    chunks = list(iter_chunks([text], 70))
+    assert len(chunks) == 2
+    assert not chunks[0].rstrip().endswith("# Title")
+    assert chunks[1].startswith("# Title\n\n")
+
+
+def test_oversized_table_repeats_the_header_in_every_part():
+    table = markdown_table(40)
+    parts = list(split_oversized(("table", table.splitlines()), 60))
+    assert len(parts) > 1
+    for kind, lines in parts:
+        assert kind == "table"
+        assert lines[:2] == ["| a | b |", "| --- | --- |"]
+    rows = [line for _, lines in parts for line in lines[2:]]
+    assert rows == table.splitlines()[2:]
+
+
+def test_oversized_line_is_cut():
+    parts = list(split_oversized(("text", ["x" * 1000]), 50))
+    assert len(parts) > 1
+    assert "".join(line for _, lines in parts for line in lines) == "x" * 1000
+
+
+def test_stitch_joins_a_split_table_back_together():
+    table = markdown_table(40)
+    assert stitch(list(iter_chunks([table], 60))) == table
+
+
+def test_stitch_keeps_different_tables_apart():
+    first = markdown_table(2)
+    second = "| c | d |\n| --- | --- |\n| 1 | 2 |"
+    assert stitch([first, second]) == first + "\n\n" + second
+
+
+def test_stitch_skips_empty_parts():
+    assert stitch(["one", "  ", "", "two"]) == "one\n\ntwo"
+
+
+def test_process_chunks_keeps_the_original_order_and_limits_concurrency():
+    running = 0
+    peak = 0
+
+    async def handler(chunk):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        # Trechos do início demoram mais: as respostas chegam fora de ordem
+        await asyncio.sleep(0.01 * (5 - int(chunk)))
+        running -= 1
+        return f"out {chunk}"
+
+    result = asyncio.run(process_chunks([str(i) for i in range(5)], handler, concurrency=2))
+    assert result == "\n\n".join(f"out {i}" for i in range(5))
+    assert peak <= 2
@@ -0,0 +1,65 @@
+"""
+Testes da seleção de páginas (pages.py)
+"""
+import pytest
+
+from pages import PageSelectionError, parse_pages, read_selection, select_pages
+
+
+def test_parse_single_pages_and_ranges():
+    assert parse_pages("1-3,10") == [(1, 3), (10, 10)]
+    assert parse_pages(" 2 , 4-4 ") == [(2, 2), (4, 4)]
+
+
+def test_parse_open_range():
+    assert parse_pages("5-") == [(5, None)]
+    assert parse_pages("1,7-") == [(1, 1), (7, None)]
+
+
+def test_parse_ignores_empty_parts():
+    assert parse_pages("1,,3,") == [(1, 1), (3, 3)]
+
+
+@pytest.mark.parametrize("spec", ["", ",", "0", "3-1", "a", "1-2-3", "-5", "1.5"])
+def test_parse_rejects_invalid_selections(spec):
+    with pytest.raises(PageSelectionError):
+        parse_pages(spec)
+
+
+def test_read_selection_normalizes_the_spec():
+    assert read_selection(" 1-3, 5 ,8-", None) == ("1-3,5,8-", None)
+    assert read_selection(None, "4") == (None, 4)
+    assert read_selection("", "") == (None, None)
+
+
+@pytest.mark.parametrize("max_pages", ["0", "-1", "abc", "1.5"])
+def test_read_selection_rejects_invalid_max_pages(max_pages):
+    with pytest.raises(PageSelectionError):
+        read_selection(None, max_pages)
+
+
+def test_whole_document_is_none():
+    assert select_pages(10) is None
+    assert select_pages(10, max_pages=10) is None
+    assert select_pages(10, max_pages=20) is None
+
+
+def test_open_range_stops_at_the_last_page():
+    assert select_pages(7, "5-") == [5, 6, 7]
+
+
+def test_ranges_are_clamped_sorted_and_deduplicated():
+    assert select_pages(5, "4-9,1,2-3,3") == [1, 2, 3, 4, 5]
+    assert select_pages(5, "5,1") == [1, 5]
+
+
+def test_max_pages_keeps_the_first_selected_pages():
+    assert select_pages(10, max_pages=3) == [1, 2, 3]
+    assert select_pages(10, "8-,2", max_pages=2) == [2, 8]
+
+
+def test_selection_outside_the_document_fails():
+    with pytest.raises(PageSelectionError):
+        select_pages(3, "5-")
+    with pytest.raises(PageSelectionError):
+        select_pages(3, "4,6-8")
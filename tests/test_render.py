@@ -0,0 +1,45 @@
+"""
+Testes da renderização das páginas do OCR (render.py)
+Requerem o Pillow, o pdf2image e o poppler (pdftocairo); sem eles, os testes são ignorados.
+"""
+import shutil
+
+import pytest
+
+pytest.importorskip("pdf2image")
+Image = pytest.importorskip("PIL.Image")
+
+from render import RenderSettings, render_page  # noqa: E402
+
+pytestmark = pytest.mark.skipif(shutil.which("pdftocairo") is None, reason="poppler (pdftocairo) não instalado")
+
+
+@pytest.fixture
+def letter_pdf(tmp_path):
+    """PDF de uma página carta (612x792 pontos) vermelha"""
+    path = tmp_path / "page.pdf"
+    Image.new("RGB", (612, 792), (200, 30, 30)).save(path, "PDF", resolution=72)
+    return str(path)
+
+
+def test_default_settings_match_zerox_rendering(letter_pdf, tmp_path):
+    options = RenderSettings().for_model("gpt-4o-mini")
+    image_path = render_page(letter_pdf, str(tmp_path), 1, options)
+
+    with Image.open(image_path) as image:
+        # Como no zerox: PNG colorido com 1056 pixels de altura e largura proporcional
+        assert image.format == "PNG"
+        assert image.mode == "RGB"
+        assert image.height == 1056
+        assert abs(image.width - 816) <= 1
+        red, green, blue = image.getpixel((image.width // 2, image.height // 2))
+        assert red > green and red > blue
+
+
+def test_grayscale_and_max_dim_are_opt_in(letter_pdf, tmp_path):
+    options = RenderSettings(max_dim=512, grayscale=True).for_model("gpt-4o-mini")
+    image_path = render_page(letter_pdf, str(tmp_path), 1, options)
+
+    with Image.open(image_path) as image:
+        assert image.mode == "L"
+        assert max(image.size) == 512
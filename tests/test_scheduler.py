@@ -0,0 +1,158 @@
+"""
+Testes do agendamento das chamadas aos provedores (scheduler.py)
+Classificação dos erros, backoff com `Retry-After`, failover e cancelamento do hedging, sem rede.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+from scheduler import ProviderScheduler, can_fail_over, is_retryable, retry_after  # noqa: E402
+
+
+class ProviderError(Exception):
+    """Erro de provedor com status HTTP e resposta, como os dos SDKs"""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+class GoogleError(Exception):
+    """Erro do SDK do Google: o status HTTP fica em `code`"""
+
+    def __init__(self, code):
+        super().__init__(f"code {code}")
+        self.code = code
+
+
+def zerox_error(cause):
+    """O zerox relança os erros do provedor como `Exception` genérica, encadeada ao erro original"""
+    try:
+        try:
+            raise cause
+        except Exception as e:
+            raise Exception("Failed to process image") from e
+    except Exception as e:
+        return e
+
+
+@pytest.mark.parametrize("status", [408, 429, 500, 503])
+def test_temporary_statuses_are_retryable(status):
+    assert is_retryable(ProviderError(status))
+
+
+@pytest.mark.parametrize("status", [400, 401, 404, 422])
+def test_client_errors_fail_over_without_retries(status):
+    error = ProviderError(status)
+    assert not is_retryable(error)
+    assert can_fail_over(error)
+
+
+def test_google_code_is_read_as_status():
+    assert is_retryable(GoogleError(503))
+    assert not is_retryable(GoogleError(400))
+
+
+def test_chained_zerox_errors_keep_the_original_status():
+    assert is_retryable(zerox_error(ProviderError(429)))
+    assert not is_retryable(zerox_error(ProviderError(401)))
+
+
+def test_chained_transport_errors_are_retryable():
+    assert is_retryable(zerox_error(ConnectionResetError("reset by peer")))
+    assert is_retryable(zerox_error(asyncio.TimeoutError()))
+
+
+def test_bugs_are_neither_retried_nor_failed_over():
+    for error in (KeyError("content"), TypeError("bad argument"), zerox_error(KeyError("content"))):
+        assert not is_retryable(error)
+        assert not can_fail_over(error)
+
+
+def test_configuration_errors_fail_over_without_retries():
+    error = ImportError("anthropic")
+    assert not is_retryable(error)
+    assert can_fail_over(error)
+
+
+def test_retry_after_header():
+    assert retry_after(ProviderError(429, {"retry-after": "7"})) == 7.0
+    assert retry_after(ProviderError(429, {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) is None
+    assert retry_after(ProviderError(429)) is None
+    assert retry_after(KeyError("x")) is None
+
+
+def test_backoff_respects_retry_after_up_to_the_maximum():
+    scheduler = ProviderScheduler(retry_base=0.01, retry_max=20.0)
+    assert scheduler.backoff(1, ProviderError(429, {"retry-after": "7"})) >= 7.0
+    assert scheduler.backoff(1, ProviderError(429, {"retry-after": "3600"})) == 20.0
+
+
+def test_backoff_grows_exponentially_within_the_maximum():
+    scheduler = ProviderScheduler(retry_base=0.5, retry_max=4.0)
+    error = ProviderError(503)
+    for attempt in range(1, 8):
+        delay = scheduler.backoff(attempt, error)
+        assert 0 <= delay <= min(4.0, 0.5 * 2 ** (attempt - 1))
+
+
+def test_failover_after_retries():
+    scheduler = ProviderScheduler(max_retries=2, retry_base=0, failover=["backup"])
+    calls = []
+
+    async def call(provider):
+        calls.append(provider)
+        if provider == "primary":
+            raise ProviderError(503)
+        return provider
+
+    assert asyncio.run(scheduler.run("primary", call)) == "backup"
+    assert calls == ["primary", "primary", "primary", "backup"]
+
+
+def test_bugs_are_raised_without_failover():
+    scheduler = ProviderScheduler(max_retries=2, retry_base=0, failover=["backup"])
+    calls = []
+
+    async def call(provider):
+        calls.append(provider)
+        raise KeyError("content")
+
+    with pytest.raises(KeyError):
+        asyncio.run(scheduler.run("primary", call))
+    assert calls == ["primary"]
+
+
+def test_hedge_sends_a_copy_to_the_next_provider():
+    scheduler = ProviderScheduler(failover=["backup"], hedge_after=0.01)
+
+    async def call(provider):
+        await asyncio.sleep(1 if provider == "primary" else 0)
+        return provider
+
+    assert asyncio.run(scheduler.run("primary", call, hedge=True)) == "backup"
+
+
+def test_cancelled_hedged_run_cancels_the_primary_call():
+    scheduler = ProviderScheduler(failover=["backup"], hedge_after=10)
+    cancelled = []
+
+    async def call(provider):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(provider)
+            raise
+
+    async def main():
+        task = asyncio.ensure_future(scheduler.run("primary", call, hedge=True))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert cancelled == ["primary"]
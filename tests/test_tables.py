@@ -0,0 +1,154 @@
+"""
+Testes da conversão local de planilhas e CSV (tables.py)
+Os testes de planilhas .xlsx requerem o openpyxl; sem ele, são ignorados.
+"""
+import datetime
+import json
+
+import pytest
+
+from tables import TableConverter, TableOptionsError, cell_value, column_names, markdown_cell, read_table_options
+
+
+def write_csv(tmp_path, text, name="data.csv"):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def convert(path, kind="csv", **options):
+    converter = TableConverter(path, kind, **options)
+    return "".join(chunk for _, chunk in converter.iter_chunks()), converter
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    book = openpyxl.Workbook()
+    sales = book.active
+    sales.title = "Sales"
+    sales.append(["Product", "Amount", None, None])
+    sales.append(["Pen", 2.0])
+    sales.append(["Ink", 3.5, "promo"])
+    stock = book.create_sheet("Stock")
+    stock.append(["Item"])
+    stock.append([10])
+    path = tmp_path / "book.xlsx"
+    book.save(path)
+    return str(path)
+
+
+def test_csv_to_markdown(tmp_path):
+    text, converter = convert(write_csv(tmp_path, "name,qty\nPen,2\nInk,3\n"))
+    assert text == "| name | qty |\n| --- | --- |\n| Pen | 2 |\n| Ink | 3 |\n"
+    assert converter.sheets == [
+        {"sheet": "", "rows": 2, "columns": 2, "truncated_rows": False, "truncated_columns": False}
+    ]
+
+
+def test_header_is_written_once_when_the_output_is_split_in_chunks(tmp_path):
+    rows = "".join(f"item {i},{i}\n" for i in range(10))
+    converter = TableConverter(write_csv(tmp_path, "name,qty\n" + rows), "csv", chunk_rows=3)
+    chunks = [chunk for _, chunk in converter.iter_chunks()]
+    assert len(chunks) > 1
+    assert "".join(chunks).count("| name | qty |") == 1
+    assert "".join(chunks).count("| --- | --- |") == 1
+
+
+def test_csv_delimiter_is_detected(tmp_path):
+    text, _ = convert(write_csv(tmp_path, "name;qty\nPen;2\nInk;3\n"))
+    assert text.splitlines()[0] == "| name | qty |"
+
+
+def test_ragged_csv_keeps_its_delimiter(tmp_path):
+    text, converter = convert(write_csv(tmp_path, "name;qty\nPen;2;extra\nInk\n"))
+    assert text.splitlines()[0] == "| name | qty | column_3 |"
+    assert text.splitlines()[3] == "| Ink |  |  |"
+    assert converter.sheets[0]["columns"] == 3
+
+
+def test_markdown_cells_are_escaped(tmp_path):
+    text, _ = convert(write_csv(tmp_path, 'a,b\n"x|y","line 1\nline 2"\n'))
+    assert text.splitlines()[2] == "| x\\|y | line 1<br>line 2 |"
+
+
+def test_blank_rows_are_skipped(tmp_path):
+    _, converter = convert(write_csv(tmp_path, "\n\na,b\n1,2\n,\n\n3,4\n"))
+    assert converter.sheets[0]["rows"] == 2
+
+
+def test_row_and_column_limits(tmp_path):
+    text, converter = convert(write_csv(tmp_path, "a,b,c\n1,2,3\n4,5,6\n7,8,9\n"), max_rows=2, max_columns=2)
+    assert text == "| a | b |\n| --- | --- |\n| 1 | 2 |\n| 4 | 5 |\n"
+    stats = converter.sheets[0]
+    assert stats["rows"] == 2
+    assert stats["truncated_rows"] and stats["truncated_columns"]
+
+
+def test_csv_to_jsonl(tmp_path):
+    text, _ = convert(write_csv(tmp_path, "name,name,\nPen,blue,x\n"), table_format="jsonl")
+    assert json.loads(text) == {"row": 2, "values": {"name": "Pen", "name_2": "blue", "column_3": "x"}}
+
+
+def test_csv_rejects_sheet_selection(tmp_path):
+    with pytest.raises(TableOptionsError):
+        convert(write_csv(tmp_path, "a\n1\n"), sheets=["1"])
+
+
+def test_workbook_sheets_get_titles(workbook):
+    text, converter = convert(workbook, "xlsx")
+    assert text == (
+        "## Sales\n\n| Product | Amount | column_3 |\n| --- | --- | --- |\n| Pen | 2 |  |\n| Ink | 3.5 | promo |\n"
+        "\n## Stock\n\n| Item |\n| --- |\n| 10 |\n"
+    )
+    assert [stats["sheet"] for stats in converter.sheets] == ["Sales", "Stock"]
+
+
+def test_workbook_sheet_selection_by_name_or_position(workbook):
+    text, _ = convert(workbook, "xlsx", sheets=["2"])
+    assert text == "| Item |\n| --- |\n| 10 |\n"
+    text, _ = convert(workbook, "xlsx", sheets=["Stock", "Sales"])
+    assert text.startswith("## Sales")
+
+
+def test_workbook_unknown_sheet(workbook):
+    with pytest.raises(TableOptionsError):
+        convert(workbook, "xlsx", sheets=["Missing"])
+
+
+def test_summary_sample(workbook):
+    converter = TableConverter(workbook, "xlsx", sample_rows=1)
+    list(converter.iter_chunks())
+    assert converter.sample_text().splitlines()[:4] == [
+        "Sheet Sales: 2 rows, 3 columns",
+        "| Product | Amount | column_3 |",
+        "| --- | --- | --- |",
+        "| Pen | 2 |  |",
+    ]
+
+
+def test_cell_values():
+    assert cell_value(datetime.datetime(2024, 5, 1)) == "2024-05-01"
+    assert cell_value(datetime.datetime(2024, 5, 1, 8, 30)) == "2024-05-01T08:30:00"
+    assert cell_value(3.0) == 3
+    assert cell_value(" text ") == "text"
+    assert markdown_cell(True) == "true"
+    assert markdown_cell(None) == ""
+
+
+def test_column_names():
+    assert column_names(["a", "a", None, ""], 5) == ["a", "a_2", "column_3", "column_4", "column_5"]
+
+
+def test_read_table_options(monkeypatch):
+    for name in ("TABULAR_MAX_ROWS", "TABULAR_MAX_COLUMNS", "TABULAR_FORMAT"):
+        monkeypatch.delenv(name, raising=False)
+    assert read_table_options({"sheets": " Sales , 2 ", "max_rows": "10", "table_format": "JSONL"}) == {
+        "sheets": ["Sales", "2"],
+        "table_format": "jsonl",
+        "max_rows": 10,
+        "max_columns": None,
+    }
+    for args in ({"max_rows": "0"}, {"max_columns": "x"}, {"table_format": "html"}):
+        with pytest.raises(TableOptionsError):
+            read_table_options(args)
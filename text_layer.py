@@ -0,0 +1,154 @@
+"""
+Camada de texto de PDFs para o Leitor Doc PyZerox
+Muitos PDFs já nascem digitais: o texto de suas páginas pode ser extraído localmente, sem renderizar a
+página nem chamar um modelo de visão. Este módulo classifica cada página pela quantidade de texto
+extraível, pelas fontes declaradas, pela qualidade do texto extraído e pela área ocupada por imagens.
+Páginas com uma boa camada de texto seguem a rota "text"; páginas escaneadas ou dominadas por imagens
+seguem a rota "ocr".
+"""
+import os
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+from startup import lazy_import
+
+# Limites da classificação (ajustáveis por variáveis de ambiente)
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", "200"))
+TEXT_LAYER_MAX_IMAGE_AREA = float(os.getenv("TEXT_LAYER_MAX_IMAGE_AREA", "0.5"))
+TEXT_LAYER_MIN_QUALITY = float(os.getenv("TEXT_LAYER_MIN_QUALITY", "0.85"))
+
+# Prompt usado na limpeza opcional do texto extraído por um modelo somente texto
+TEXT_CLEANUP_PROMPT = (
+    "The following text was extracted from the text layer of a PDF page. Reformat it as markdown, "
+    "restoring headings, lists and tables where the layout implies them. Fix broken line wraps and "
+    "hyphenation, but do not add, remove or rephrase any content. Return only the markdown."
+)
+
+# Caracteres que indicam fontes sem mapeamento para Unicode (texto extraído ilegível)
+_GARBAGE = re.compile(r"\(cid:\d+\)|[�\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _image_names(resources: Any, depth: int = 0) -> Set[str]:
+    """Nomes das imagens declaradas nos recursos da página (e de formulários aninhados)"""
+    names: Set[str] = set()
+    try:
+        xobjects = resources["/XObject"].get_object()
+    except (KeyError, TypeError, AttributeError):
+        return names
+    for name, ref in xobjects.items():
+        try:
+            xobject = ref.get_object()
+            if xobject.get("/Subtype") == "/Image":
+                names.add(name)
+            elif depth < 2 and "/Resources" in xobject:
+                names |= _image_names(xobject["/Resources"], depth + 1)
+        except Exception:
+            continue
+    return names
+
+
+def _font_count(resources: Any) -> int:
+    try:
+        return len(resources["/Font"].get_object())
+    except (KeyError, TypeError, AttributeError):
+        return 0
+
+
+def text_quality(text: str) -> float:
+    """Fração dos caracteres (sem espaços) que não são lixo de fontes sem mapeamento"""
+    stripped = re.sub(r"\s+", "", text)
+    if not stripped:
+        return 0.0
+    garbage = sum(len(match) for match in _GARBAGE.findall(stripped))
+    return max(0.0, 1 - garbage / len(stripped))
+
+
+def classify_page(page: Any) -> Dict[str, Any]:
+    """
+    Extrai o texto de uma página e mede sua camada de texto
+
+    A área de imagens é calculada a partir da matriz de transformação vigente em cada operador `Do`
+    que desenha uma imagem (a imagem ocupa o quadrado unitário transformado por essa matriz).
+
+    Returns:
+        Dicionário com `route` ("text" ou "ocr"), `text`, `chars`, `fonts`, `quality` e `image_area`
+        (fração da página coberta por imagens)
+    """
+    resources = page.get("/Resources") or {}
+    try:
+        resources = resources.get_object()
+    except AttributeError:
+        pass
+    images = _image_names(resources)
+    image_area = 0.0
+
+    def visit(operator: bytes, operands: List[Any], cm: List[float], tm: List[float]) -> None:
+        nonlocal image_area
+        if operator == b"Do" and operands and operands[0] in images:
+            image_area += abs(cm[0] * cm[3] - cm[1] * cm[2])
+
+    try:
+        text = page.extract_text(visitor_operand_before=visit) or ""
+    except Exception as e:
+        print(f"Erro ao extrair texto da página: {str(e)}")
+        text = ""
+
+    box = page.mediabox
+    page_area = abs(float(box.width) * float(box.height)) or 1.0
+    coverage = min(image_area / page_area, 1.0)
+    chars = len(re.sub(r"\s+", "", text))
+    fonts = _font_count(resources)
+    quality = text_quality(text)
+
+    has_text_layer = (
+        chars >= TEXT_LAYER_MIN_CHARS
+        and fonts > 0
+        and quality >= TEXT_LAYER_MIN_QUALITY
+        and coverage <= TEXT_LAYER_MAX_IMAGE_AREA
+    )
+    return {
+        "route": "text" if has_text_layer else "ocr",
+        "text": text,
+        "chars": chars,
+        "fonts": fonts,
+        "quality": round(quality, 3),
+        "image_area": round(coverage, 3),
+    }
+
+
+def classify_pdf_pages(pdf_path: str, pages: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+    """
+    Classifica as páginas de um PDF (operação bloqueante; rode no pool de threads)
+
+    Args:
+        pdf_path: Caminho do PDF
+        pages: Páginas a classificar, numeradas a partir de 1 (padrão: todas)
+
+    Returns:
+        Lista com o resultado de `classify_page` para cada página, com `page` numerada a partir de 1
+    """
+    result = []
+    with open(pdf_path, "rb") as pdf_file:
+        reader = lazy_import("PyPDF2").PdfReader(pdf_file)
+        for index in pages if pages is not None else range(1, len(reader.pages) + 1):
+            result.append({"page": index, **classify_page(reader.pages[index - 1])})
+    return result
+
+
+def iter_page_texts(pdf_path: str, pages: Optional[Iterable[int]] = None) -> Iterator[str]:
+    """
+    Extrai o texto de cada página do PDF (ou das páginas em `pages`), sob demanda (operação bloqueante)
+
+    Só a página atual fica em memória, então documentos longos podem ser processados em trechos
+    sem montar o texto inteiro.
+    """
+    with open(pdf_path, "rb") as pdf_file:
+        reader = lazy_import("PyPDF2").PdfReader(pdf_file)
+        for index in pages if pages is not None else range(1, len(reader.pages) + 1):
+            yield reader.pages[index - 1].extract_text() or ""
+
+
+def text_to_markdown(text: str) -> str:
+    """Normaliza o texto extraído: remove espaços à direita e linhas em branco repetidas"""
+    lines = [line.rstrip() for line in text.splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
@@ -0,0 +1,38 @@
+"""
+Modelo de visão usado pelo OCR do Leitor Doc PyZerox
+Fica em um módulo próprio porque o zerox importa o litellm, que leva segundos para carregar: o ocr.py
+só importa este módulo quando a primeira página de um worker é enviada ao modelo.
+"""
+import asyncio
+from typing import Any, Dict, List
+
+from images import load_image
+from startup import lazy_import
+
+litellmmodel = lazy_import("pyzerox.models").litellmmodel
+
+
+class VisionModel(litellmmodel):
+    """
+    `litellmmodel` que envia a imagem preparada pelo cache de imagens do worker
+
+    O zerox lê e codifica o arquivo a cada chamada e sempre declara PNG; aqui a imagem é lida e
+    codificada uma única vez (novas tentativas e hedging reaproveitam o base64) e vai com o tipo real.
+    """
+
+    def __init__(self, model: str, ai_provider: str = "", **kwargs: Any):
+        super().__init__(model=model, ai_provider=ai_provider, **kwargs)
+        self.image_provider = ai_provider
+
+    async def _prepare_messages(self, image_path: str, maintain_format: bool, prior_page: str) -> List[Dict[str, Any]]:
+        image = await asyncio.to_thread(load_image, image_path, self.image_provider)
+        messages: List[Dict[str, Any]] = [{"role": "system", "content": self.system_prompt}]
+        if maintain_format and prior_page:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": f'Markdown must maintain consistent formatting with the following page: \n\n """{prior_page}"""',
+                }
+            )
+        messages.append({"role": "user", "content": [{"type": "image_url", "image_url": {"url": image.data_url}}]})
+        return messages
@@ -0,0 +1,211 @@
+"""
+Diretórios de trabalho por requisição para o Leitor Doc PyZerox
+Cada conversão recebe um diretório próprio em `uploads/work` para o arquivo enviado, as imagens
+renderizadas e a saída do OCR, de modo que requisições simultâneas (em workers ou threads diferentes)
+nunca compartilhem arquivos. O gerenciador também limita quantos diretórios existem ao mesmo tempo
+e quanto espaço eles ocupam; os arquivos dos jobs assíncronos à espera na fila também ficam aqui e
+contam nos mesmos limites.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import BinaryIO, Optional, Tuple
+
+
+class WorkspaceLimitError(Exception):
+    """Levantada quando não há espaço ou vagas para um novo diretório de trabalho"""
+
+
+class UploadTooLargeError(Exception):
+    """Levantada quando o arquivo enviado passa do tamanho máximo permitido"""
+
+
+def copy_stream(
+    stream: BinaryIO,
+    path: str,
+    max_bytes: Optional[int] = None,
+    chunk_size: int = 1024 * 1024,
+) -> Tuple[int, str]:
+    """
+    Grava um stream em disco em blocos, calculando o SHA-256 durante a cópia
+
+    Apenas um bloco fica em memória por vez, qualquer que seja o tamanho do arquivo.
+
+    Args:
+        stream: Stream de origem (por exemplo, o corpo da requisição)
+        path: Arquivo de destino
+        max_bytes: Tamanho máximo aceito; verificado durante a leitura
+        chunk_size: Tamanho de cada bloco lido
+
+    Returns:
+        Tupla (bytes gravados, SHA-256 em hexadecimal)
+
+    Raises:
+        UploadTooLargeError: Se o stream passar de `max_bytes` (o arquivo parcial é removido)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLargeError(f"Arquivo maior que o limite de {max_bytes // (1024 * 1024)} MB")
+                digest.update(chunk)
+                f.write(chunk)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return size, digest.hexdigest()
+
+
+class Workspace:
+    """Diretório de trabalho de uma única conversão"""
+
+    def __init__(self, path: str, keep: str = "never"):
+        self.path = path
+        self.keep = keep
+        self.failed = False
+        self._closed = False
+
+    def file_path(self, name: str) -> str:
+        """Caminho de um arquivo dentro do diretório de trabalho"""
+        return os.path.join(self.path, name)
+
+    def cleanup(self) -> None:
+        """Remove o diretório, a menos que a política de depuração peça para mantê-lo"""
+        if self._closed:
+            return
+        self._closed = True
+        if self.keep == "always" or (self.keep == "on_error" and self.failed):
+            print(f"Diretório de trabalho mantido para depuração: {self.path}")
+            return
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self) -> "Workspace":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.failed = True
+        self.cleanup()
+
+
+class WorkspaceManager:
+    """Cria diretórios de trabalho únicos, respeitando limites de quantidade e espaço em disco"""
+
+    def __init__(
+        self,
+        root: str,
+        max_count: int = 64,
+        max_bytes: int = 2 * 1024 * 1024 * 1024,
+        min_free_bytes: int = 512 * 1024 * 1024,
+        stale_after: int = 86400,
+        keep: str = "never",
+        usage_ttl: float = 5.0,
+    ):
+        self.root = root
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.stale_after = stale_after
+        self.keep = keep
+        self.usage_ttl = usage_ttl
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        # Espaço ocupado pelos diretórios: medido a cada `usage_ttl` segundos e, entre as medições,
+        # somado do que foi admitido neste processo
+        self._used = 0
+        self._measured_at = 0.0
+        os.makedirs(root, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "WorkspaceManager":
+        """Cria o gerenciador a partir das variáveis de ambiente `WORKSPACE_*`"""
+        return cls(
+            root=os.getenv("WORKSPACE_DIR", os.path.join("uploads", "work")),
+            max_count=int(os.getenv("WORKSPACE_MAX_COUNT", "64")),
+            max_bytes=int(os.getenv("WORKSPACE_MAX_MB", "2048")) * 1024 * 1024,
+            min_free_bytes=int(os.getenv("WORKSPACE_MIN_FREE_MB", "512")) * 1024 * 1024,
+            stale_after=int(os.getenv("WORKSPACE_STALE_SECONDS", "86400")),
+            keep=os.getenv("WORKSPACE_KEEP", "never").lower(),
+            usage_ttl=float(os.getenv("WORKSPACE_USAGE_TTL", "5")),
+        )
+
+    def create(self, expected_bytes: int = 0, name: Optional[str] = None) -> Workspace:
+        """
+        Cria um diretório de trabalho exclusivo
+
+        Args:
+            expected_bytes: Tamanho aproximado que a conversão vai gravar (por exemplo, o do upload)
+            name: Nome fixo do diretório (por exemplo, o de um job); sem ele, um nome único é gerado
+
+        Raises:
+            WorkspaceLimitError: Se o limite de diretórios ou de espaço seria ultrapassado
+        """
+        with self._lock:
+            now = time.time()
+            # Remove restos de workers que morreram (ou diretórios mantidos para depuração) de tempos em tempos
+            if now - self._last_sweep > 60:
+                self._last_sweep = now
+                self._remove_stale(now)
+
+            entries = [entry for entry in os.scandir(self.root) if entry.is_dir()]
+            if len(entries) >= self.max_count:
+                raise WorkspaceLimitError(
+                    f"Limite de {self.max_count} conversões simultâneas atingido. Tente novamente em instantes."
+                )
+
+            # Percorrer todos os arquivos a cada requisição custaria O(arquivos) com a trava presa
+            if now - self._measured_at > self.usage_ttl:
+                self._used = sum(self._dir_size(entry.path) for entry in entries)
+                self._measured_at = now
+            if self._used + expected_bytes > self.max_bytes:
+                raise WorkspaceLimitError("Limite de espaço para arquivos temporários atingido. Tente novamente em instantes.")
+
+            self.check_free_space(expected_bytes)
+
+            if name is None:
+                path = tempfile.mkdtemp(prefix=f"{int(now)}-{os.getpid()}-", dir=self.root)
+            else:
+                path = os.path.join(self.root, name)
+                os.makedirs(path)
+            self._used += expected_bytes
+        return Workspace(path, keep=self.keep)
+
+    def check_free_space(self, expected_bytes: int = 0) -> None:
+        """
+        Verifica se ainda sobra o espaço mínimo em disco depois de gravar `expected_bytes`
+
+        Raises:
+            WorkspaceLimitError: Se o espaço livre ficaria abaixo do mínimo configurado
+        """
+        free = shutil.disk_usage(self.root).free
+        if free - expected_bytes < self.min_free_bytes:
+            raise WorkspaceLimitError("Espaço em disco insuficiente para processar o arquivo.")
+
+    def _remove_stale(self, now: float) -> None:
+        for entry in os.scandir(self.root):
+            try:
+                if entry.is_dir() and entry.stat().st_mtime + self.stale_after < now:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                continue
+
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        total = 0
+        for root, _, names in os.walk(path):
+            for name in names:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    continue
+        return total